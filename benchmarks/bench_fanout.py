@@ -0,0 +1,63 @@
+"""Compare nested person/genre to movies scan with consolidated one query scan.
+
+Runs both scans of the same schema from the beginning of time against database configured
+by pg_* environment variables and prints number of round trips, loaded film rows and wall time.
+
+Usage:
+    python benchmarks/bench_fanout.py [person|genre] [page_size]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "postgres_to_es"))
+
+from db import DBConnector  # noqa: E402
+from producer import BaseProducer, schemas  # noqa: E402
+from settings import ConnectorSettings, PosgressSettings  # noqa: E402
+from state import BaseStorage, State  # noqa: E402
+
+
+class MemoryStorage(BaseStorage):
+
+    def save_state(self, state: dict) -> None:
+        pass
+
+    def retrieve_state(self) -> dict:
+        return {}
+
+
+class CountingConnector(DBConnector):
+    """Connector counting queries sent to database."""
+
+    round_trips = 0
+
+    def load_data(self, sql, params=None):
+        self.round_trips += 1
+        return super().load_data(sql, params)
+
+
+def run(key: str, page_size: int, consolidated: bool) -> dict:
+    connector = CountingConnector(PosgressSettings(), ConnectorSettings(pool_enabled=True))
+    schema = schemas[key](tracked_id=key, related_id="{0}_related".format(key))
+    producer = BaseProducer(connector, State(MemoryStorage()), schema, page_size=page_size, consolidated=consolidated)
+    rows = 0
+    started = time.perf_counter()
+    for batch in producer.get_results():
+        rows += sum(1 for _ in batch.data)
+        producer.commit(batch)
+    elapsed = time.perf_counter() - started
+    connector.close()
+    return {"round_trips": connector.round_trips, "rows": rows, "seconds": round(elapsed, 3)}
+
+
+def main() -> None:
+    key = sys.argv[1] if len(sys.argv) > 1 else "person"
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    for consolidated in (False, True):
+        result = run(key, page_size, consolidated)
+        print("{0:<12} {1}".format("consolidated" if consolidated else "nested", result))
+
+
+if __name__ == "__main__":
+    main()
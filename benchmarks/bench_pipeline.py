@@ -0,0 +1,269 @@
+"""Measure throughput and freshness of producers, transformation and loading working together.
+
+Database is configured by pg_* environment variables and should be filled by generate_content.py.
+Elasticsearch is replaced by in-process bulk sink, pipeline options are taken from etl_* variables
+the same way loader takes them, so runs with different options can be compared.
+
+Scenarios:
+    initial     load everything from empty state, freshness is time from start to document arrival
+    trickle     update random films at steady rate while loader runs
+    hot-person  rename the person with the largest filmography and wait for all its films
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scenarios initial,trickle,hot-person] [--output result.json]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "postgres_to_es"))
+
+from db import DBConnector  # noqa: E402
+from elk import ELKLoader  # noqa: E402
+from es_sink import BulkSink, start_sink  # noqa: E402
+from generate_content import synthetic_id  # noqa: E402
+from load_data_to_es import build_pipeline, build_producers  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from settings import ConnectorSettings, ElkSettings, EtlSettings, PosgressSettings  # noqa: E402
+from state import BaseStorage, State  # noqa: E402
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "postgres_to_es", "indexs")
+
+SQL_TOUCH_FILM = """
+UPDATE content.film_work SET title = %(title)s, modified = now() WHERE id = %(id)s::uuid;
+"""
+
+SQL_TOUCH_PERSON = """
+UPDATE content.person SET full_name = %(full_name)s, modified = now() WHERE id = %(id)s::uuid;
+"""
+
+SQL_HOT_PERSON = """
+SELECT person_id, count(*) AS films
+FROM content.person_film_work
+GROUP BY person_id
+ORDER BY films DESC
+LIMIT 1;
+"""
+
+SQL_PERSON_FILMS = """
+SELECT DISTINCT film_work_id FROM content.person_film_work WHERE person_id = %(id)s::uuid;
+"""
+
+SQL_COUNT_FILMS = """
+SELECT count(*) FROM content.film_work;
+"""
+
+
+class MemoryStorage(BaseStorage):
+
+    def __init__(self) -> None:
+        self.state = {}
+
+    def save_state(self, state: dict) -> None:
+        self.state = state
+
+    def retrieve_state(self) -> dict:
+        return dict(self.state)
+
+
+def percentile(values: list[float], share: float) -> float:
+    """Get percentile by nearest rank.
+
+    Args:
+        values: list[float] measured values
+        share: float percentile from 0 to 1
+
+    Returns:
+        float: value, 0 if there are no values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def peak_rss_mb() -> float:
+    """Get peak resident memory of the process.
+
+    Returns:
+        float: megabytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Bench:
+    """Loader wired the same way as load_data_to_es.main, but with in-memory state and bulk sink."""
+
+    def __init__(self, sink: BulkSink, port: int, idle_sleep: float = 0.1) -> None:
+        """Init bench.
+
+        Args:
+            sink: BulkSink receiving documents
+            port: int sink port
+            idle_sleep: float pause between passes without changes
+        """
+        self.sink = sink
+        self.idle_sleep = idle_sleep
+        self.etl_config = EtlSettings()
+        self.connector = DBConnector(PosgressSettings(), ConnectorSettings())
+        self.elk_loader = ELKLoader(ElkSettings(
+            elk_host="127.0.0.1",
+            elk_port=str(port),
+            elk_index=INDEX_DIR,
+            elk_dead_letter_path=os.path.join(tempfile.gettempdir(), "bench_dead_letter.jsonl"),
+        ))
+        self.state = State(MemoryStorage())
+        self.scheduler = Scheduler(
+            build_pipeline(self.elk_loader, self.etl_config),
+            build_producers(self.connector, self.state, self.etl_config),
+            workers=self.etl_config.workers,
+            quantum=self.etl_config.quantum,
+            index_limits=self.etl_config.index_limits,
+        )
+
+    def drain(self) -> int:
+        """Run passes until producers have no more changes.
+
+        Returns:
+            int: number of loaded batches
+        """
+        batches = 0
+        while True:
+            report = self.scheduler.run_pass()
+            loaded = sum(producer_report["batches"] for producer_report in report.values())
+            if not loaded:
+                return batches
+            batches += loaded
+
+    def execute(self, sql: str, params: dict) -> None:
+        self.connector.execute(sql, params)
+
+    def result(self, name: str, started: float, freshness: list[float], missing: int = 0) -> dict:
+        elapsed = time.time() - started
+        return {
+            "scenario": name,
+            "seconds": round(elapsed, 3),
+            "documents": self.sink.documents,
+            "docs_per_second": round(self.sink.documents / elapsed, 1) if elapsed else 0.0,
+            "freshness_p50": round(percentile(freshness, 0.5), 3),
+            "freshness_p99": round(percentile(freshness, 0.99), 3),
+            "not_arrived": missing,
+            "bulk_requests": self.sink.requests,
+            "rejected": self.sink.rejected,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+    def initial(self, args: argparse.Namespace) -> dict:
+        self.sink.reset()
+        started = time.time()
+        self.drain()
+        return self.result("initial", started, [arrived - started for arrived in self.sink.arrivals.values()])
+
+    def trickle(self, args: argparse.Namespace) -> dict:
+        self.drain()
+        films = self.connector.load_data(SQL_COUNT_FILMS)[0][0]
+        updated = {}
+        done = threading.Event()
+
+        def write() -> None:
+            interval = 1 / args.rate
+            deadline = time.time() + args.duration
+            version = 0
+            while time.time() < deadline:
+                version += 1
+                film_id = synthetic_id("film_work", random.randint(1, films))
+                updated_at = time.time()
+                self.execute(SQL_TOUCH_FILM, {"id": film_id, "title": "Film v{0}".format(version)})
+                updated[film_id] = updated_at
+                time.sleep(interval)
+            done.set()
+
+        self.sink.reset()
+        started = time.time()
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        while not done.is_set():
+            if not self.drain():
+                time.sleep(self.idle_sleep)
+        self.drain()
+        return self.freshness("trickle", started, updated)
+
+    def hot_person(self, args: argparse.Namespace) -> dict:
+        self.drain()
+        person_id = str(self.connector.load_data(SQL_HOT_PERSON)[0][0])
+        film_ids = [str(row[0]) for row in self.connector.load_data(SQL_PERSON_FILMS, {"id": person_id})]
+        freshness = []
+        missing = 0
+        self.sink.reset()
+        started = time.time()
+        for number in range(args.rounds):
+            self.sink.arrivals = {}
+            touched = time.time()
+            self.execute(SQL_TOUCH_PERSON, {"id": person_id, "full_name": "Hot person v{0}".format(number)})
+            self.drain()
+            for film_id in film_ids:
+                arrived = self.sink.arrivals.get(film_id)
+                if arrived is None:
+                    missing += 1
+                    continue
+                freshness.append(arrived - touched)
+        result = self.result("hot-person", started, freshness, missing)
+        result["fan_out"] = len(film_ids)
+        return result
+
+    def freshness(self, name: str, started: float, updated: dict[str, float]) -> dict:
+        freshness = []
+        missing = 0
+        for doc_id, updated_at in updated.items():
+            arrived = self.sink.arrivals.get(doc_id)
+            if arrived is None or arrived < updated_at:
+                missing += 1
+                continue
+            freshness.append(arrived - updated_at)
+        return self.result(name, started, freshness, missing)
+
+    def close(self) -> None:
+        self.scheduler.close()
+        self.elk_loader.close()
+        self.connector.close()
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="initial,trickle,hot-person")
+    parser.add_argument("--rate", type=float, default=50, help="film updates per second in trickle")
+    parser.add_argument("--duration", type=float, default=30, help="trickle seconds")
+    parser.add_argument("--rounds", type=int, default=5, help="hot person renames")
+    parser.add_argument("--sink-latency", type=float, default=0.0, help="seconds added to every bulk response")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="share of documents rejected with 429")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="", help="append results as JSON lines to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> None:
+    args = parse_args(argv)
+    random.seed(args.seed)
+    server, sink = start_sink(sink=BulkSink(latency=args.sink_latency, reject_rate=args.reject_rate))
+    bench = Bench(sink, server.server_address[1])
+    scenarios = {"initial": bench.initial, "trickle": bench.trickle, "hot-person": bench.hot_person}
+    try:
+        for name in args.scenarios.split(","):
+            result = scenarios[name.strip()](args)
+            print(json.dumps(result))
+            if args.output:
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+    finally:
+        bench.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
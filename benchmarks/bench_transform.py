@@ -0,0 +1,67 @@
+"""Measure transform_movies time on films with large casts.
+
+Builds rows the way SQL_GET_FILMs returns them, persons x genres x subscriptions per film,
+and prints transform time per film and per person link for growing cast sizes.
+Time per link stays flat when nested items dedup is O(1).
+
+Usage:
+    python benchmarks/bench_transform.py [films] [genres] [subscriptions]
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "postgres_to_es"))
+
+from transformator import transform_movies  # noqa: E402
+
+ROLES = ("actor", "director", "writer")
+CAST_SIZES = (100, 500, 1000, 2000, 4000)
+
+
+def film_rows(cast_size: int, genres: int, subscriptions: int) -> list[dict]:
+    film_id = str(uuid.uuid4())
+    genre_ids = [str(uuid.uuid4()) for _ in range(genres)]
+    subscription_ids = [str(uuid.uuid4()) for _ in range(subscriptions)]
+    rows = []
+    for person in range(cast_size):
+        person_id = str(uuid.uuid4())
+        for genre_id in genre_ids:
+            for subscription_id in subscription_ids:
+                rows.append({
+                    "fw_id": film_id,
+                    "title": "title",
+                    "description": "description",
+                    "rating": 7.5,
+                    "role": ROLES[person % len(ROLES)],
+                    "id": person_id,
+                    "full_name": "person {0}".format(person),
+                    "genre_id": genre_id,
+                    "genre_name": "genre",
+                    "subscription_id": subscription_id,
+                    "subscription_name": "subscription",
+                })
+    return rows
+
+
+def main() -> None:
+    films = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    genres = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    subscriptions = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    print("{0:>6} {1:>10} {2:>14} {3:>14}".format("cast", "rows", "ms per film", "us per link"))
+    for cast_size in CAST_SIZES:
+        rows = [row for _ in range(films) for row in film_rows(cast_size, genres, subscriptions)]
+        started = time.perf_counter()
+        transform_movies(rows)
+        elapsed = time.perf_counter() - started
+        print("{0:>6} {1:>10} {2:>14.2f} {3:>14.2f}".format(
+            cast_size,
+            len(rows),
+            elapsed / films * 1000,
+            elapsed / (films * cast_size) * 1000000,
+        ))
+
+
+if __name__ == "__main__":
+    main()
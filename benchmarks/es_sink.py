@@ -0,0 +1,167 @@
+"""Minimal Elasticsearch imitation accepting bulk requests and remembering when every document arrived.
+
+Only requests ELKLoader sends are answered: product check, index creation and _bulk. Sink can add
+latency to bulk responses and reject a share of documents with 429 to imitate back-pressure.
+
+Usage as standalone server:
+    python benchmarks/es_sink.py [port]
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+INFO = {
+    "name": "es-sink",
+    "cluster_name": "benchmark",
+    "version": {"number": "8.1.0", "build_flavor": "default", "lucene_version": "9.0.0"},
+    "tagline": "You Know, for Search",
+}
+
+
+class BulkSink:
+    """Counters and arrival times of received documents."""
+
+    def __init__(self, latency: float = 0.0, reject_rate: float = 0.0) -> None:
+        """Init sink.
+
+        Args:
+            latency: float seconds added to every bulk response
+            reject_rate: float share of documents rejected with 429
+        """
+        self.latency = latency
+        self.reject_rate = reject_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.documents = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.arrivals: dict[str, float] = {}
+
+    def reset(self) -> None:
+        """Forget received documents."""
+        with self.lock:
+            self.requests = self.documents = self.rejected = self.bytes = 0
+            self.arrivals = {}
+
+    def bulk(self, body: bytes) -> dict:
+        """Accept bulk request body.
+
+        Args:
+            body: bytes NDJSON bulk body
+
+        Returns:
+            dict: bulk response
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        items = []
+        lines = iter(body.splitlines())
+        arrived = time.time()
+        for line in lines:
+            if not line.strip():
+                continue
+            op_type, meta = next(iter(json.loads(line).items()))
+            if op_type != "delete":
+                next(lines, None)
+            status = 429 if self.reject_rate and random.random() < self.reject_rate else 201
+            item = {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": status}
+            if status == 429:
+                item["error"] = {"type": "es_rejected_execution_exception", "reason": "sink rejected"}
+            items.append({op_type: item})
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(body)
+            for item in items:
+                info = next(iter(item.values()))
+                if info["status"] == 429:
+                    self.rejected += 1
+                    continue
+                self.documents += 1
+                self.arrivals[info["_id"]] = arrived
+        return {"took": 1, "errors": any("error" in next(iter(item.values())) for item in items), "items": items}
+
+
+def make_handler(sink: BulkSink) -> type:
+    """Get request handler bound to sink.
+
+    Args:
+        sink: BulkSink storage of received documents
+
+    Returns:
+        type: BaseHTTPRequestHandler subclass
+    """
+
+    class SinkHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self) -> None:  # noqa: N802
+            self.reply({})
+
+        def do_GET(self) -> None:  # noqa: N802
+            self.reply(INFO if self.path.split("?")[0] in ("", "/") else {})
+
+        def do_PUT(self) -> None:  # noqa: N802
+            self.read_body()
+            self.reply({"acknowledged": True, "index": self.path.strip("/").split("/")[0]})
+
+        def do_POST(self) -> None:  # noqa: N802
+            body = self.read_body()
+            if self.path.split("?")[0].endswith("/_bulk"):
+                self.reply(sink.bulk(body))
+                return
+            self.reply({"acknowledged": True})
+
+        def do_DELETE(self) -> None:  # noqa: N802
+            self.reply({"acknowledged": True})
+
+        def read_body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def reply(self, payload: dict) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("X-Elastic-Product", "Elasticsearch")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return SinkHandler
+
+
+def start_sink(port: int = 0, sink: Optional[BulkSink] = None) -> tuple[ThreadingHTTPServer, BulkSink]:
+    """Serve sink in background thread.
+
+    Args:
+        port: int port to listen on, free port is picked if 0
+        sink: Optional[BulkSink] sink to serve, new one is created if missing
+
+    Returns:
+        tuple[ThreadingHTTPServer, BulkSink]: running server and its sink
+    """
+    sink = sink or BulkSink()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(sink))
+    threading.Thread(target=server.serve_forever, name="es-sink", daemon=True).start()
+    return server, sink
+
+
+if __name__ == "__main__":
+    server, sink = start_sink(int(sys.argv[1]) if len(sys.argv) > 1 else 9200)
+    print("es sink listening on {0}:{1}".format(*server.server_address))
+    try:
+        while True:
+            time.sleep(5)
+            print("requests={0} documents={1} rejected={2} bytes={3}".format(
+                sink.requests, sink.documents, sink.rejected, sink.bytes,
+            ))
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,256 @@
+"""Fill content schema of database configured by pg_* environment variables with synthetic data.
+
+Ids are md5 of "<table>-<number>", so the same scale and seed always give the same data and
+benchmarks can address rows by number. Films get cast from skewed distributions: a few films
+have very large cast and a few persons play in a very large number of films.
+
+Usage:
+    python benchmarks/generate_content.py --films 1000000 --persons 300000 --links 5000000 [--drop]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "postgres_to_es"))
+
+from db import DBConnector  # noqa: E402
+from settings import PosgressSettings  # noqa: E402
+
+SQL_DROP_SCHEMA = """
+DROP SCHEMA IF EXISTS content CASCADE;
+"""
+
+SQL_CREATE_SCHEMA = """
+CREATE SCHEMA IF NOT EXISTS content;
+CREATE TABLE IF NOT EXISTS content.film_work (
+    id uuid PRIMARY KEY,
+    title text NOT NULL,
+    description text,
+    creation_date date,
+    rating float,
+    type text NOT NULL,
+    created timestamptz NOT NULL DEFAULT now(),
+    modified timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS content.person (
+    id uuid PRIMARY KEY,
+    full_name text NOT NULL,
+    created timestamptz NOT NULL DEFAULT now(),
+    modified timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS content.genre (
+    id uuid PRIMARY KEY,
+    name text NOT NULL,
+    description text,
+    created timestamptz NOT NULL DEFAULT now(),
+    modified timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS content.subscription (
+    id uuid PRIMARY KEY,
+    name text NOT NULL,
+    created timestamptz NOT NULL DEFAULT now(),
+    modified timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS content.person_film_work (
+    id uuid PRIMARY KEY,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    person_id uuid NOT NULL REFERENCES content.person (id) ON DELETE CASCADE,
+    role text NOT NULL,
+    created timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (film_work_id, person_id, role)
+);
+CREATE TABLE IF NOT EXISTS content.genre_film_work (
+    id uuid PRIMARY KEY,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    genre_id uuid NOT NULL REFERENCES content.genre (id) ON DELETE CASCADE,
+    created timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (film_work_id, genre_id)
+);
+CREATE TABLE IF NOT EXISTS content.subscription_film_work (
+    id uuid PRIMARY KEY,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    subscription_id uuid NOT NULL REFERENCES content.subscription (id) ON DELETE CASCADE,
+    created timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (film_work_id, subscription_id)
+);
+CREATE INDEX IF NOT EXISTS film_work_modified_id_idx ON content.film_work (modified, id);
+CREATE INDEX IF NOT EXISTS person_modified_id_idx ON content.person (modified, id);
+CREATE INDEX IF NOT EXISTS genre_modified_id_idx ON content.genre (modified, id);
+CREATE INDEX IF NOT EXISTS person_film_work_person_idx ON content.person_film_work (person_id);
+CREATE INDEX IF NOT EXISTS genre_film_work_genre_idx ON content.genre_film_work (genre_id);
+"""
+
+SQL_FILL_FILMS = """
+INSERT INTO content.film_work (id, title, description, rating, type, created, modified)
+SELECT
+    md5('film_work-' || n)::uuid,
+    'Film ' || n,
+    'Synthetic description of film number ' || n,
+    round((random() * 10)::numeric, 1),
+    CASE WHEN n %% 5 = 0 THEN 'tv_show' ELSE 'movie' END,
+    ts,
+    ts
+FROM (
+    SELECT n, now() - random() * interval '3650 days' AS ts
+    FROM generate_series(%(start)s, %(end)s) n
+) films
+ON CONFLICT DO NOTHING;
+"""
+
+SQL_FILL_PERSONS = """
+INSERT INTO content.person (id, full_name, created, modified)
+SELECT md5('person-' || n)::uuid, 'Person ' || n, ts, ts
+FROM (
+    SELECT n, now() - random() * interval '3650 days' AS ts
+    FROM generate_series(%(start)s, %(end)s) n
+) persons
+ON CONFLICT DO NOTHING;
+"""
+
+SQL_FILL_GENRES = """
+INSERT INTO content.genre (id, name, description, created, modified)
+SELECT md5('genre-' || n)::uuid, 'Genre ' || n, 'Synthetic genre ' || n, now(), now()
+FROM generate_series(%(start)s, %(end)s) n
+ON CONFLICT DO NOTHING;
+"""
+
+SQL_FILL_SUBSCRIPTIONS = """
+INSERT INTO content.subscription (id, name, created, modified)
+SELECT md5('subscription-' || n)::uuid, 'Subscription ' || n, now(), now()
+FROM generate_series(%(start)s, %(end)s) n
+ON CONFLICT DO NOTHING;
+"""
+
+SQL_FILL_PERSON_LINKS = """
+INSERT INTO content.person_film_work (id, film_work_id, person_id, role, created)
+SELECT
+    md5('person_film_work-' || n)::uuid,
+    md5('film_work-' || (1 + floor(%(films)s * power(random(), %(cast_skew)s)))::bigint)::uuid,
+    md5('person-' || (1 + floor(%(persons)s * power(random(), %(person_skew)s)))::bigint)::uuid,
+    (ARRAY['actor', 'actor', 'actor', 'director', 'writer'])[1 + n %% 5],
+    now()
+FROM generate_series(%(start)s, %(end)s) n
+ON CONFLICT DO NOTHING;
+"""
+
+SQL_FILL_GENRE_LINKS = """
+INSERT INTO content.genre_film_work (id, film_work_id, genre_id, created)
+SELECT
+    md5('genre_film_work-' || n || '-' || k)::uuid,
+    md5('film_work-' || n)::uuid,
+    md5('genre-' || (1 + floor(%(genres)s * power(random(), 2)))::bigint)::uuid,
+    now()
+FROM generate_series(%(start)s, %(end)s) n
+CROSS JOIN LATERAL generate_series(1, 1 + n %% 3) k
+ON CONFLICT DO NOTHING;
+"""
+
+SQL_FILL_SUBSCRIPTION_LINKS = """
+INSERT INTO content.subscription_film_work (id, film_work_id, subscription_id, created)
+SELECT
+    md5('subscription_film_work-' || n)::uuid,
+    md5('film_work-' || n)::uuid,
+    md5('subscription-' || (1 + n %% %(subscriptions)s))::uuid,
+    now()
+FROM generate_series(%(start)s, %(end)s) n
+WHERE n %% 10 = 0
+ON CONFLICT DO NOTHING;
+"""
+
+
+def synthetic_id(table: str, number: int) -> str:
+    """Get id of generated row.
+
+    Args:
+        table: str table name
+        number: int row number starting from 1
+
+    Returns:
+        str: uuid of row
+    """
+    return str(uuid.UUID(hashlib.md5("{0}-{1}".format(table, number).encode()).hexdigest()))
+
+
+def fill(cursor, sql: str, total: int, chunk: int, name: str, **params) -> None:
+    """Run insert for numbers from 1 to total by chunks.
+
+    Args:
+        cursor: database cursor
+        sql: str insert with start and end parameters
+        total: int number of rows
+        chunk: int rows in one statement
+        name: str table name for progress output
+        **params: extra statement parameters
+    """
+    started = time.perf_counter()
+    for start in range(1, total + 1, chunk):
+        cursor.execute(sql, {"start": start, "end": min(start + chunk - 1, total), **params})
+        cursor.connection.commit()
+        print("{0:<24} {1:>10} / {2}".format(name, min(start + chunk - 1, total), total), end="\r")
+    print("{0:<24} {1:>10} rows {2:.1f}s".format(name, total, time.perf_counter() - started))
+
+
+def generate(scale: argparse.Namespace) -> None:
+    """Create content schema and fill it.
+
+    Args:
+        scale: argparse.Namespace sizes, skews and seed
+    """
+    conn = DBConnector(PosgressSettings()).get_connection()
+    try:
+        with conn.cursor() as cursor:
+            if scale.drop:
+                cursor.execute(SQL_DROP_SCHEMA)
+            cursor.execute(SQL_CREATE_SCHEMA)
+            cursor.execute("SELECT setseed(%(seed)s);", {"seed": scale.seed})
+            conn.commit()
+            fill(cursor, SQL_FILL_FILMS, scale.films, scale.chunk, "film_work")
+            fill(cursor, SQL_FILL_PERSONS, scale.persons, scale.chunk, "person")
+            fill(cursor, SQL_FILL_GENRES, scale.genres, scale.chunk, "genre")
+            fill(cursor, SQL_FILL_SUBSCRIPTIONS, scale.subscriptions, scale.chunk, "subscription")
+            fill(
+                cursor,
+                SQL_FILL_PERSON_LINKS,
+                scale.links,
+                scale.chunk,
+                "person_film_work",
+                films=scale.films,
+                persons=scale.persons,
+                cast_skew=scale.cast_skew,
+                person_skew=scale.person_skew,
+            )
+            fill(cursor, SQL_FILL_GENRE_LINKS, scale.films, scale.chunk, "genre_film_work", genres=scale.genres)
+            fill(
+                cursor,
+                SQL_FILL_SUBSCRIPTION_LINKS,
+                scale.films,
+                scale.chunk,
+                "subscription_film_work",
+                subscriptions=scale.subscriptions,
+            )
+            cursor.execute("ANALYZE;")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--films", type=int, default=1000000)
+    parser.add_argument("--persons", type=int, default=300000)
+    parser.add_argument("--links", type=int, default=5000000, help="person to film links")
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--subscriptions", type=int, default=3)
+    parser.add_argument("--cast-skew", type=float, default=1.5, help="power > 1 gives few films with huge cast")
+    parser.add_argument("--person-skew", type=float, default=3.0, help="power > 1 gives few very busy persons")
+    parser.add_argument("--seed", type=float, default=0.42)
+    parser.add_argument("--chunk", type=int, default=200000, help="rows inserted by one statement")
+    parser.add_argument("--drop", action="store_true", help="drop content schema first")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    generate(parse_args(sys.argv[1:]))
@@ -0,0 +1,181 @@
+"""Class to work with postgress from asyncio engine."""
+import json
+import logging
+import re
+from datetime import datetime
+from functools import lru_cache, partial
+from typing import Any, Optional
+
+import asyncpg
+
+from db import TEMPLATE_NAMES
+from decorators import async_backoff
+from exceptions import RetryExceptionError
+from metrics import registry
+from settings import ConnectorSettings, PosgressSettings
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+# named parameter, timestamps are bound as text so cursors saved as iso strings keep working
+PLACEHOLDER = re.compile(r"%\((\w+)\)s(::timestamptz(\[\])?)?")
+
+# errors meaning database or connection is not available
+CONNECTION_ERRORS = (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError, asyncpg.CannotConnectNowError)
+
+
+@lru_cache(maxsize=None)
+def to_positional(sql: str) -> tuple[str, tuple[str, ...]]:
+    """Convert query with psycopg2 named parameters to asyncpg positional ones.
+
+    Args:
+        sql: str query with %(name)s parameters
+
+    Returns:
+        tuple[str, tuple[str, ...]]: query with $n parameters and names in positional order
+    """
+    names = tuple(dict.fromkeys(match.group(1) for match in PLACEHOLDER.finditer(sql)))
+    query = PLACEHOLDER.sub(partial(positional_placeholder, names), sql)
+    return query.replace("%%", "%"), names  # noqa: WPS323 escaped percent of psycopg2 query
+
+
+def positional_placeholder(names: tuple[str, ...], match: re.Match) -> str:
+    """Get asyncpg placeholder of named parameter.
+
+    Args:
+        names: tuple[str, ...] parameter names in positional order
+        match: re.Match named parameter with optional timestamp cast
+
+    Returns:
+        str: $n parameter, timestamps are cast from text
+    """
+    name, timestamp, array = match.groups()
+    position = "${0}".format(names.index(name) + 1)
+    if timestamp is None:
+        return position
+    return "{0}::text{1}{2}".format(position, array or "", timestamp)
+
+
+def to_argument(parameter: Any) -> Any:
+    """Convert parameter value to type bound by converted query.
+
+    Args:
+        parameter: Any parameter value
+
+    Returns:
+        Any: timestamps as iso strings, other values unchanged
+    """
+    if isinstance(parameter, datetime):
+        return parameter.isoformat()
+    if isinstance(parameter, list):
+        return [to_argument(element) for element in parameter]
+    return parameter
+
+
+async def init_connection(conn: asyncpg.Connection) -> None:
+    """Make connection return values of the same types as psycopg2 connection.
+
+    Args:
+        conn: asyncpg.Connection new pool connection
+    """
+    await conn.set_type_codec("uuid", encoder=str, decoder=str, schema="pg_catalog", format="text")
+    for json_type in ("json", "jsonb"):
+        await conn.set_type_codec(json_type, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+class AsyncDBConnector:
+    """Class to work with postgress db through pool of asyncpg connections.
+
+    Queries are the same sql templates DBConnector runs, rows support access by index and by column name,
+    uuid columns are returned as strings and json columns are decoded like psycopg2 does.
+    """
+
+    def __init__(self, config: PosgressSettings, connector_config: Optional[ConnectorSettings] = None) -> None:
+        """Init db connect, pool is opened by connect.
+
+        Args:
+            config: PosgressSettings connection configration.
+            connector_config: ConnectorSettings pool sizes, read from environment if not set.
+        """
+        self.config = config.dict()
+        self.connector_config = connector_config or ConnectorSettings()
+        self.pool: Optional[asyncpg.Pool] = None
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def connect(self) -> None:
+        """Open pool of connections.
+
+        Raises:
+            RetryExceptionError: if database is not available.
+        """
+        if self.pool is not None:
+            return
+        try:
+            self.pool = await asyncpg.create_pool(
+                database=self.config["dbname"],
+                user=self.config["user"],
+                password=self.config["password"],
+                host=self.config["host"],
+                port=self.config["port"],
+                min_size=self.connector_config.pool_min_size,
+                max_size=self.connector_config.pool_max_size,
+                init=init_connection,
+            )
+        except CONNECTION_ERRORS:
+            raise RetryExceptionError("Postgress database is not available, retrying...")
+
+    async def close(self) -> None:
+        """Close pooled connections."""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def load_data(
+        self,
+        sql: str,
+        query_params: Optional[dict] = None,
+        template: Optional[str] = None,
+    ) -> list[Any]:
+        """Execute sql query.
+
+        Args:
+            sql: str sql query to execute.
+            query_params: Optional[dict] query parameters.
+            template: Optional[str] metrics label of query instead of its sql template name.
+
+        Returns:
+            list: sql_result
+
+        Raises:
+            RetryExceptionError: if connection is lost.
+        """
+        await self.connect()
+        query, names = to_positional(sql)
+        arguments = [to_argument((query_params or {})[name]) for name in names]
+        try:
+            with registry.timer("etl_query_seconds", {"template": template or TEMPLATE_NAMES.get(sql, "other")}):
+                return await self.pool.fetch(query, *arguments)
+        except CONNECTION_ERRORS:
+            raise RetryExceptionError("Postgress database is not available, retrying...")
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def execute(self, sql: str, query_params: Optional[dict] = None) -> None:
+        """Execute sql statement without result, it is commited right away.
+
+        Args:
+            sql: str sql statement to execute.
+            query_params: Optional[dict] statement parameters.
+
+        Raises:
+            RetryExceptionError: if connection is lost.
+        """
+        await self.connect()
+        query, names = to_positional(sql)
+        try:
+            await self.pool.execute(query, *[to_argument((query_params or {})[name]) for name in names])
+        except CONNECTION_ERRORS:
+            raise RetryExceptionError("Postgress database is not available, retrying...")
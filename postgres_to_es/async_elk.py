@@ -0,0 +1,196 @@
+"""Logic to load data to Elasticsearch from asyncio engine."""
+import asyncio
+import json
+import logging
+import os
+from time import perf_counter
+from typing import Optional, Tuple
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_scan, async_streaming_bulk
+
+from decorators import async_backoff, expo
+from elk import (
+    INDEX_EXISTS,
+    BaseLoader,
+    action_key,
+    collect_result,
+    elasticsearch_available,
+    observe_bulk,
+    retry_delay,
+)
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+
+class AsyncELKLoader(BaseLoader):  # noqa: WPS214 coroutine counterpart of ELKLoader
+    """Class loader data to Elasticsearch with AsyncElasticsearch client.
+
+    Documents, fingerprints and dead letters are handled by BaseLoader the same way as by ELKLoader, methods
+    sending requests are coroutines and fingerprint cache and dead letter file are used from worker threads.
+    Index rebuild helpers are not available, reindex uses ELKLoader.
+    """
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def create_index(self, index_file: str) -> None:
+        """Create required index in Elasticsearch, lost connection is retried.
+
+        Args:
+            index_file: str file with elasticsearch index structure
+        """
+        with open(index_file, "r") as fl:
+            index_description = json.load(fl)
+        with elasticsearch_available():
+            await self.client.options(ignore_status=INDEX_EXISTS).indices.create(
+                index=os.path.basename(index_file).split(".")[0],
+                **index_description,
+            )
+
+    async def create_indexs(self) -> None:
+        """Create index in elasticsearch from index files in index folder, called once after init."""
+        for index_file in os.listdir(self.config.elk_index):
+            await self.create_index(os.path.join(self.config.elk_index, index_file))
+
+    async def load(
+        self,
+        data_to_load: dict,
+        index_name: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+    ) -> None:
+        """Load data to Elasticsearch index.
+
+        Args:
+            data_to_load: dict data to load in Elasticsearch index.
+            index_name: Optional[str] load all documents to this index instead of their own one.
+            chunk_size: Optional[int] number of documents in one request instead of elk_bulk_chunk_size.
+        """
+        fingerprints = []
+        actions = await asyncio.to_thread(list, self.generate_doc(data_to_load, fingerprints, index_name))
+        failed = await self.send(actions, chunk_size)
+        for row in data_to_load.values():
+            if row.op_type == "update_by_query":
+                await self.apply_update_by_query(index_name or row.index_name, row.to_source())
+        await asyncio.to_thread(self.save_fingerprints, data_to_load, fingerprints, failed)
+
+    async def apply_update_by_query(self, index_name: str, body: dict) -> None:
+        """Forget hashes of documents matching query and update them.
+
+        Args:
+            index_name: str index to update
+            body: dict query and script
+        """
+        if self.fingerprints is not None:
+            keys = await self.matched_keys(index_name, body["query"])
+            await asyncio.to_thread(self.fingerprints.forget, keys)
+        await self.update_by_query(index_name, body)
+
+    async def send(self, actions: list[dict], chunk_size: Optional[int] = None) -> set[tuple[str, str]]:  # noqa: WPS210
+        """Send bulk actions, only rejected ones are sent again, see ELKLoader.send.
+
+        Args:
+            actions: list[dict] bulk actions
+            chunk_size: Optional[int] number of documents in one request instead of elk_bulk_chunk_size
+
+        Returns:
+            set[tuple[str, str]]: operation and _id of documents written to dead letter file
+        """
+        delays = expo(0.1, 2, 10)
+        failed = set()
+        for attempt in range(self.config.elk_bulk_max_retries + 1):
+            outcomes = {}
+            retry_after = await self._bulk(actions, outcomes, chunk_size)
+            actions = await asyncio.to_thread(
+                self.settle, actions, outcomes, failed, attempt == self.config.elk_bulk_max_retries,
+            )
+            if not actions:
+                break
+            await asyncio.sleep(retry_delay(actions, delays, retry_after))
+        return failed
+
+    async def replay_dead_letters(self) -> Tuple[int, int]:
+        """Send actions from dead letter file again, failed ones are written to it again.
+
+        Returns:
+            Tuple[int, int]: number of replayed and again failed actions
+        """
+        records = await asyncio.to_thread(self.dead_letters.take)
+        failed = await self.send([record["action"] for record in records]) if records else set()
+        await asyncio.to_thread(self.dead_letters.done)
+        return len(records), len(failed)
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def matched_keys(self, index_name: str, query: dict) -> list[tuple[str, str]]:
+        """Get documents matching query, see ELKLoader.matched_keys.
+
+        Args:
+            index_name: str index to search
+            query: dict query of update by query
+
+        Returns:
+            list[tuple[str, str]]: index name and _id of matching documents
+        """
+        with elasticsearch_available():
+            return [
+                (index_name, hit["_id"])
+                async for hit in async_scan(self.client, index=index_name, query={"query": query}, _source=False)
+            ]
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def update_by_query(self, index_name: str, body: dict) -> None:
+        """Update documents matching query with script, documents changed concurrently are skipped.
+
+        Args:
+            index_name: str index to update
+            body: dict query and script
+        """
+        with elasticsearch_available():
+            await self.client.update_by_query(index=index_name, conflicts="proceed", **body)
+
+    async def close(self) -> None:
+        """Close elasticsearch client and its connections."""
+        await self.client.close()
+        if self.fingerprints is not None:
+            self.fingerprints.close()
+
+    def make_client(self) -> AsyncElasticsearch:
+        """Make elasticsearch client, one client is kept for the whole AsyncELKLoader life.
+
+        Returns:
+            AsyncElasticsearch: client to elasticsearch
+        """
+        return AsyncElasticsearch(
+            hosts="http://{host}:{port}".format(host=self.config.elk_host, port=self.config.elk_port),
+            max_retries=0,
+            connections_per_node=10,
+        )
+
+    @async_backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    async def _bulk(self, actions: list[dict], outcomes: dict, chunk_size: Optional[int] = None) -> Optional[float]:
+        """Send actions without result yet and collect per document results, see ELKLoader._bulk.
+
+        Args:
+            actions: list[dict] bulk actions
+            outcomes: dict status and error by operation and _id, filled in place
+            chunk_size: Optional[int] number of documents in one request instead of elk_bulk_chunk_size
+
+        Returns:
+            Optional[float]: the longest Retry-After seconds of rejected requests
+        """
+        pending = [action for action in actions if action_key(action) not in outcomes]
+        started = perf_counter()
+        stream = async_streaming_bulk(
+            client=self.client,
+            actions=pending,
+            chunk_size=chunk_size or self.config.elk_bulk_chunk_size,
+            max_chunk_bytes=self.config.elk_bulk_max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False,
+        )
+        with elasticsearch_available():
+            retry_afters = [collect_result(outcomes, bulk_item) async for _, bulk_item in stream]
+        observe_bulk(len(pending), perf_counter() - started)
+        return max((delay for delay in retry_afters if delay is not None), default=None)
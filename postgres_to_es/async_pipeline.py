@@ -0,0 +1,210 @@
+"""Extract and load stages of asyncio engine and scheduler running producers as concurrent tasks."""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from contextlib import AsyncExitStack, suppress
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from async_elk import AsyncELKLoader
+from async_producer import AsyncProducer
+from decorators import expo
+from metrics import registry
+from producer import Batch
+from transformator import transform_lists_to_dc
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+STOP = object()
+
+
+class AsyncPipeline:
+    """Run producer and loader as two tasks joined by bounded queue.
+
+    Batches are transformed, loaded and commited in producer order, like in Pipeline. Checkpoints are saved
+    from worker thread, so file and database storages do not block the event loop.
+    """
+
+    def __init__(self, elk_loader: AsyncELKLoader, queue_size: int = 4) -> None:
+        """Init pipeline.
+
+        Args:
+            elk_loader: AsyncELKLoader loader to Elasticsearch
+            queue_size: int maximal number of batches waiting for loader
+        """
+        self.elk_loader = elk_loader
+        self.queue_size = queue_size
+
+    async def run(self, producer: AsyncProducer, max_batches: Optional[int] = None) -> int:
+        """Process producer batches.
+
+        Args:
+            producer: AsyncProducer source of batches
+            max_batches: Optional[int] stop after this number of batches, rest is left for the next run
+
+        Returns:
+            int: number of loaded batches
+
+        Raises:
+            BaseException: first error raised in any stage
+        """
+        extracted = asyncio.Queue(maxsize=self.queue_size)
+        extract = asyncio.create_task(self._extract(producer, extracted, max_batches))
+        try:
+            loaded = await self._load(producer, extracted, extract)
+        except BaseException:  # noqa: WPS424 cancelled run stops extract and drops fetched progress too
+            extract.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await extract
+            producer.rollback()
+            raise
+        if max_batches is not None and loaded >= max_batches:
+            producer.rollback()
+        return loaded
+
+    async def _load(self, producer: AsyncProducer, source: asyncio.Queue, extract: asyncio.Task) -> int:
+        loaded = 0
+        batch = await source.get()
+        while batch is not STOP:
+            with registry.timer("etl_transform_seconds", {"index": batch.index_name}):
+                docs = transform_lists_to_dc(batch)
+            if docs:
+                await self.elk_loader.load(docs)
+            await asyncio.to_thread(producer.commit, batch)
+            loaded += 1
+            batch = await source.get()
+        await extract
+        return loaded
+
+    async def _extract(self, producer: AsyncProducer, output: asyncio.Queue, max_batches: Optional[int]) -> None:
+        batches = producer.get_results()
+        cancelled = False
+        try:
+            await self._forward(batches, output, max_batches)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            await batches.aclose()
+            if not cancelled:
+                await output.put(STOP)
+
+    async def _forward(self, batches: AsyncIterator[Batch], output: asyncio.Queue, max_batches: Optional[int]) -> None:
+        number = 0
+        async for batch in batches:
+            await output.put(batch)
+            number += 1
+            if number == max_batches:
+                return
+
+
+class AsyncScheduler:
+    """Run every producer as a task, at most workers pipelines and index_limits pipelines per index at a time.
+
+    Producer gives its slot back after quantum of batches, the same way as in Scheduler.
+    """
+
+    def __init__(  # noqa: WPS211 every scheduling option is tunable
+        self,
+        pipeline: AsyncPipeline,
+        producers: list[AsyncProducer],
+        workers: int = 3,
+        quantum: int = 10,
+        index_limits: Optional[dict[str, int]] = None,
+    ) -> None:
+        """Init scheduler.
+
+        Args:
+            pipeline: AsyncPipeline to process producer batches
+            producers: list[AsyncProducer] producers to run
+            workers: int number of producers running at the same time
+            quantum: int number of batches producer processes before giving slot to the next producer
+            index_limits: Optional[dict[str, int]] maximal number of running producers per index, one by default
+        """
+        self.pipeline = pipeline
+        self.producers = producers
+        self.workers = workers
+        self.quantum = quantum
+        self.index_limits = index_limits or {}
+        self.last_report = {}
+
+    async def run_pass(self) -> dict[str, dict]:
+        """Run all producers until they have no more changes and save their checkpoints.
+
+        Returns:
+            dict[str, dict]: loaded batches and lag of every producer
+        """
+        workers = asyncio.Semaphore(self.workers)
+        index_slots = defaultdict(lambda: asyncio.Semaphore(1))
+        for index_name, limit in self.index_limits.items():
+            index_slots[index_name] = asyncio.Semaphore(max(limit, 1))
+        loaded = Counter()
+        await asyncio.gather(*(self._drain(producer, workers, index_slots, loaded) for producer in self.producers))
+        return await self._report(loaded)
+
+    async def run_forever(  # noqa: WPS211 idle backoff is tunable like backoff decorator
+        self,
+        wait_changes: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+        start_sleep_time: float = 0.5,
+        factor: int = 2,
+        border_sleep_time: int = 10,
+        keep_running: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """Run passes right one after another while there are changes, wait longer and longer when idle.
+
+        Args:
+            wait_changes: Callable waiting given seconds, may return earlier when changes arrive
+            start_sleep_time: float first idle wait
+            factor: int exponential factor
+            border_sleep_time: int maximal idle wait
+            keep_running: Optional[Callable[[], bool]] checked before every pass, run stops once it returns False
+        """
+        delays = expo(start_sleep_time, factor, border_sleep_time)
+        while keep_running is None or keep_running():
+            report = await self.run_pass()
+            if any(producer_report["batches"] for producer_report in report.values()):
+                delays = expo(start_sleep_time, factor, border_sleep_time)
+                continue
+            if await wait_changes(next(delays)):
+                delays = expo(start_sleep_time, factor, border_sleep_time)
+
+    async def _drain(
+        self,
+        producer: AsyncProducer,
+        workers: asyncio.Semaphore,
+        index_slots: dict[str, asyncio.Semaphore],
+        loaded: Counter,
+    ) -> None:
+        batches = self.quantum
+        while batches >= self.quantum:
+            try:
+                batches = await self._run_quantum(producer, workers, index_slots)
+            except Exception as error:
+                logger.exception(error)
+                return
+            loaded[producer.schema.tracked_id] += batches
+
+    async def _run_quantum(
+        self,
+        producer: AsyncProducer,
+        workers: asyncio.Semaphore,
+        index_slots: dict[str, asyncio.Semaphore],
+    ) -> int:
+        async with AsyncExitStack() as slots:
+            # slots are taken in the same order by all producers, so they do not wait for each other
+            for index_name in sorted(producer.schema.indexes):
+                await slots.enter_async_context(index_slots[index_name])
+            async with workers:
+                return await self.pipeline.run(producer, self.quantum)
+
+    async def _report(self, loaded: Counter) -> dict[str, dict]:
+        self.last_report = {}
+        for producer in self.producers:
+            await asyncio.to_thread(producer.flush)
+            tracked_id = producer.schema.tracked_id
+            self.last_report[tracked_id] = {"batches": loaded[tracked_id], "lag": producer.lag()}
+            registry.set("etl_lag_seconds", {"producer": tracked_id}, self.last_report[tracked_id]["lag"])
+        return self.last_report
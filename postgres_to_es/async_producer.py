@@ -0,0 +1,101 @@
+"""Buisness logic to collect data from database in asyncio engine."""
+from typing import AsyncGenerator, Callable, Optional
+
+from async_db import AsyncDBConnector
+from producer import Batch, PagingProducer, Schema
+from shards import Shard
+from state import State
+
+
+class AsyncProducer(PagingProducer):
+    """Producer reading pages with AsyncDBConnector, batches come from async generator.
+
+    Checkpoints, rollback and lag are shared with BaseProducer through PagingProducer. Documents are
+    always fetched with one query per page, consolidated fan-out and server side cursors are not used.
+    """
+
+    def __init__(  # noqa: WPS211 producer options
+        self,
+        connector: AsyncDBConnector,
+        state: State,
+        schema: Schema,
+        page_size: int = 100,
+        json_documents: bool = False,
+        shard: Optional[Shard] = None,
+    ) -> None:
+        """Init of async producer.
+
+        Args:
+            connector: AsyncDBConnector class to work with database
+            state: State class to handle and store state changes
+            schema: Dataclass with all required SQL templates
+            page_size: int number of tracked ids in one page
+            json_documents: bool get documents built by database if schema supports it
+            shard: Optional[Shard] produce only documents of this shard
+        """
+        super().__init__(state, schema, page_size=page_size, json_documents=json_documents, shard=shard)
+        self.connector = connector
+
+    async def get_films(
+        self,
+        func_name: Callable[[list], list[str]],
+        sql: str,
+        key: str,
+        **kwargs,
+    ) -> AsyncGenerator[list[str], None]:
+        """Get films page by page ordered by (modified, id).
+
+        Args:
+            func_name: Callable function apply
+            sql: sql query
+            key: str name of metric
+            kwargs: Arbitrary keyword arguments.
+
+        Yields:
+            list[str]: tracked or related ids
+        """
+        while True:
+            data_from_db = await self.connector.load_data(sql, self.page_params(key, kwargs), self.template(sql))
+            if not data_from_db:
+                break
+            self.save_page(key, data_from_db)
+            yield func_name(data_from_db)
+
+    async def get_results(self) -> AsyncGenerator[Batch, None]:
+        """Get films.
+
+        Yields:
+            Batch: films with checkpoint
+        """
+        async for doc_ids, checkpoint in self.get_dirty_ids():
+            rows = []
+            if doc_ids:
+                rows = await self.connector.load_data(
+                    self.sql_get_data,
+                    {"film_ids": doc_ids},
+                    self.template(self.sql_get_data),
+                )
+                self.count_fetched("data", len(rows))
+            yield Batch(self.schema.index_name, rows, checkpoint, self.transform)
+
+    async def get_dirty_ids(self) -> AsyncGenerator[tuple, None]:
+        """Get ids of documents to reload without loading documents.
+
+        Yields:
+            tuple[list[str], dict]: documents ids and checkpoint to save after they are loaded
+        """
+        tracked_key = self.schema.tracked_id
+        related_key = self.schema.related_id
+        async for tracked_ids in self.get_films(self.convert_ids, self.schema.sql_get_tracked_ids, tracked_key):
+            if self.schema.sql_get_ids:
+                related_pages = self.get_films(
+                    self.convert_ids,
+                    self.schema.sql_get_ids,
+                    related_key,
+                    tracked_ids=tracked_ids,
+                )
+                async for film_ids in related_pages:
+                    yield self.owned(film_ids), {related_key: self.local_state[related_key]}
+                yield [], self.related_done()
+            else:
+                yield self.owned(tracked_ids), {tracked_key: self.local_state[tracked_key]}
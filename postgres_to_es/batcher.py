@@ -0,0 +1,171 @@
+"""Regroup transformed documents into bulk requests of adaptive size."""
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from elk import ELKLoader
+from producer import Batch
+from transformator import BaseDoc
+
+# every this document is serialized to estimate average document size
+SAMPLE_EVERY = 50
+# weight of the latest document in average document size
+SMOOTHING = 0.1
+TARGET_BYTES = 5 * 1024 * 1024
+
+
+class BulkSizer:  # noqa: WPS230 every bound of sizing is tunable
+    """Number of documents in one bulk request, shared by all pipelines.
+
+    Size grows by increment while Elasticsearch answers faster than target latency and is halved
+    when it answers slower. Size never exceeds number of average documents fitting target bytes.
+    """
+
+    def __init__(  # noqa: WPS211 every bound of sizing is tunable
+        self,
+        target_bytes: int = TARGET_BYTES,
+        target_latency: float = 1.0,
+        min_docs: int = 50,
+        max_docs: int = 5000,
+        start_docs: int = 500,
+        increment: int = 50,
+    ) -> None:
+        """Init sizer.
+
+        Args:
+            target_bytes: int desired payload of bulk request
+            target_latency: float desired bulk request time in seconds
+            min_docs: int minimal number of documents in request
+            max_docs: int maximal number of documents in request
+            start_docs: int number of documents in the first request
+            increment: int growth of request after fast response
+        """
+        self.target_bytes = target_bytes
+        self.target_latency = target_latency
+        self.min_docs = min_docs
+        self.max_docs = max_docs
+        self.increment = increment
+        self.docs = start_docs
+        self.doc_bytes: float = 0
+        self.lock = threading.Lock()
+
+    def size(self) -> int:
+        """Get number of documents for the next request.
+
+        Returns:
+            int: number of documents
+        """
+        with self.lock:
+            docs = self.docs
+            if self.doc_bytes:
+                docs = min(docs, int(self.target_bytes / self.doc_bytes))
+            return max(docs, self.min_docs)
+
+    def observe_doc(self, doc_bytes: int) -> None:
+        """Update average document size.
+
+        Args:
+            doc_bytes: int size of serialized document
+        """
+        with self.lock:
+            if self.doc_bytes:
+                self.doc_bytes += SMOOTHING * (doc_bytes - self.doc_bytes)
+            else:
+                self.doc_bytes = doc_bytes
+
+    def observe_bulk(self, docs: int, latency: float) -> None:
+        """Adjust request size to measured response time.
+
+        Args:
+            docs: int number of documents in finished request
+            latency: float request time in seconds
+        """
+        with self.lock:
+            if latency > self.target_latency:
+                self.docs = max(self.min_docs, min(self.docs, docs) // 2)
+            elif docs >= self.docs:
+                self.docs = min(self.max_docs, self.docs + self.increment)
+
+
+class AdaptiveBatcher:  # noqa: WPS230 progress of collected, sent and commited documents
+    """Collect documents of consecutive batches and load them in requests sized by BulkSizer.
+
+    Checkpoint of a batch is commited only after all its documents and documents of all
+    batches before it are loaded.
+    """
+
+    def __init__(
+        self,
+        elk_loader: ELKLoader,
+        sizer: BulkSizer,
+        commit: Callable[[Batch], None],
+        max_wait: float = 1.0,
+    ) -> None:
+        """Init batcher.
+
+        Args:
+            elk_loader: ELKLoader loader to Elasticsearch
+            sizer: BulkSizer source of request size
+            commit: Callable saving checkpoint of loaded batch
+            max_wait: float maximal time in seconds document waits for request to fill up
+        """
+        self.elk_loader = elk_loader
+        self.sizer = sizer
+        self.commit = commit
+        self.max_wait = max_wait
+        self.docs: deque[tuple[str, BaseDoc]] = deque()
+        self.batches: deque[tuple[Batch, int]] = deque()
+        self.added = 0
+        self.sent = 0
+        self.committed = 0
+        self.oldest: Optional[float] = None
+
+    def add(self, batch: Batch, docs: dict[str, BaseDoc]) -> None:
+        """Add documents of batch and load full requests.
+
+        Args:
+            batch: Batch batch of documents
+            docs: dict[str, BaseDoc] transformed documents
+        """
+        for number, (doc_id, doc) in enumerate(docs.items()):
+            if (self.added + number) % SAMPLE_EVERY == 0:
+                self.sizer.observe_doc(len(json.dumps(doc.to_source(), default=str)))
+            self.docs.append((doc_id, doc))
+        self.added += len(docs)
+        self.batches.append((batch, self.added))
+        if self.oldest is None and self.docs:
+            self.oldest = time.monotonic()
+        size = self.sizer.size()
+        while len(self.docs) >= size:
+            self._send(size)
+            size = self.sizer.size()
+        self._commit()
+
+    def tick(self) -> None:
+        """Load collected documents if the oldest of them waits longer than max_wait."""
+        if self.oldest is not None and time.monotonic() - self.oldest >= self.max_wait:
+            self.flush()
+
+    def flush(self) -> None:
+        """Load all collected documents."""
+        while self.docs:
+            self._send(self.sizer.size())
+        self._commit()
+        self.oldest = None
+
+    def _send(self, size: int) -> None:
+        count = min(size, len(self.docs))
+        chunk = dict(self.docs.popleft() for _ in range(count))
+        started = time.monotonic()
+        self.elk_loader.load(chunk, chunk_size=len(chunk))
+        self.sizer.observe_bulk(len(chunk), time.monotonic() - started)
+        self.sent += len(chunk)
+        if not self.docs:
+            self.oldest = None
+
+    def _commit(self) -> None:
+        while self.batches and self.batches[0][1] <= self.sent:
+            self.commit(self.batches.popleft()[0])
+            self.committed += 1
@@ -0,0 +1,103 @@
+"""Load documents changed through several producers of the same index only once."""
+import time
+from typing import Generator
+
+from producer import BaseProducer, Batch, Schema
+
+
+class Coalescer:  # noqa: WPS214 the same interface as a producer
+    """Collect dirty documents ids of several producers over a window and load every document once.
+
+    Coalescer is used by pipeline and scheduler the same way as a single producer. Checkpoints of all
+    producers which contributed to a window are commited together after its batch is loaded.
+    """
+
+    def __init__(self, name: str, producers: list[BaseProducer], window: float = 1.0, max_ids: int = 1000) -> None:
+        """Init coalescer.
+
+        Args:
+            name: str name used in scheduler reports
+            producers: list[BaseProducer] producers of the same index sharing one state
+            window: float maximal time in seconds to collect ids before loading them
+            max_ids: int number of collected ids which triggers loading before window ends
+        """
+        self.producers = producers
+        self.window = window
+        self.max_ids = max_ids
+        self.data_producer = producers[0]
+        self.state = self.data_producer.state
+        self.schema = Schema(
+            tracked_id=name,
+            related_id="",
+            index_name=self.data_producer.schema.index_name,
+            sql_get_tracked_ids="",
+            sql_get_data=self.data_producer.sql_get_data,
+        )
+
+    def get_results(self) -> Generator[Batch, None, None]:
+        """Get documents changed in any of producers.
+
+        Yields:
+            Batch: documents with checkpoints of all contributing producers
+        """
+        sources = [producer.get_dirty_ids() for producer in self.producers]
+        try:  # noqa: WPS501 sources are closed when consumer stops
+            while sources:
+                doc_ids, checkpoint, sources = self._collect(sources)
+                if not checkpoint:
+                    continue
+                yield Batch(
+                    self.schema.index_name,
+                    self.data_producer.fetch_data(self.data_producer.sql_get_data, {"film_ids": doc_ids})
+                    if doc_ids else [],
+                    checkpoint,
+                    self.data_producer.transform,
+                )
+        finally:
+            for source in sources:
+                source.close()
+
+    def commit(self, batch: Batch) -> None:
+        """Save checkpoints of all producers contributed to batch.
+
+        Args:
+            batch: Batch loaded batch
+        """
+        self.data_producer.commit(batch)
+
+    def flush(self) -> None:
+        """Save commited checkpoints right now if state saves them in background."""
+        self.state.flush()
+
+    def rollback(self) -> None:
+        """Forget fetched but not commited progress of all producers."""
+        for producer in self.producers:
+            producer.rollback()
+
+    def lag(self) -> float:
+        """Get lag of the most lagging producer.
+
+        Returns:
+            float: lag in seconds
+        """
+        return max(producer.lag() for producer in self.producers)
+
+    def _collect(self, sources: list[Generator]) -> tuple[list[str], dict, list[Generator]]:
+        doc_ids = {}
+        checkpoint = {}
+        deadline = time.monotonic() + self.window
+        while sources and len(doc_ids) < self.max_ids and time.monotonic() < deadline:
+            sources = self._poll(sources, doc_ids, checkpoint)
+        return list(doc_ids), checkpoint, sources
+
+    def _poll(self, sources: list[Generator], doc_ids: dict, checkpoint: dict) -> list[Generator]:
+        active = []
+        for source in sources:
+            page = next(source, None)
+            if page is None:
+                continue
+            page_ids, page_checkpoint = page
+            doc_ids.update(dict.fromkeys(page_ids))
+            checkpoint.update(page_checkpoint)
+            active.append(source)
+        return active
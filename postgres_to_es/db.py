@@ -1,33 +1,117 @@
 """Class to work with postgress."""
+import hashlib
+import inspect
 import logging
-from contextlib import closing
-from typing import Any
+import re
+import threading
+from contextlib import closing, contextmanager, suppress
+from typing import Any, Generator, Optional
+from uuid import uuid4
 
 import psycopg2
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
+from psycopg2.extensions import cursor as _cursor
+from psycopg2.extras import DictCursor, LogicalReplicationConnection
 
-from decorators import backoff
+import sql as sql_templates
+from decorators import backoff, backoff_stream
 from exceptions import RetryExceptionError
-from settings import PosgressSettings
+from metrics import registry
+from pool import ConnectionPool
+from settings import ConnectorSettings, PosgressSettings
 
 logger = logging.getLogger(__name__)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
 fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
 fh.setFormatter(formatter)
 logger.addHandler(fh)
 
+DB_UNAVAILABLE = "Postgress database is not available, retrying..."
+PLACEHOLDER = re.compile(r"%\((\w+)\)s((?:::\w+(?:\[\])?)?)")
 
-class DBConnector:
+
+def template_names() -> dict[str, str]:
+    """Get names of sql templates used as metrics labels, templates with the same text get all their names.
+
+    Returns:
+        dict[str, str]: names joined with | by template text
+    """
+    names = {}
+    for name, member in inspect.getmembers(sql_templates):
+        if name.startswith("SQL_"):
+            names.setdefault(member, []).append(name)
+    return {template: "|".join(template_group) for template, template_group in names.items()}
+
+
+def placeholder_casts(sql: str) -> dict[str, str]:
+    """Get named parameters of query with the cast of their first placeholder.
+
+    Args:
+        sql: str query with named parameters
+
+    Returns:
+        dict[str, str]: cast such as ::uuid[] or empty string by parameter name in order of appearance
+    """
+    casts = {}
+    for argument, cast in PLACEHOLDER.findall(sql):
+        casts[argument] = casts.get(argument) or cast
+    return casts
+
+
+def positional_statement(sql: str, casts: dict[str, str]) -> str:
+    """Replace named placeholders of query by positional ones keeping their casts.
+
+    Args:
+        sql: str query with named parameters
+        casts: dict[str, str] parameters in order of their positions
+
+    Returns:
+        str: statement body for PREPARE
+    """
+    positions = {argument: "${0}".format(number) for number, argument in enumerate(casts, start=1)}
+    statement = sql.strip().rstrip(";")
+    return PLACEHOLDER.sub(lambda match: positions[match.group(1)] + match.group(2), statement)
+
+
+TEMPLATE_NAMES = template_names()
+
+
+class PreparingConnection(_connection):
+    """Connection which remembers names of statements prepared in its session."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Init connection with no prepared statements, arguments are passed to psycopg2 connection.
+
+        Args:
+            args: connection positional arguments
+            kwargs: connection keyword arguments
+        """
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class DBConnector:  # noqa: WPS214 pooled, deferred and prepared statements go through the same connection
     """Class to work with postgress db."""
 
-    def __init__(self, config: PosgressSettings) -> None:
+    def __init__(self, config: PosgressSettings, connector_config: Optional[ConnectorSettings] = None) -> None:
         """Init db connect.
 
         Args:
             config: PosgressSettings connection configration.
+            connector_config: ConnectorSettings pool mode configuration, read from environment if not set.
         """
         self.config = config.dict()
+        self.connector_config = connector_config or ConnectorSettings()
+        self.deferred: dict[str, tuple[str, dict]] = {}
+        self.deferred_lock = threading.Lock()
+        self.pool = None
+        if self.connector_config.pool_enabled:
+            self.pool = ConnectionPool(
+                self.get_connection,
+                min_size=self.connector_config.pool_min_size,
+                max_size=self.connector_config.pool_max_size,
+                health_check=self.connector_config.pool_health_check,
+            )
 
     @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
     def get_connection(self) -> _connection:
@@ -40,30 +124,243 @@ class DBConnector:
             RetryExceptionError: if OperationalError triggered.
         """
         try:
-            connect = psycopg2.connect(**self.config, cursor_factory=DictCursor)
+            connect = psycopg2.connect(
+                **self.config,
+                cursor_factory=DictCursor,
+                connection_factory=PreparingConnection,
+            )
         except psycopg2.OperationalError:
-            raise RetryExceptionError("Postgress database is not available, retrying...")
+            raise RetryExceptionError(DB_UNAVAILABLE)
         return connect
 
     @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
-    def load_data(self, sql: str) -> list[Any]:
+    def get_replication_connection(self) -> LogicalReplicationConnection:
+        """Get connection streaming logical replication.
+
+        Returns:
+            LogicalReplicationConnection
+
+        Raises:
+            RetryExceptionError: if OperationalError triggered.
+        """
+        try:
+            connect = psycopg2.connect(**self.config, connection_factory=LogicalReplicationConnection)
+        except psycopg2.OperationalError:
+            raise RetryExceptionError(DB_UNAVAILABLE)
+        return connect
+
+    @contextmanager
+    def connection(self) -> Generator[_connection, None, None]:
+        """Get connection from pool or open new one if pool mode is off.
+
+        Yields:
+            _connection
+        """
+        if self.pool is None:
+            with closing(self.get_connection()) as conn:
+                yield conn
+        else:
+            with self.pool.connection() as pooled:
+                yield pooled
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        if self.pool is not None:
+            self.pool.closeall()
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def load_data(self, sql: str, query_params: Optional[dict] = None, template: Optional[str] = None) -> list[Any]:
         """Execute sql query.
 
         Args:
             sql: str sql query to execute.
+            query_params: Optional[dict] query parameters.
+            template: Optional[str] metrics label of query instead of its sql template name.
 
         Returns:
             list: sql_result
 
+        Raises:
+            BaseException: any error of query, postponed statements are kept for the next query
+        """
+        deferred = self.pop_deferred()
+        try:
+            with self.connection() as conn:
+                with registry.timer("etl_query_seconds", {"template": template or TEMPLATE_NAMES.get(sql, "other")}):
+                    sql_result = self._fetch(conn, deferred, sql, query_params)
+                if deferred:
+                    conn.commit()
+        except BaseException:  # noqa: WPS424 statements are kept even if query is interrupted
+            self.restore_deferred(deferred)
+            raise
+        return sql_result
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def execute(self, sql: str, query_params: Optional[dict] = None) -> None:
+        """Execute and commit sql statement without result.
+
+        Args:
+            sql: str sql statement to execute.
+            query_params: Optional[dict] statement parameters.
+
         Raises:
             RetryExceptionError: if OperationalError triggered.
         """
-        with closing(self.get_connection()) as conn:
-            cursor = conn.cursor()
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute(sql, query_params)
+                except psycopg2.OperationalError:
+                    raise RetryExceptionError(DB_UNAVAILABLE)
+            conn.commit()
+
+    def defer(self, key: str, sql: str, query_params: Optional[dict] = None) -> None:
+        """Postpone statement to send it together with the next query in one round trip.
+
+        Args:
+            key: str statement name, newer statement with the same name replaces older one
+            sql: str sql statement without result
+            query_params: Optional[dict] statement parameters, names must not clash with query parameters
+        """
+        with self.deferred_lock:
+            self.deferred[key] = (sql, query_params or {})
+
+    def pop_deferred(self) -> dict[str, tuple[str, dict]]:
+        """Take all postponed statements.
+
+        Returns:
+            dict[str, tuple[str, dict]]: statements with parameters by name
+        """
+        with self.deferred_lock:
+            deferred = self.deferred
+            self.deferred = {}
+        return deferred
+
+    def restore_deferred(self, deferred: dict[str, tuple[str, dict]]) -> None:
+        """Return not executed statements unless they were replaced by newer ones.
+
+        Args:
+            deferred: dict[str, tuple[str, dict]] statements taken by pop_deferred
+        """
+        with self.deferred_lock:
+            for key, statement in deferred.items():
+                self.deferred.setdefault(key, statement)
+
+    def flush_deferred(self) -> None:
+        """Execute postponed statements right now.
+
+        Raises:
+            BaseException: any error of statements, they are kept for the next query
+        """
+        deferred = self.pop_deferred()
+        if not deferred:
+            return
+        try:
+            self.execute(*self.join_deferred(deferred, ""))
+        except BaseException:  # noqa: WPS424 statements are kept even if flush is interrupted
+            self.restore_deferred(deferred)
+            raise
+
+    def join_deferred(
+        self,
+        deferred: dict[str, tuple[str, dict]],
+        sql: str,
+        query_params: Optional[dict] = None,
+    ) -> tuple[str, Optional[dict]]:
+        """Prepend postponed statements to query.
+
+        Args:
+            deferred: dict[str, tuple[str, dict]] postponed statements
+            sql: str query which result is fetched
+            query_params: Optional[dict] query parameters
+
+        Returns:
+            tuple[str, Optional[dict]]: sql and parameters for cursor.execute
+        """
+        if not deferred:
+            return sql, query_params
+        joined_params = dict(query_params or {})
+        for _, statement_params in deferred.values():
+            joined_params.update(statement_params)
+        return "".join(statement for statement, _ in deferred.values()) + sql, joined_params
+
+    def prepare(self, conn: PreparingConnection, cursor: _cursor, sql: str) -> str:
+        """Prepare query as server side statement once per connection.
+
+        Args:
+            conn: PreparingConnection connection to prepare statement in
+            cursor: _cursor cursor of this connection
+            sql: str query with named parameters
+
+        Returns:
+            str: EXECUTE statement with the same named parameters and their casts
+        """
+        name = "etl_{0}".format(hashlib.md5(sql.encode()).hexdigest())
+        casts = placeholder_casts(sql)
+        if name not in conn.prepared:
+            cursor.execute("PREPARE {0} AS {1};".format(name, positional_statement(sql, casts)))
+            conn.prepared.add(name)
+        if not casts:
+            return "EXECUTE {0};".format(name)
+        # EXECUTE arguments get only assignment coercion, so text[] built by psycopg2 needs the cast to uuid[]
+        execute_arguments = ("%({0})s{1}".format(argument, cast) for argument, cast in casts.items())
+        return "EXECUTE {0} ({1});".format(name, ", ".join(execute_arguments))
+
+    @backoff_stream(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def stream_data(
+        self,
+        sql: str,
+        query_params: Optional[dict] = None,
+        template: Optional[str] = None,
+    ) -> Generator[Any, None, None]:
+        """Execute sql query on server side cursor and yield rows fetched by itersize chunks.
+
+        Query is restarted from the first row if connection is lost in the middle of streaming.
+
+        Args:
+            sql: str sql query to execute.
+            query_params: Optional[dict] query parameters.
+            template: Optional[str] metrics label of query instead of its sql template name.
+
+        Yields:
+            Any: sql result row
+
+        Raises:
+            RetryExceptionError: if OperationalError triggered.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor(name="etl_stream_{0}".format(uuid4().hex))
+            cursor.itersize = self.connector_config.stream_itersize
             try:
-                cursor.execute(sql)
+                yield from self._stream(cursor, sql, query_params, template)
             except psycopg2.OperationalError:
-                raise RetryExceptionError("Postgress database is not available, retrying...")
-            sql_result = cursor.fetchall()
-            cursor.close()
+                raise RetryExceptionError(DB_UNAVAILABLE)
+            finally:
+                with suppress(psycopg2.Error):
+                    cursor.close()
+
+    def _fetch(self, conn: _connection, deferred: dict, sql: str, query_params: Optional[dict]) -> list[Any]:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(*self.join_deferred(deferred, self._statement(conn, cursor, sql), query_params))
+        except psycopg2.OperationalError:
+            raise RetryExceptionError(DB_UNAVAILABLE)
+        sql_result = cursor.fetchall()
+        cursor.close()
         return sql_result
+
+    def _statement(self, conn: _connection, cursor: _cursor, sql: str) -> str:
+        if self.pool is not None and self.connector_config.prepared_enabled:
+            return self.prepare(conn, cursor, sql)
+        return sql
+
+    def _stream(
+        self,
+        cursor: _cursor,
+        sql: str,
+        query_params: Optional[dict],
+        template: Optional[str],
+    ) -> Generator[Any, None, None]:
+        with registry.timer("etl_query_seconds", {"template": template or TEMPLATE_NAMES.get(sql, "other")}):
+            cursor.execute(sql, query_params)
+        yield from cursor
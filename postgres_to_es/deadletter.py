@@ -0,0 +1,67 @@
+"""Bulk actions rejected by Elasticsearch for good, kept to be replayed later."""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Iterable
+
+
+class DeadLetterFile:
+    """JSON lines file with failed bulk actions, their status and error."""
+
+    def __init__(self, path: str) -> None:
+        """Init dead letter file.
+
+        Args:
+            path: str file to append failed actions to
+        """
+        self.path = path
+        self.replay_path = "{0}.replay".format(path)
+        self.lock = threading.Lock()
+
+    def write(self, records: Iterable[dict]) -> int:
+        """Append failed actions.
+
+        Args:
+            records: Iterable[dict] action, status and error of every failed document
+
+        Returns:
+            int: number of written records
+        """
+        failed_at = datetime.now().isoformat()
+        lines = [
+            json.dumps({**record, "failed_at": failed_at}, separators=(',', ':'), default=str)
+            for record in records
+        ]
+        if not lines:
+            return 0
+        with self.lock:
+            with open(self.path, 'a') as dead_letter_file:
+                dead_letter_file.writelines("{0}\n".format(line) for line in lines)
+                dead_letter_file.flush()
+                os.fsync(dead_letter_file.fileno())
+        return len(lines)
+
+    def take(self) -> list[dict]:
+        """Move collected records aside for replay, records of unfinished previous replay are taken too.
+
+        Returns:
+            list[dict]: failed records
+        """
+        with self.lock:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as dead_letter_file:
+                    collected = dead_letter_file.read()
+                with open(self.replay_path, 'a') as replay_file:
+                    replay_file.write(collected)
+                os.remove(self.path)
+            if not os.path.exists(self.replay_path):
+                return []
+            with open(self.replay_path, 'r') as replay:
+                return [json.loads(line) for line in replay if line.strip()]
+
+    def done(self) -> None:
+        """Forget records taken for replay, call after they are sent again."""
+        with self.lock:
+            if os.path.exists(self.replay_path):
+                os.remove(self.replay_path)
@@ -1,8 +1,11 @@
+import asyncio
 import logging
 from functools import wraps
 from time import sleep
+from typing import Callable, Iterator
 
 from exceptions import RetryExceptionError
+from metrics import registry
 
 
 def expo(start_sleep_time, factor, border_sleep_time):
@@ -46,12 +49,86 @@ def backoff(logger: logging.Logger, start_sleep_time: float = 0.1, factor: int =
             while True:
                 try:
                     func_result = func(*args, **kwargs)
-                except RetryExceptionError as e:
-                    logger.exception(e)
-                    delay = next(delays)
+                except RetryExceptionError as error:
+                    sleep(retry_delay(logger, func, error, delays))
                 else:
                     break
-                sleep(delay)
             return func_result
         return inner
     return func_wrapper
+
+
+def backoff_stream(
+    logger: logging.Logger,
+    start_sleep_time: float = 0.1,
+    factor: int = 2,
+    border_sleep_time: int = 10,
+):
+    """Restart generator from the beginning with exponential delay in case it raises RetryException.
+
+    Items yielded before the failure are yielded again, so consumer has to handle them idempotently.
+
+    Args:
+        logger: logging.Logger logger of retried errors
+        start_sleep_time: float start repeat time
+        factor: int exponential factor
+        border_sleep_time: int exponential limit
+
+    Returns:
+        Callable: decorator of generator function
+    """
+    def func_wrapper(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            delays = expo(start_sleep_time, factor, border_sleep_time)
+            while True:
+                try:
+                    yield from func(*args, **kwargs)
+                except RetryExceptionError as error:
+                    sleep(retry_delay(logger, func, error, delays))
+                else:
+                    return
+        return inner
+    return func_wrapper
+
+
+def async_backoff(logger: logging.Logger, start_sleep_time: float = 0.1, factor: int = 2, border_sleep_time: int = 10):
+    """Repeat coroutine with exponential delay in case it raises RetryException, event loop is not blocked.
+
+    Args:
+        logger: logging.Logger logger of retried errors
+        start_sleep_time: float start repeat time
+        factor: int exponential factor
+        border_sleep_time: int exponential limit
+
+    Returns:
+        Callable: decorator of coroutine function
+    """
+    def func_wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            delays = expo(start_sleep_time, factor, border_sleep_time)
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except RetryExceptionError as error:
+                    await asyncio.sleep(retry_delay(logger, func, error, delays))
+        return inner
+    return func_wrapper
+
+
+def retry_delay(logger: logging.Logger, func: Callable, error: RetryExceptionError, delays: Iterator[float]) -> float:
+    """Log retried error and get delay before the next attempt.
+
+    Args:
+        logger: logging.Logger logger of retried errors
+        func: Callable retried function
+        error: RetryExceptionError retried error
+        delays: Iterator[float] exponential delays
+
+    Returns:
+        float: seconds to wait
+    """
+    logger.exception(error)
+    registry.inc("etl_backoff_retries_total", {"function": func.__qualname__})
+    return next(delays)
@@ -2,14 +2,19 @@
 import json
 import logging
 import os
-from dataclasses import asdict
-from typing import Generator
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter, sleep
+from typing import Any, Generator, Iterable, Iterator, Optional, Tuple
 
-from elasticsearch import ConnectionError, Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch import ApiError, ConnectionError, Elasticsearch
+from elasticsearch.helpers import parallel_bulk, scan, streaming_bulk
 
-from decorators import backoff
+from deadletter import DeadLetterFile
+from decorators import backoff, expo
 from exceptions import RetryExceptionError
+from fingerprint import FingerprintCache, digest
+from metrics import registry
 from settings import ElkSettings
 from transformator import BaseDoc
 
@@ -19,8 +24,276 @@ fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
 fh.setFormatter(formatter)
 logger.addHandler(fh)
 
+ES_UNAVAILABLE = "Elasticsearch is not available, retrying..."
+# index exists already, bulk error starts from, document to delete is missing
+INDEX_EXISTS = 400
+ERROR_STATUS = 300
+NOT_FOUND = 404
+# statuses of documents or whole bulk request worth sending again
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
 
-class ELKLoader:
+
+@contextmanager
+def elasticsearch_available() -> Generator[None, None, None]:
+    """Turn lost connection to Elasticsearch into error retried by backoff.
+
+    Yields:
+        None: block talking to Elasticsearch
+
+    Raises:
+        RetryExceptionError: if ConnectionError triggered
+    """
+    try:
+        yield
+    except ConnectionError:
+        raise RetryExceptionError(ES_UNAVAILABLE)
+
+
+def action_key(action: dict) -> tuple[str, str]:
+    """Get key of bulk action matching key of its result.
+
+    Args:
+        action: dict bulk action
+
+    Returns:
+        tuple[str, str]: operation and document _id
+    """
+    return action.get("_op_type", "index"), action["_id"]
+
+
+def retry_delay(rejected: list[dict], delays: Iterator[float], retry_after: Optional[float]) -> float:
+    """Get delay before rejected actions are sent again.
+
+    Args:
+        rejected: list[dict] actions to send again
+        delays: Iterator[float] exponential delays
+        retry_after: Optional[float] Retry-After seconds of rejected requests
+
+    Returns:
+        float: seconds to wait
+    """
+    logger.warning("{0} documents rejected, retrying...".format(len(rejected)))
+    return max(next(delays), retry_after or 0)
+
+
+def exhausted(actions: list[dict], outcomes: dict) -> Generator[dict, None, None]:
+    """Get dead letter records of actions still rejected after the last retry.
+
+    Args:
+        actions: list[dict] rejected bulk actions
+        outcomes: dict status and error by operation and _id seen on the last attempt
+
+    Yields:
+        dict: dead letter record with the last seen status and error
+    """
+    for action in actions:
+        status, error = outcomes.get(action_key(action), (None, None))
+        yield {"action": action, "status": status, "error": error or "retries exhausted"}
+
+
+def sort_results(actions: list[dict], outcomes: dict) -> Tuple[list[dict], list[dict]]:
+    """Split sent actions by their results.
+
+    Args:
+        actions: list[dict] sent bulk actions
+        outcomes: dict status and error by operation and _id
+
+    Returns:
+        Tuple[list[dict], list[dict]]: actions worth sending again and dead letter records of failed ones
+    """
+    rejected = []
+    dead_letters = []
+    for action in actions:
+        status, error = outcomes.get(action_key(action), (None, None))
+        if status is None or status in RETRY_STATUSES:
+            rejected.append(action)
+        elif status >= ERROR_STATUS and (action.get("_op_type"), status) != ("delete", NOT_FOUND):
+            dead_letters.append({"action": action, "status": status, "error": error})
+    return rejected, dead_letters
+
+
+def observe_bulk(documents: int, elapsed: float) -> None:
+    """Report bulk request metrics.
+
+    Args:
+        documents: int number of sent documents
+        elapsed: float seconds spent sending them
+    """
+    registry.observe("etl_bulk_seconds", value=elapsed)
+    registry.inc("etl_bulk_documents_total", value=documents)
+    registry.set("etl_bulk_documents_per_second", value=documents / elapsed if elapsed else 0)
+
+
+def collect_result(outcomes: dict, bulk_item: dict) -> Optional[float]:
+    """Save result of one bulk item.
+
+    Items of request failed as a whole come with the request error, only they are marked with its status.
+
+    Args:
+        outcomes: dict status and error by operation and _id, filled in place
+        bulk_item: dict bulk item result
+
+    Returns:
+        Optional[float]: Retry-After seconds if item request was rejected with it
+    """
+    op_type, item_info = next(iter(bulk_item.items()))
+    outcomes[(op_type, item_info["_id"])] = (item_info.get("status"), item_info.get("error"))
+    error = item_info.get("exception")
+    if isinstance(error, ApiError) and error.meta.status in RETRY_STATUSES:
+        return retry_after_header(error.meta.headers)
+    return None
+
+
+def retry_after_header(headers: Optional[dict]) -> Optional[float]:
+    """Get delay requested by Elasticsearch.
+
+    Args:
+        headers: Optional[dict] response headers
+
+    Returns:
+        Optional[float]: Retry-After seconds if header is present
+    """
+    try:
+        return float((headers or {}).get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BaseLoader:
+    """Documents, fingerprints, bulk results and dead letters handling shared by loaders.
+
+    Nothing here sends requests to Elasticsearch, so the same logic is used by ELKLoader and AsyncELKLoader.
+    """
+
+    def __init__(self, config: ElkSettings) -> None:
+        """Init loader, client is created by make_client of subclass, nothing is sent yet.
+
+        Args:
+            config: ElkSettings connection details to Elasticsearch and index config
+        """
+        self.config = config
+        self.client = self.make_client()
+        self.fingerprints = None
+        if config.elk_fingerprint_path:
+            self.fingerprints = FingerprintCache(config.elk_fingerprint_path, config.elk_fingerprint_memory_size)
+        self.dead_letters = DeadLetterFile(config.elk_dead_letter_path)
+
+    def make_client(self) -> Any:
+        """Make elasticsearch client, implemented by subclasses.
+
+        Raises:
+            NotImplementedError: always
+        """
+        raise NotImplementedError
+
+    def save_fingerprints(self, data_to_load: dict, fingerprints: list, failed: set[tuple[str, str]]) -> None:
+        """Remember hashes of acknowledged documents and forget documents changed partially or deleted.
+
+        Args:
+            data_to_load: dict loaded documents
+            fingerprints: list hashes collected by generate_doc
+            failed: set[tuple[str, str]] operation and _id of documents written to dead letter file
+        """
+        if self.fingerprints is None:
+            return
+        self.fingerprints.update(
+            fingerprint for fingerprint in fingerprints if ("index", fingerprint[1]) not in failed
+        )
+        self.fingerprints.forget(
+            (row.index_name, row.uuid) for row in data_to_load.values() if row.op_type in {"update", "delete"}
+        )
+        self.fingerprints.report()
+
+    def settle(
+        self,
+        actions: list[dict],
+        outcomes: dict,
+        failed: set[tuple[str, str]],
+        last: bool,
+    ) -> list[dict]:
+        """Write failed actions to dead letter file and get actions to send again.
+
+        Args:
+            actions: list[dict] sent bulk actions
+            outcomes: dict status and error by operation and _id
+            failed: set[tuple[str, str]] operation and _id of documents written to dead letter file, filled in place
+            last: bool it was the last attempt, rejected actions are written to dead letter file too
+
+        Returns:
+            list[dict]: actions to send again
+        """
+        rejected, dead_letters = sort_results(actions, outcomes)
+        if last:
+            dead_letters.extend(exhausted(rejected, outcomes))
+            rejected = []
+        failed.update(action_key(record["action"]) for record in dead_letters)
+        registry.inc("etl_dead_letters_total", value=self.dead_letters.write(dead_letters))
+        return rejected
+
+    def generate_doc(
+        self,
+        batch: dict[str, BaseDoc],
+        fingerprints: Optional[list] = None,
+        index_name: Optional[str] = None,
+    ) -> Generator[dict, None, None]:
+        """Generate items for bulk elasticsearch loader, documents equal to already loaded ones are skipped.
+
+        Partial updates are never skipped, updates by query are not bulk items and are left out.
+
+        Args:
+            batch: dict dictionary to convert from to elasticsearch format.
+            fingerprints: Optional[list] collects hashes of generated documents
+            index_name: Optional[str] target index overriding document index, nothing is skipped for it
+
+        Yields:
+            dict: items in elasticsearch format.
+        """
+        for row in batch.values():
+            target = index_name or row.index_name
+            if row.op_type == "index":
+                yield from self.index_action(row, fingerprints, index_name)
+            elif row.op_type == "delete":
+                yield {"_op_type": "delete", "_index": target, "_id": row.uuid}
+            elif row.op_type != "update_by_query":
+                yield {
+                    "_op_type": row.op_type,
+                    "_index": target,
+                    "_id": row.uuid,
+                    "retry_on_conflict": self.config.elk_retry_on_conflict,
+                    "_source": row.to_source(),
+                }
+
+    def index_action(
+        self,
+        row: BaseDoc,
+        fingerprints: Optional[list],
+        index_name: Optional[str],
+    ) -> Generator[dict, None, None]:
+        """Generate index action of document unless it is equal to already loaded one.
+
+        Args:
+            row: BaseDoc document to index
+            fingerprints: Optional[list] collects hashes of generated documents
+            index_name: Optional[str] target index overriding document index, nothing is skipped for it
+
+        Yields:
+            dict: index action, nothing if document is unchanged
+        """
+        source = row.to_source()
+        if self.fingerprints is not None:
+            source_digest = digest(source)
+            if index_name is None and self.fingerprints.is_unchanged(row.index_name, row.uuid, source_digest):
+                return
+            if fingerprints is not None:
+                fingerprints.append((row.index_name, row.uuid, source_digest))
+        yield {
+            "_index": index_name or row.index_name,
+            "_id": row.uuid,
+            "_source": source,
+        }
+
+
+class ELKLoader(BaseLoader):  # noqa: WPS214 one client is shared by loading and index rebuild
     """Class loader data to Elasticsearch."""
 
     def __init__(self, config: ElkSettings) -> None:
@@ -30,73 +303,193 @@ class ELKLoader:
             config: ElkSettings connection details to Elasticsearch and index config
 
         """
-        self.config = config
+        super().__init__(config)
         self.create_indexs()
 
     @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
     def create_index(self, index_file: str) -> None:
-        """Create required index in Elasticsearch.
+        """Create required index in Elasticsearch, lost connection is retried.
 
         Args:
             index_file: str file with elasticsearch index structure
-
-        Raises:
-            RetryExceptionError: if ConnectionError triggered
         """
-        client = self.get_client()
         with open(index_file, "r") as fl:
             index_description = json.load(fl)
-        try:
-            client.options(ignore_status=400).indices.create(
+        with elasticsearch_available():
+            self.client.options(ignore_status=INDEX_EXISTS).indices.create(
                 index=os.path.basename(index_file).split(".")[0],
                 **index_description,
             )
-        except ConnectionError:
-            raise RetryExceptionError("Elasticsearch is not available, retrying...")
-        finally:
-            client.close()
 
     def create_indexs(self) -> None:
         """Create index in elasticsearch from index files in index folder."""
         for index_file in os.listdir(self.config.elk_index):
             self.create_index(os.path.join(self.config.elk_index, index_file))
 
-    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
-    def load(self, data_to_load: dict) -> None:
+    def load(self, data_to_load: dict, index_name: Optional[str] = None, chunk_size: Optional[int] = None) -> None:
         """Load data to Elasticsearch index.
 
+        Data is split to chunks which are sent by several threads if elk_bulk_threads is more than one.
+        Hashes of sent documents are saved only after they are acknowledged.
+
         Args:
             data_to_load: dict data to load in Elasticsearch index.
+            index_name: Optional[str] load all documents to this index instead of their own one.
+            chunk_size: Optional[int] number of documents in one request instead of elk_bulk_chunk_size.
+        """
+        fingerprints = []
+        failed = self.send(list(self.generate_doc(data_to_load, fingerprints, index_name)), chunk_size)
+        for row in data_to_load.values():
+            if row.op_type == "update_by_query":
+                body = row.to_source()
+                if self.fingerprints is not None:
+                    self.fingerprints.forget(self.matched_keys(index_name or row.index_name, body["query"]))
+                self.update_by_query(index_name or row.index_name, body)
+        self.save_fingerprints(data_to_load, fingerprints, failed)
 
-        Raises:
-            RetryExceptionError: if ConnectionError triggered.
+    def send(self, actions: list[dict], chunk_size: Optional[int] = None) -> set[tuple[str, str]]:  # noqa: WPS210
+        """Send bulk actions, only rejected ones are sent again.
+
+        Documents rejected because of back-pressure are resent with exponential delay, not shorter than
+        Retry-After of rejected request. Documents failed for other reasons or rejected more than
+        elk_bulk_max_retries times are written to dead letter file.
+
+        Args:
+            actions: list[dict] bulk actions
+            chunk_size: Optional[int] number of documents in one request instead of elk_bulk_chunk_size
+
+        Returns:
+            set[tuple[str, str]]: operation and _id of documents written to dead letter file
         """
-        client = self.get_client()
-        try:
-            bulk(client=client, actions=self.generate_doc(data_to_load))
-        except ConnectionError:
-            raise RetryExceptionError("Elasticsearch is not available, retrying...")
-        finally:
-            client.close()
+        delays = expo(0.1, 2, 10)
+        failed = set()
+        for attempt in range(self.config.elk_bulk_max_retries + 1):
+            outcomes = {}
+            retry_after = self._bulk(actions, outcomes, chunk_size)
+            actions = self.settle(actions, outcomes, failed, attempt == self.config.elk_bulk_max_retries)
+            if not actions:
+                break
+            sleep(retry_delay(actions, delays, retry_after))
+        return failed
 
-    def generate_doc(self, batch: dict[str, BaseDoc]) -> Generator[dict, None, None]:
-        """Generate items for bulk elasticsearch loader.
+    def replay_dead_letters(self) -> Tuple[int, int]:
+        """Send actions from dead letter file again, failed ones are written to it again.
+
+        Returns:
+            Tuple[int, int]: number of replayed and again failed actions
+        """
+        records = self.dead_letters.take()
+        failed = self.send([record["action"] for record in records]) if records else set()
+        self.dead_letters.done()
+        return len(records), len(failed)
+
+    def close(self) -> None:
+        """Close elasticsearch client and its connections."""
+        self.client.close()
+        if self.fingerprints is not None:
+            self.fingerprints.close()
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def matched_keys(self, index_name: str, query: dict) -> list[tuple[str, str]]:
+        """Get documents matching query, their hashes are forgotten before they are updated in place.
 
         Args:
-            batch: dict dictionary to convert from to elasticsearch format.
+            index_name: str index to search
+            query: dict query of update by query
 
-        Yields:
-            dict: items in elasticsearch format.
+        Returns:
+            list[tuple[str, str]]: index name and _id of matching documents
         """
-        for key, row in batch.items():
-            yield {
-                "_index": row.index_name,
-                "_id": key,
-                "_source": asdict(row),
-            }
+        with elasticsearch_available():
+            return [
+                (index_name, hit["_id"])
+                for hit in scan(self.client, index=index_name, query={"query": query}, _source=False)
+            ]
 
-    def get_client(self) -> Elasticsearch:
-        """Get elasticsearch client.
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def update_by_query(self, index_name: str, body: dict) -> None:
+        """Update documents matching query with script, documents changed concurrently are skipped.
+
+        Args:
+            index_name: str index to update
+            body: dict query and script
+        """
+        with elasticsearch_available():
+            self.client.update_by_query(index=index_name, conflicts="proceed", **body)
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def create_versioned_index(self, alias: str) -> Tuple[str, dict]:
+        """Create new version of index for bulk rebuild, refresh and replicas are off until it is finished.
+
+        Only lost connection is retried, other errors of index creation are raised as is,
+        so documents are never loaded to dynamically mapped index.
+
+        Args:
+            alias: str index name from index folder, used as alias of its versions
+
+        Returns:
+            Tuple[str, dict]: new index name and settings to restore after rebuild
+        """
+        with open(os.path.join(self.config.elk_index, "{0}.json".format(alias)), "r") as fl:
+            index_description = json.load(fl)
+        settings = index_description.get("settings", {})
+        restore_settings = {
+            "refresh_interval": settings.get("refresh_interval", "1s"),
+            "number_of_replicas": settings.get("number_of_replicas", self.config.elk_replicas),
+        }
+        index_description["settings"] = {**settings, "refresh_interval": "-1", "number_of_replicas": 0}
+        index_name = "{0}_v{1}".format(alias, datetime.now().strftime("%Y%m%d%H%M%S"))
+        with elasticsearch_available():
+            self.client.indices.create(index=index_name, **index_description)
+        return index_name, restore_settings
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def finish_index(self, index_name: str, restore_settings: dict) -> None:
+        """Restore refresh and replicas of rebuilt index and refresh it.
+
+        Args:
+            index_name: str rebuilt index
+            restore_settings: dict settings returned by create_versioned_index
+        """
+        with elasticsearch_available():
+            self.client.indices.put_settings(index=index_name, settings=restore_settings)
+            self.client.indices.refresh(index=index_name)
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def swap_alias(self, alias: str, index_name: str) -> list[str]:
+        """Point alias to new index in one atomic request, index with alias name is removed in the same request.
+
+        Args:
+            alias: str alias used by readers and incremental loader
+            index_name: str new index
+
+        Returns:
+            list[str]: indexes alias pointed to before
+        """
+        alias_actions = [{"add": {"index": index_name, "alias": alias}}]
+        old_indexes = []
+        with elasticsearch_available():
+            if self.client.indices.exists_alias(name=alias):
+                old_indexes = list(self.client.indices.get_alias(name=alias).keys())
+                alias_actions.extend({"remove": {"index": old_index, "alias": alias}} for old_index in old_indexes)
+            elif self.client.indices.exists(index=alias):
+                alias_actions.append({"remove_index": {"index": alias}})
+            self.client.indices.update_aliases(actions=alias_actions)
+        return old_indexes
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def delete_indexes(self, index_names: list[str]) -> None:
+        """Delete indexes.
+
+        Args:
+            index_names: list[str] indexes to delete
+        """
+        with elasticsearch_available():
+            for index_name in index_names:
+                self.client.options(ignore_status=NOT_FOUND).indices.delete(index=index_name)
+
+    def make_client(self) -> Elasticsearch:
+        """Make elasticsearch client, one client is kept for the whole ELKLoader life.
 
         Returns:
             Elasticsearch: client to elasticsearch
@@ -104,4 +497,49 @@ class ELKLoader:
         return Elasticsearch(
             hosts="http://{host}:{port}".format(host=self.config.elk_host, port=self.config.elk_port),
             max_retries=0,
+            connections_per_node=max(self.config.elk_bulk_threads, 10),
+        )
+
+    @backoff(logger, start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def _bulk(self, actions: list[dict], outcomes: dict, chunk_size: Optional[int] = None) -> Optional[float]:
+        """Send actions without result yet and collect per document results, lost connection is retried.
+
+        Results survive retries on ConnectionError, so acknowledged documents are not sent twice.
+
+        Args:
+            actions: list[dict] bulk actions
+            outcomes: dict status and error by operation and _id, filled in place
+            chunk_size: Optional[int] number of documents in one request instead of elk_bulk_chunk_size
+
+        Returns:
+            Optional[float]: the longest Retry-After seconds of rejected requests
+        """
+        pending = [action for action in actions if action_key(action) not in outcomes]
+        started = perf_counter()
+        with elasticsearch_available():
+            retry_afters = [
+                collect_result(outcomes, bulk_item)
+                for _, bulk_item in self._stream(pending, chunk_size or self.config.elk_bulk_chunk_size)
+            ]
+        observe_bulk(len(pending), perf_counter() - started)
+        return max((delay for delay in retry_afters if delay is not None), default=None)
+
+    def _stream(self, actions: Iterable[dict], chunk_size: int) -> Iterable[tuple[bool, dict]]:
+        if self.config.elk_bulk_threads > 1:
+            return parallel_bulk(
+                client=self.client,
+                actions=actions,
+                thread_count=self.config.elk_bulk_threads,
+                chunk_size=chunk_size,
+                max_chunk_bytes=self.config.elk_bulk_max_chunk_bytes,
+                raise_on_error=False,
+                raise_on_exception=False,
+            )
+        return streaming_bulk(
+            client=self.client,
+            actions=actions,
+            chunk_size=chunk_size,
+            max_chunk_bytes=self.config.elk_bulk_max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False,
         )
@@ -0,0 +1,145 @@
+"""Content hashes of documents loaded to Elasticsearch."""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from typing import Iterable, Optional
+
+from metrics import registry
+
+DIGEST_SIZE = 16
+
+SQL_CREATE_FINGERPRINTS = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    index_name TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (index_name, doc_id)
+) WITHOUT ROWID;
+"""
+
+SQL_GET_FINGERPRINT = """
+SELECT digest FROM fingerprints WHERE index_name = ? AND doc_id = ?;
+"""
+
+SQL_DELETE_FINGERPRINT = """
+DELETE FROM fingerprints WHERE index_name = ? AND doc_id = ?;
+"""
+
+SQL_SAVE_FINGERPRINT = """
+INSERT OR REPLACE INTO fingerprints (index_name, doc_id, digest) VALUES (?, ?, ?);
+"""
+
+
+def digest(source: dict) -> bytes:
+    """Hash document source.
+
+    Args:
+        source: dict document _source
+
+    Returns:
+        bytes: DIGEST_SIZE bytes digest
+    """
+    encoded = json.dumps(source, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=DIGEST_SIZE).digest()
+
+
+class FingerprintCache:  # noqa: WPS214 memory layer needs its own lookup and eviction
+    """Hashes of loaded documents stored on disk, recently used hashes are kept in memory."""
+
+    def __init__(self, path: str, memory_size: int = 100000) -> None:
+        """Init cache.
+
+        Args:
+            path: str sqlite file with hashes
+            memory_size: int number of hashes kept in memory
+        """
+        self.memory_size = memory_size
+        self.memory: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(SQL_CREATE_FINGERPRINTS)
+        self.db.commit()
+        self.counts = Counter()
+
+    def is_unchanged(self, index_name: str, doc_id: str, source_digest: bytes) -> bool:
+        """Check if document with the same content was already loaded.
+
+        Args:
+            index_name: str index of document
+            doc_id: str document _id
+            source_digest: bytes hash of document source
+
+        Returns:
+            bool: True if loaded document has the same hash
+        """
+        with self.lock:
+            unchanged = self._get(index_name, doc_id) == source_digest
+            self.counts.update(checked=1, skipped=int(unchanged))
+        registry.inc("etl_fingerprint_checked_total")
+        if unchanged:
+            registry.inc("etl_fingerprint_skipped_total")
+        return unchanged
+
+    def update(self, fingerprints: Iterable[tuple[str, str, bytes]]) -> None:
+        """Save hashes of documents acknowledged by Elasticsearch.
+
+        Args:
+            fingerprints: Iterable[tuple[str, str, bytes]] index name, document _id and hash
+        """
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return
+        with self.lock:
+            self.db.executemany(SQL_SAVE_FINGERPRINT, fingerprints)
+            self.db.commit()
+            for index_name, doc_id, source_digest in fingerprints:
+                self._remember((index_name, doc_id), source_digest)
+
+    def forget(self, keys: Iterable[tuple[str, str]]) -> None:
+        """Remove hashes of documents changed in place, so their next full version is always loaded.
+
+        Args:
+            keys: Iterable[tuple[str, str]] index name and document _id
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        with self.lock:
+            self.db.executemany(SQL_DELETE_FINGERPRINT, keys)
+            self.db.commit()
+            for key in keys:
+                self.memory.pop(key, None)
+
+    def report(self) -> None:
+        """Expose share of documents skipped as unchanged and share of hashes found in memory as gauges."""
+        with self.lock:
+            counts = self.counts.copy()
+        checked = counts["checked"] or 1
+        registry.set("etl_fingerprint_skip_rate", value=counts["skipped"] / checked)
+        registry.set("etl_fingerprint_memory_hit_rate", value=counts["memory_hits"] / checked)
+
+    def close(self) -> None:
+        """Close sqlite file."""
+        with self.lock:
+            self.db.close()
+
+    def _get(self, index_name: str, doc_id: str) -> Optional[bytes]:
+        key = (index_name, doc_id)
+        known_digest = self.memory.get(key)
+        if known_digest is not None:
+            self.counts["memory_hits"] += 1
+            self.memory.move_to_end(key)
+            return known_digest
+        row = self.db.execute(SQL_GET_FINGERPRINT, key).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def _remember(self, key: tuple[str, str], source_digest: bytes) -> None:
+        self.memory[key] = source_digest
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
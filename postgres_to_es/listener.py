@@ -0,0 +1,87 @@
+"""Wait for change notifications from postgress."""
+import logging
+import select
+from typing import Optional
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from db import DBConnector
+from sql import SQL_CREATE_NOTIFY_TRIGGERS, SQL_LISTEN
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+
+class ChangeListener:
+    """LISTEN for notifications sent by triggers on tracked tables."""
+
+    def __init__(self, connector: DBConnector, channel: str = "etl_changes", install_triggers: bool = False) -> None:
+        """Init listener.
+
+        Args:
+            connector: DBConnector to open dedicated listening connection
+            channel: str notification channel name
+            install_triggers: bool create notify triggers on content.film_work, content.person and content.genre
+        """
+        self.connector = connector
+        self.channel = channel
+        self.conn: Optional[_connection] = None
+        if install_triggers:
+            self.install_triggers()
+
+    def install_triggers(self) -> None:
+        """Create or replace notify triggers."""
+        with self.connector.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SQL_CREATE_NOTIFY_TRIGGERS.format(channel=self.channel))
+            conn.commit()
+
+    def listen(self) -> _connection:
+        """Open listening connection if it is not opened yet.
+
+        Returns:
+            _connection: connection subscribed to channel
+        """
+        if self.conn is None or self.conn.closed:
+            self.conn = self.connector.get_connection()
+            self.conn.autocommit = True
+            with self.conn.cursor() as cursor:
+                cursor.execute(SQL_LISTEN.format(channel=self.channel))
+        return self.conn
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for notification no longer than timeout.
+
+        Args:
+            timeout: float maximal waiting time in seconds
+
+        Returns:
+            bool: True if notification was received
+        """
+        conn = self.listen()
+        try:
+            notified = self._poll(conn, timeout)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+            logger.exception(error)
+            conn.close()
+            return False
+        conn.notifies.clear()
+        return notified
+
+    def close(self) -> None:
+        """Close listening connection."""
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+
+    def _poll(self, conn: _connection, timeout: float) -> bool:
+        if conn.notifies:
+            return True
+        readable, _, _ = select.select([conn], [], [], timeout)
+        if not readable:
+            return False
+        conn.poll()
+        return bool(conn.notifies)
@@ -1,32 +1,356 @@
 """Loader."""
+import asyncio
+import atexit
+import signal
+from contextlib import AsyncExitStack, ExitStack, closing
 from time import sleep
+from typing import TYPE_CHECKING, Optional
 
+from batcher import BulkSizer
+from coalescer import Coalescer
 from db import DBConnector
 from elk import ELKLoader
-from producer import BaseProducer, schemas
-from settings import ElkSettings, PosgressSettings
-from state import JsonFileStorage, State
-from transformator import transform_lists_to_dc
+from listener import ChangeListener
+from metrics import start_server
+from pipeline import Pipeline
+from producer import BaseProducer, Schema, schemas
+from replication import ReplicationProducer
+from scheduler import Scheduler
+from settings import (
+    ConnectorSettings,
+    ElkSettings,
+    EtlSettings,
+    IndexsEnum,
+    PosgressSettings,
+)
+from shards import Shard, ShardLease
+from state import JsonFileStorage, PostgresStorage, State
+from tombstones import TombstoneProducer
 
+if TYPE_CHECKING:
+    from async_db import AsyncDBConnector
+    from async_producer import AsyncProducer
 
-def main():
-    connector = DBConnector(PosgressSettings())
 
-    elk_loader = ELKLoader(ElkSettings())
+def shutdown(signum, frame):
+    """Stop loader on SIGTERM, so state is saved and connections are closed by finally blocks.
+
+    Args:
+        signum: signal number
+        frame: current stack frame
+
+    Raises:
+        SystemExit: always
+    """
+    raise SystemExit(0)
+
+
+def build_pipeline(elk_loader: ELKLoader, etl_config: EtlSettings) -> Pipeline:
+    """Create pipeline.
+
+    Args:
+        elk_loader: ELKLoader loader to Elasticsearch
+        etl_config: EtlSettings pipeline options
+
+    Returns:
+        Pipeline: pipeline with adaptive bulk sizing if it is on
+    """
+    sizer = None
+    if etl_config.adaptive_bulk:
+        sizer = BulkSizer(
+            target_bytes=etl_config.bulk_target_bytes,
+            target_latency=etl_config.bulk_target_latency,
+            min_docs=etl_config.bulk_min_docs,
+            max_docs=etl_config.bulk_max_docs,
+            start_docs=etl_config.bulk_start_docs,
+            increment=etl_config.bulk_increment,
+        )
+    return Pipeline(elk_loader, etl_config.queue_size, sizer=sizer, max_wait=etl_config.bulk_max_wait)
+
+
+def build_schemas(shard: Optional[Shard] = None) -> list[Schema]:
+    """Create schemas of producers run by worker.
+
+    Args:
+        shard: Optional[Shard] shard of worker, not sharded schemas are left to the first shard
+
+    Returns:
+        list[Schema]: schemas
+    """
+    return [
+        schema_class(tracked_id=key, related_id="{0}_related".format(key))
+        for key, schema_class in schemas.items()
+        if shard is None or shard.number == 0 or schema_class.sharded
+    ]
+
 
-    state = State(JsonFileStorage('/var/log/elk_service/state.json'))
+def build_producers(
+    connector: DBConnector,
+    state: State,
+    etl_config: EtlSettings,
+    shard: Optional[Shard] = None,
+) -> list:
+    """Create producers of all schemas.
+
+    Args:
+        connector: DBConnector class to work with database
+        state: State shared by all producers
+        etl_config: EtlSettings producers options
+        shard: Optional[Shard] produce only documents of this shard, replication producer is not sharded
+
+    Returns:
+        list: producers, movies producers are wrapped in Coalescer if coalescing is on,
+            tombstone producer is added if deletions are propagated, the only replication producer
+            replaces all of them if changes are read from replication slot
+    """
+    if etl_config.replication_enabled:
+        return [ReplicationProducer(
+            connector,
+            state,
+            slot_name=etl_config.replication_slot,
+            window=etl_config.replication_window,
+            max_ids=etl_config.replication_max_ids,
+            json_documents=etl_config.json_documents,
+            create_slot=etl_config.replication_create_slot,
+            feedback_interval=etl_config.replication_feedback_interval,
+        )]
 
     producers = []
 
-    for key, schema_class in schemas.items():
-        schema = schema_class(tracked_id=key, related_id="{0}_related".format(key))
-        producers.append(BaseProducer(connector, state, schema))
+    for schema in build_schemas(shard):
+        producers.append(BaseProducer(
+            connector,
+            state,
+            schema,
+            page_size=etl_config.page_size,
+            consolidated=etl_config.consolidated_fanout,
+            json_documents=etl_config.json_documents,
+            shard=shard if schema.sharded else None,
+        ))
+
+    if etl_config.coalesce_movies:
+        movies_producers = [
+            producer for producer in producers if producer.schema.index_name == IndexsEnum.movies.value
+        ]
+        producers = [producer for producer in producers if producer not in movies_producers]
+        producers.append(Coalescer(
+            IndexsEnum.movies.value,
+            movies_producers,
+            window=etl_config.coalesce_window,
+            max_ids=etl_config.coalesce_max_ids,
+        ))
+
+    if etl_config.tombstones_enabled:
+        producers.append(TombstoneProducer(
+            connector,
+            state,
+            page_size=etl_config.page_size,
+            install_triggers=etl_config.tombstones_install_triggers,
+            shard=shard,
+        ))
+    return producers
+
+
+def build_async_producers(
+    connector: "AsyncDBConnector",
+    state: State,
+    etl_config: EtlSettings,
+    shard: Optional[Shard] = None,
+) -> list["AsyncProducer"]:
+    """Create async producers of all schemas.
+
+    Args:
+        connector: AsyncDBConnector class to work with database
+        state: State shared by all producers
+        etl_config: EtlSettings producers options
+        shard: Optional[Shard] produce only documents of this shard
+
+    Returns:
+        list[AsyncProducer]: producers
+    """
+    from async_producer import AsyncProducer  # noqa: WPS433, WPS442 optional engine
+
+    return [
+        AsyncProducer(
+            connector,
+            state,
+            schema,
+            page_size=etl_config.page_size,
+            json_documents=etl_config.json_documents,
+            shard=shard if schema.sharded else None,
+        )
+        for schema in build_schemas(shard)
+    ]
+
+
+async def main_async(
+    etl_config: EtlSettings,
+    elk_config: ElkSettings,
+    state: State,
+    shard: Optional[Shard] = None,
+    **run_options,
+) -> None:
+    """Run asyncio engine.
+
+    Args:
+        etl_config: EtlSettings pipeline options
+        elk_config: ElkSettings loader options
+        state: State shared by all producers
+        shard: Optional[Shard] load only documents of this shard
+        run_options: extra run_forever arguments
+    """
+    # asyncpg and asyncio engine modules are imported only when this engine is chosen
+    from async_db import AsyncDBConnector  # noqa: WPS433, WPS442 optional engine
+    from async_elk import AsyncELKLoader  # noqa: WPS433 optional engine
+    from async_pipeline import (  # noqa: WPS433 optional engine
+        AsyncPipeline,
+        AsyncScheduler,
+    )
+
+    connector = AsyncDBConnector(PosgressSettings(), ConnectorSettings())
+    elk_loader = AsyncELKLoader(elk_config)
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(connector.close)
+        stack.push_async_callback(elk_loader.close)
+        await connector.connect()
+        await elk_loader.create_indexs()
+        scheduler = AsyncScheduler(
+            AsyncPipeline(elk_loader, etl_config.queue_size),
+            build_async_producers(connector, state, etl_config, shard),
+            workers=etl_config.workers,
+            quantum=etl_config.quantum,
+            index_limits=etl_config.index_limits,
+        )
+        await scheduler.run_forever(
+            start_sleep_time=etl_config.idle_sleep_start,
+            factor=etl_config.idle_sleep_factor,
+            border_sleep_time=etl_config.idle_sleep_border,
+            **run_options,
+        )
+
+
+def run(connector: DBConnector, etl_config: EtlSettings, shard: Optional[Shard] = None, **run_options) -> None:
+    """Load changes until run_forever of scheduler returns.
+
+    Args:
+        connector: DBConnector class to work with database
+        etl_config: EtlSettings pipeline options
+        shard: Optional[Shard] load only documents of this shard with its own state and files
+        run_options: extra run_forever arguments
+    """
+    elk_config = ElkSettings()
+    state_file_path = etl_config.state_file_path
+    if shard is not None:
+        elk_config = elk_config.copy(update={
+            'elk_fingerprint_path': shard.path(elk_config.elk_fingerprint_path),
+            'elk_dead_letter_path': shard.path(elk_config.elk_dead_letter_path),
+        })
+        state_file_path = shard.path(state_file_path)
+
+    if etl_config.state_backend == 'postgres':
+        # asyncio engine sends no queries through sync connector, so state can not wait for one
+        piggyback = etl_config.state_piggyback and etl_config.engine != 'asyncio'
+        storage = PostgresStorage(connector, piggyback=piggyback, namespace=shard.name if shard else '')
+    else:
+        storage = JsonFileStorage(state_file_path)
+    state = State(storage, flush_interval=etl_config.state_flush_interval)
+
+    with closing(state):
+        if etl_config.engine == 'asyncio':
+            asyncio.run(main_async(etl_config, elk_config, state, shard, **run_options))
+            return
+        run_threads(connector, etl_config, elk_config, state, shard, **run_options)
+
+
+def build_listener(connector: DBConnector, etl_config: EtlSettings) -> Optional[ChangeListener]:
+    """Create listener of change notifications.
+
+    Args:
+        connector: DBConnector class to work with database
+        etl_config: EtlSettings notifications options
+
+    Returns:
+        Optional[ChangeListener]: listener or None if notifications are off
+    """
+    if not etl_config.notify_enabled:
+        return None
+    return ChangeListener(
+        connector,
+        channel=etl_config.notify_channel,
+        install_triggers=etl_config.notify_install_triggers,
+    )
+
+
+def run_threads(  # noqa: WPS211 the same engine arguments as main_async
+    connector: DBConnector,
+    etl_config: EtlSettings,
+    elk_config: ElkSettings,
+    state: State,
+    shard: Optional[Shard] = None,
+    **run_options,
+) -> None:
+    """Run threads engine.
+
+    Args:
+        connector: DBConnector class to work with database
+        etl_config: EtlSettings pipeline options
+        elk_config: ElkSettings loader options
+        state: State shared by all producers
+        shard: Optional[Shard] load only documents of this shard
+        run_options: extra run_forever arguments
+    """
+    elk_loader = ELKLoader(elk_config)
+
+    scheduler = Scheduler(
+        build_pipeline(elk_loader, etl_config),
+        build_producers(connector, state, etl_config, shard),
+        workers=etl_config.workers,
+        quantum=etl_config.quantum,
+        index_limits=etl_config.index_limits,
+    )
+
+    listener = build_listener(connector, etl_config)
+
+    with ExitStack() as stack:
+        stack.callback(elk_loader.close)
+        if listener is not None:
+            stack.callback(listener.close)
+        stack.callback(scheduler.close)
+        scheduler.run_forever(
+            sleep if listener is None else listener.wait,
+            start_sleep_time=etl_config.idle_sleep_start,
+            factor=etl_config.idle_sleep_factor,
+            border_sleep_time=etl_config.idle_sleep_border,
+            **run_options,
+        )
+
+
+def main():
+    """Run loader, wait for a free shard and load it while its lease is held if documents are sharded."""
+    signal.signal(signal.SIGTERM, shutdown)
+
+    etl_config = EtlSettings()
+
+    if etl_config.metrics_enabled:
+        start_server(etl_config.metrics_host, etl_config.metrics_port)
+
+    connector = DBConnector(PosgressSettings(), ConnectorSettings())
+
+    if etl_config.shards <= 1:
+        run(connector, etl_config)
+        return
 
-    while True:
-        for producer in producers:
-            for pg_data in producer.get_results():
-                elk_loader.load(transform_lists_to_dc(pg_data))
-        sleep(10)
+    lease = ShardLease(connector, etl_config.shards, etl_config.shard_lock_id)
+    atexit.register(lease.release)
+    while True:  # noqa: WPS457 worker takes next shard until it is stopped by SIGTERM
+        shard = lease.wait(
+            sleep,
+            start_sleep_time=etl_config.idle_sleep_start,
+            factor=etl_config.idle_sleep_factor,
+            border_sleep_time=etl_config.idle_sleep_border,
+        )
+        run(connector, etl_config, shard, keep_running=lease.is_held)
+        lease.release()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,249 @@
+"""Counters, gauges and histograms exposed in Prometheus text format on local /metrics endpoint.
+
+Metrics are off by default, then every call returns right away.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Generator, Optional
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def labels_key(labels: Optional[dict]) -> tuple:
+    """Get hashable labels.
+
+    Args:
+        labels: Optional[dict] label names and values
+
+    Returns:
+        tuple: sorted label pairs
+    """
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    """Format labels for text exposition.
+
+    Args:
+        key: tuple sorted label pairs
+        extra: Optional[tuple] label pair added after others
+
+    Returns:
+        str: labels in curly brackets or empty string
+    """
+    pairs = key + (extra,) if extra else key
+    if not pairs:
+        return ""
+    formatted = ",".join('{0}="{1}"'.format(name, escape_label(label)) for name, label in pairs)
+    return "{{{0}}}".format(formatted)
+
+
+def escape_label(label: object) -> str:
+    """Escape label value for text exposition.
+
+    Args:
+        label: object label value
+
+    Returns:
+        str: value with escaped backslashes and quotes
+    """
+    return str(label).replace("\\", r"\\").replace('"', r'\"')
+
+
+def render_samples(kind: str, metrics: dict[str, dict[tuple, float]]) -> list[str]:
+    """Format counters or gauges.
+
+    Args:
+        kind: str metric type
+        metrics: dict[str, dict[tuple, float]] samples by labels by metric name
+
+    Returns:
+        list[str]: exposition lines
+    """
+    lines = []
+    for name, series in sorted(metrics.items()):
+        lines.append("# TYPE {0} {1}".format(name, kind))
+        lines.extend(
+            "{0}{1} {2}".format(name, format_labels(key), sample)
+            for key, sample in series.items()
+        )
+    return lines
+
+
+def render_histograms(histograms: dict[str, dict[tuple, list]]) -> list[str]:
+    """Format histograms.
+
+    Args:
+        histograms: dict[str, dict[tuple, list]] bucket counts and sum by labels by metric name
+
+    Returns:
+        list[str]: exposition lines
+    """
+    lines = []
+    for name, series in sorted(histograms.items()):
+        lines.append("# TYPE {0} histogram".format(name))
+        for key, histogram in series.items():
+            lines.extend(histogram_lines(name, key, *histogram))
+    return lines
+
+
+def histogram_lines(name: str, key: tuple, counts: list[int], total: float) -> list[str]:
+    """Format cumulative buckets, sum and count of one histogram series.
+
+    Args:
+        name: str metric name
+        key: tuple sorted label pairs
+        counts: list[int] observations per bucket, the last one is above all bounds
+        total: float sum of observations
+
+    Returns:
+        list[str]: exposition lines
+    """
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS + ("+Inf",), counts):
+        cumulative += count
+        lines.append("{0}_bucket{1} {2}".format(name, format_labels(key, ("le", bound)), cumulative))
+    lines.append("{0}_sum{1} {2}".format(name, format_labels(key), total))
+    lines.append("{0}_count{1} {2}".format(name, format_labels(key), cumulative))
+    return lines
+
+
+class Registry:
+    """Thread safe storage of metrics values."""
+
+    def __init__(self) -> None:
+        """Init empty registry, metrics are collected only after it is enabled."""
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.gauges: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, list]] = {}
+
+    def inc(self, name: str, labels: Optional[dict] = None, value: float = 1) -> None:  # noqa: WPS110 sample value
+        """Increase counter.
+
+        Args:
+            name: str metric name
+            labels: Optional[dict] label names and values
+            value: float increment
+        """
+        if not self.enabled:
+            return
+        key = labels_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, labels: Optional[dict] = None, value: float = 0) -> None:  # noqa: WPS110 sample value
+        """Set gauge.
+
+        Args:
+            name: str metric name
+            labels: Optional[dict] label names and values
+            value: float gauge value
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges.setdefault(name, {})[labels_key(labels)] = value
+
+    def observe(self, name: str, labels: Optional[dict] = None, value: float = 0) -> None:  # noqa: WPS110 sample value
+        """Add value to histogram.
+
+        Args:
+            name: str metric name
+            labels: Optional[dict] label names and values
+            value: float observed value, seconds for timings
+        """
+        if not self.enabled:
+            return
+        key = labels_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = [[0 for _ in range(len(BUCKETS) + 1)], 0]
+            histogram = series[key]
+            histogram[0][bisect_left(BUCKETS, value)] += 1
+            histogram[1] += value
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[dict] = None) -> Generator[None, None, None]:
+        """Observe time spent inside with block in histogram.
+
+        Args:
+            name: str metric name
+            labels: Optional[dict] label names and values
+
+        Yields:
+            None
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, labels, time.perf_counter() - started)
+
+    def render(self) -> str:
+        """Get all metrics in Prometheus text format.
+
+        Returns:
+            str: metrics exposition
+        """
+        with self.lock:
+            lines = [
+                *render_samples("counter", self.counters),
+                *render_samples("gauge", self.gauges),
+                *render_histograms(self.histograms),
+            ]
+        return "".join("{0}\n".format(line) for line in lines)
+
+
+registry = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve registry on /metrics."""
+
+    def do_GET(self) -> None:  # noqa: N802 name is defined by BaseHTTPRequestHandler
+        """Send metrics in text exposition format."""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = registry.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message_format: str, *args) -> None:
+        """Do not log scrapes to stderr.
+
+        Args:
+            message_format: str message format
+            args: message arguments
+        """
+
+
+def start_server(host: str = "127.0.0.1", port: int = 9108) -> ThreadingHTTPServer:
+    """Turn metrics on and serve them in background thread.
+
+    Args:
+        host: str address to listen on
+        port: int port to listen on
+
+    Returns:
+        ThreadingHTTPServer: running server
+    """
+    registry.enabled = True
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,25 @@
+"""Scripts to update persons index documents in place when films change."""
+
+# add or replace params.films entries of person document
+PAINLESS_SET_PERSON_FILMS = """
+if (ctx._source.films == null) { ctx._source.films = []; }
+if (ctx._source.film_ids == null) { ctx._source.film_ids = []; }
+for (film in params.films) {
+    String filmId = film.film_id;
+    ctx._source.films.removeIf(item -> item.film_id == filmId);
+    ctx._source.films.add(film);
+    if (!ctx._source.film_ids.contains(filmId)) { ctx._source.film_ids.add(filmId); }
+}
+"""
+
+# remove films from persons which are not linked to them any more, params.links maps film id to linked person ids
+PAINLESS_UNLINK_PERSON_FILMS = """
+boolean changed = false;
+for (entry in params.links.entrySet()) {
+    if (entry.getValue().contains(ctx._source.uuid)) { continue; }
+    String filmId = entry.getKey();
+    if (ctx._source.films != null && ctx._source.films.removeIf(item -> item.film_id == filmId)) { changed = true; }
+    if (ctx._source.film_ids != null && ctx._source.film_ids.removeIf(item -> item == filmId)) { changed = true; }
+}
+if (!changed) { ctx.op = 'noop'; }
+"""
@@ -0,0 +1,163 @@
+"""Extract, transform and load stages running concurrently."""
+import threading
+from contextlib import closing
+from queue import Empty, Full, Queue
+from typing import Any, Callable, Iterable, Optional
+
+from batcher import AdaptiveBatcher, BulkSizer
+from elk import ELKLoader
+from metrics import registry
+from producer import BaseProducer
+from transformator import transform_lists_to_dc
+
+STOP = object()
+TICK = object()
+POLL_TIMEOUT = 0.5
+
+
+class PipelineStoppedError(Exception):
+    """Raised in stage when other stage has failed."""
+
+
+class Pipeline:  # noqa: WPS214 stages and queue helpers share stop event and error list
+    """Run producer, transformer and loader in separate threads joined by bounded queues.
+
+    Batches keep producer order through all stages, so checkpoint of a batch is saved
+    only after this batch and all batches before it are loaded to Elasticsearch.
+    """
+
+    def __init__(
+        self,
+        elk_loader: ELKLoader,
+        queue_size: int = 4,
+        sizer: Optional[BulkSizer] = None,
+        max_wait: float = 1.0,
+    ) -> None:
+        """Init pipeline.
+
+        Args:
+            elk_loader: ELKLoader loader to Elasticsearch
+            queue_size: int maximal number of batches waiting between two stages
+            sizer: Optional[BulkSizer] regroup documents into requests of adaptive size, one request per batch if None
+            max_wait: float maximal time in seconds document waits for adaptive request to fill up
+        """
+        self.elk_loader = elk_loader
+        self.queue_size = queue_size
+        self.sizer = sizer
+        self.max_wait = max_wait
+
+    def run(self, producer: BaseProducer, max_batches: Optional[int] = None) -> int:  # noqa: WPS210 stage queues
+        """Process producer batches, first error raised in any stage is raised again after all stages stop.
+
+        Args:
+            producer: BaseProducer source of batches
+            max_batches: Optional[int] stop after this number of batches, rest is left for the next run
+
+        Returns:
+            int: number of loaded batches
+        """
+        stop_event = threading.Event()
+        errors = []
+        extracted = Queue(maxsize=self.queue_size)
+        transformed = Queue(maxsize=self.queue_size)
+        stages = [
+            self._spawn(self._extract, stop_event, errors, producer, extracted, max_batches),
+            self._spawn(self._transform, stop_event, errors, extracted, transformed),
+        ]
+        loaded = self._run_stage(self._load, stop_event, errors, producer, transformed)
+        for stage in stages:
+            stage.join()
+        self._reraise(producer, errors)
+        if max_batches is not None and loaded >= max_batches:
+            producer.rollback()
+        return loaded
+
+    def _spawn(self, stage: Callable[..., Any], stop_event: threading.Event, errors: list, *args) -> threading.Thread:
+        thread = threading.Thread(target=self._run_stage, args=(stage, stop_event, errors, *args), daemon=True)
+        thread.start()
+        return thread
+
+    def _reraise(self, producer: BaseProducer, errors: list) -> None:
+        if errors:
+            producer.rollback()
+            raise errors[0]
+
+    def _run_stage(self, stage: Callable[..., Any], stop_event: threading.Event, errors: list, *args) -> Optional[int]:
+        try:
+            return stage(stop_event, *args)
+        except PipelineStoppedError:
+            return None
+        except BaseException as error:  # noqa: WPS424 any failed stage, interrupted one too, stops the others
+            errors.append(error)
+            stop_event.set()
+            return None
+
+    def _put(self, stop_event: threading.Event, queue: Queue, message: Any) -> None:
+        while True:
+            if stop_event.is_set():
+                raise PipelineStoppedError
+            try:
+                queue.put(message, timeout=POLL_TIMEOUT)
+            except Full:
+                continue
+            return
+
+    def _get(self, stop_event: threading.Event, queue: Queue, tick: bool = False) -> Any:
+        while True:
+            if stop_event.is_set():
+                raise PipelineStoppedError
+            try:
+                return queue.get(timeout=POLL_TIMEOUT)
+            except Empty:
+                if tick:
+                    return TICK
+
+    def _extract(
+        self,
+        stop_event: threading.Event,
+        producer: BaseProducer,
+        output: Queue,
+        max_batches: Optional[int],
+    ) -> None:
+        with closing(producer.get_results()) as batches:
+            for number, batch in enumerate(batches, start=1):
+                self._put(stop_event, output, batch)
+                if number == max_batches:
+                    break
+        self._put(stop_event, output, STOP)
+
+    def _transform(self, stop_event: threading.Event, source: Queue, output: Queue) -> None:
+        for batch in self._iterate(stop_event, source):
+            with registry.timer("etl_transform_seconds", {"index": batch.index_name}):
+                docs = transform_lists_to_dc(batch)
+            self._put(stop_event, output, (batch, docs))
+        self._put(stop_event, output, STOP)
+
+    def _load(self, stop_event: threading.Event, producer: BaseProducer, source: Queue) -> int:
+        if self.sizer is not None:
+            return self._load_adaptive(stop_event, producer, source)
+        loaded = 0
+        for batch, docs in self._iterate(stop_event, source):
+            if docs:
+                self.elk_loader.load(docs)
+            producer.commit(batch)
+            loaded += 1
+        return loaded
+
+    def _load_adaptive(self, stop_event: threading.Event, producer: BaseProducer, source: Queue) -> int:
+        batcher = AdaptiveBatcher(self.elk_loader, self.sizer, producer.commit, self.max_wait)
+        for message in self._iterate(stop_event, source, tick=True):
+            if message is TICK:
+                batcher.tick()
+                continue
+            batcher.add(*message)
+            batcher.tick()
+        batcher.flush()
+        return batcher.committed
+
+    def _iterate(self, stop_event: threading.Event, source: Queue, tick: bool = False) -> Iterable[Any]:
+        while True:
+            message = self._get(stop_event, source, tick)
+            if message is STOP:
+                return
+            yield message
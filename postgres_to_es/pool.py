@@ -0,0 +1,150 @@
+"""Pool of long-lived connections to postgress."""
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Generator
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from metrics import registry
+
+
+class ConnectionPool:  # noqa: WPS214 opening, health check and discard of connections keep slot accounting
+    """Thread safe pool of connections with health check on checkout.
+
+    Checkouts, waits for free connection, reconnects of dead connections and opened connections
+    are counted in metrics registry.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], _connection],
+        min_size: int = 1,
+        max_size: int = 5,
+        health_check: bool = True,
+    ) -> None:
+        """Init pool and open min_size connections.
+
+        Args:
+            connect: Callable which returns new connection, retried with backoff
+            min_size: int number of connections opened on start
+            max_size: int maximal number of opened connections
+            health_check: bool ping connection before giving it out
+        """
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.health_check = health_check
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        for _ in range(self.min_size):
+            self._size += 1
+            self._idle.append(self._open())
+
+    def getconn(self) -> _connection:
+        """Checkout connection from pool, wait if all connections are busy.
+
+        Returns:
+            _connection: healthy connection
+        """
+        registry.inc("etl_pool_checkouts_total")
+        with self._condition:
+            if not self._idle and self._size >= self.max_size:
+                registry.inc("etl_pool_waits_total")
+            while not self._idle and self._size >= self.max_size:
+                self._condition.wait()
+            if self._idle:
+                conn = self._idle.popleft()
+            else:
+                self._size += 1
+                conn = None
+        if conn is None:
+            return self._open()
+        if self._is_alive(conn):
+            return conn
+        if not conn.closed:
+            conn.close()
+        registry.inc("etl_pool_reconnects_total")
+        return self._open()
+
+    def putconn(self, conn: _connection, broken: bool = False) -> None:
+        """Return connection to pool, connections failed on rollback are closed.
+
+        Args:
+            conn: _connection connection taken by getconn
+            broken: bool close connection instead of reuse
+        """
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Generator[_connection, None, None]:
+        """Checkout connection for the time of with block.
+
+        Yields:
+            _connection: healthy connection
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self) -> None:
+        """Close all idle connections."""
+        with self._condition:
+            while self._idle:
+                conn = self._idle.popleft()
+                self._size -= 1
+                if not conn.closed:
+                    conn.close()
+
+    def _open(self) -> _connection:
+        """Open connection for already reserved slot in pool, slot is given back if connection fails.
+
+        Returns:
+            _connection: new connection
+
+        Raises:
+            BaseException: error of connect
+        """
+        try:
+            conn = self.connect()
+        except BaseException:  # noqa: WPS424 slot is given back whatever interrupted connect
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        registry.inc("etl_pool_connections_created_total")
+        return conn
+
+    def _is_alive(self, conn: _connection) -> bool:
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+                conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, conn: _connection) -> None:
+        if not conn.closed:
+            conn.close()
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
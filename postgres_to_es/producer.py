@@ -1,23 +1,51 @@
 """Buisness logic to collect data from database."""
-from dataclasses import dataclass
-from typing import Callable, Generator, Union
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Any, Callable, Generator, Iterable, Optional
 
+import sql as sql_templates
 from db import DBConnector
+from metrics import registry
 from settings import IndexsEnum
-from sql import (
-    SQL_GENRE_GET_FILM_IDs,
-    SQL_GENRE_GET_TRACKED_IDs,
-    SQL_GET_FILMs,
-    SQL_GET_GENREs,
-    SQL_GET_PERSONs,
-    SQL_MOVIE_GET_TRACKED_IDs,
-    SQL_PERSON_GET_FILM_IDs,
-    SQL_PERSON_GET_TRACKED_IDs,
-    SQL_STANDALONE_GENRE_GET_TRACKED_IDs,
-    SQL_STANDALONE_PERSON_GET_TRACKED_IDs,
-)
+from shards import Shard
 from state import State
 
+START_CURSOR = MappingProxyType({"modified": "2000-01-01", "id": "00000000-0000-0000-0000-000000000000"})
+
+# maximal number of recently loaded films sent with every consolidated page, older ones may be loaded again
+SEEN_FILMS_LIMIT = 2000
+
+
+def to_cursor(saved: Any) -> dict[str, str]:
+    """Convert saved checkpoint to (modified, id) cursor.
+
+    Args:
+        saved: Any checkpoint from state, timestamp string saved by previous versions or cursor dict
+
+    Returns:
+        dict[str, str]: cursor
+    """
+    if saved is None:
+        return dict(START_CURSOR)
+    if isinstance(saved, str):
+        return {**START_CURSOR, "modified": saved}
+    return saved
+
+
+def new_cursor(last_modified: datetime, last_id: Any) -> dict[str, str]:
+    """Make cursor pointing to row.
+
+    Args:
+        last_modified: datetime modified of row
+        last_id: Any id of row
+
+    Returns:
+        dict[str, str]: cursor saved in state
+    """
+    return {"modified": last_modified.isoformat(), "id": str(last_id)}
+
 
 @dataclass(frozen=True)
 class Schema:
@@ -29,6 +57,23 @@ class Schema:
     sql_get_tracked_ids: str
     sql_get_data: str
     sql_get_ids: str = ""
+    sql_get_changed_data: str = ""
+    sql_get_data_json: str = ""
+    tracked_table: str = ""
+    transform: str = ""
+    # documents of not sharded schema are produced by worker of the first shard only
+    sharded: bool = True
+    # other indexes written by producer, scheduler does not run it together with their producers
+    written_indexes: tuple[str, ...] = ()
+
+    @property
+    def indexes(self) -> tuple[str, ...]:
+        """Get all indexes written by producer of schema.
+
+        Returns:
+            tuple[str, ...]: own index followed by other written indexes
+        """
+        return (self.index_name, *self.written_indexes)
 
 
 @dataclass(frozen=True)
@@ -36,9 +81,12 @@ class PersonShema(Schema):
     """Dataclass to store SQL queries text templates to database for scanning Person table for index movies."""
 
     index_name: str = IndexsEnum.movies.value
-    sql_get_tracked_ids: str = SQL_PERSON_GET_TRACKED_IDs
-    sql_get_data: str = SQL_GET_FILMs
-    sql_get_ids: str = SQL_PERSON_GET_FILM_IDs
+    sql_get_tracked_ids: str = sql_templates.SQL_PERSON_GET_TRACKED_IDs
+    sql_get_data: str = sql_templates.SQL_GET_FILMs
+    sql_get_data_json: str = sql_templates.SQL_GET_FILMs_JSON
+    sql_get_ids: str = sql_templates.SQL_PERSON_GET_FILM_IDs
+    sql_get_changed_data: str = sql_templates.SQL_PERSON_GET_CHANGED_FILMs
+    tracked_table: str = 'person'
 
 
 @dataclass(frozen=True)
@@ -46,9 +94,12 @@ class GenreShema(Schema):
     """Dataclass to store SQL queries text templates to database for scanning Genres table for index movies."""
 
     index_name: str = IndexsEnum.movies.value
-    sql_get_tracked_ids: str = SQL_GENRE_GET_TRACKED_IDs
-    sql_get_data: str = SQL_GET_FILMs
-    sql_get_ids: str = SQL_GENRE_GET_FILM_IDs
+    sql_get_tracked_ids: str = sql_templates.SQL_GENRE_GET_TRACKED_IDs
+    sql_get_data: str = sql_templates.SQL_GET_FILMs
+    sql_get_data_json: str = sql_templates.SQL_GET_FILMs_JSON
+    sql_get_ids: str = sql_templates.SQL_GENRE_GET_FILM_IDs
+    sql_get_changed_data: str = sql_templates.SQL_GENRE_GET_CHANGED_FILMs
+    tracked_table: str = 'genre'
 
 
 @dataclass(frozen=True)
@@ -56,8 +107,10 @@ class MovieShema(Schema):
     """Dataclass to store SQL queries text templates to database for scanning Movie table for index movies."""
 
     index_name: str = IndexsEnum.movies.value
-    sql_get_tracked_ids: str = SQL_MOVIE_GET_TRACKED_IDs
-    sql_get_data: str = SQL_GET_FILMs
+    sql_get_tracked_ids: str = sql_templates.SQL_MOVIE_GET_TRACKED_IDs
+    sql_get_data: str = sql_templates.SQL_GET_FILMs
+    sql_get_data_json: str = sql_templates.SQL_GET_FILMs_JSON
+    tracked_table: str = 'film_work'
 
 
 @dataclass(frozen=True)
@@ -65,8 +118,9 @@ class GenreIndexSchema(Schema):
     """Dataclass to store SQL queries text templates to database for scanning Genre table for index genre."""
 
     index_name: str = IndexsEnum.genres.value
-    sql_get_tracked_ids: str = SQL_STANDALONE_GENRE_GET_TRACKED_IDs
-    sql_get_data: str = SQL_GET_GENREs
+    sql_get_tracked_ids: str = sql_templates.SQL_STANDALONE_GENRE_GET_TRACKED_IDs
+    sql_get_data: str = sql_templates.SQL_GET_GENREs
+    tracked_table: str = 'genre'
 
 
 @dataclass(frozen=True)
@@ -74,8 +128,33 @@ class PersonIndexSchema(Schema):
     """Dataclass to store SQL queries text templates to database for scanning Person table for index persons."""
 
     index_name: str = IndexsEnum.persons.value
-    sql_get_tracked_ids: str = SQL_STANDALONE_PERSON_GET_TRACKED_IDs
-    sql_get_data: str = SQL_GET_PERSONs
+    sql_get_tracked_ids: str = sql_templates.SQL_STANDALONE_PERSON_GET_TRACKED_IDs
+    sql_get_data: str = sql_templates.SQL_GET_PERSONs
+    tracked_table: str = 'person'
+
+
+@dataclass(frozen=True)
+class PersonFilmSchema(Schema):
+    """Dataclass to store SQL queries text templates to database for scanning Movie table for index persons."""
+
+    index_name: str = IndexsEnum.persons.value
+    sql_get_tracked_ids: str = sql_templates.SQL_MOVIE_GET_TRACKED_IDs
+    sql_get_data: str = sql_templates.SQL_GET_FILM_PERSONs
+    tracked_table: str = 'film_work'
+    transform: str = "{0}_films".format(IndexsEnum.persons.value)
+    # film unlink updates by query persons of all shards
+    sharded: bool = False
+
+
+@dataclass
+class Batch:
+    """Documents data for one index with state checkpoint to save after data is loaded."""
+
+    index_name: str
+    rows: Iterable[Any]
+    checkpoint: dict[str, dict] = field(default_factory=dict)
+    # name of transform of rows, index name is used if it is empty
+    transform: str = ""
 
 
 schemas = {
@@ -84,119 +163,357 @@ schemas = {
     'movie': MovieShema,
     'genre_index': GenreIndexSchema,
     'person_index': PersonIndexSchema,
+    'person_film': PersonFilmSchema,
 }
 
 
-class BaseProducer:
-    """Buisness logic to get list of films with all required for ELS details."""
+class PagingProducer:  # noqa: WPS214, WPS230 cursors and checkpoints of sync and async producers
+    """Cursors, checkpoints and shard filter of producers paging through tracked tables.
 
-    def __init__(self, connector: DBConnector, state: State, schema: Schema) -> None:
-        """Init of Base producer.
+    Nothing here queries database, so the same logic is shared by BaseProducer and AsyncProducer.
+    """
+
+    def __init__(  # noqa: WPS211 producer options
+        self,
+        state: State,
+        schema: Schema,
+        page_size: int = 100,
+        json_documents: bool = False,
+        shard: Optional[Shard] = None,
+    ) -> None:
+        """Init cursors of producer.
 
         Args:
-            connector: DBConnector class to work with database
             state: State class to handle and store state changes
             schema: Dataclass with all required SQL templates
+            page_size: int number of tracked ids in one page
+            json_documents: bool get documents built by database if schema supports it
+            shard: Optional[Shard] produce only documents of this shard, changes are still scanned in full
         """
-        self.connector = connector
         self.state = state
         self.local_state = {}
         self.schema = schema
+        self.page_size = page_size
+        self.shard = shard
+        self.sql_get_data = schema.sql_get_data
+        self.transform = schema.transform or schema.index_name
+        if json_documents and schema.sql_get_data_json:
+            self.sql_get_data = schema.sql_get_data_json
+            self.transform = "{0}_json".format(schema.index_name)
+
+    def commit(self, batch: Batch) -> None:
+        """Save batch checkpoint in persistance storage, call only after batch is loaded.
+
+        Args:
+            batch: Batch loaded batch
+        """
+        for key, cursor in batch.checkpoint.items():
+            self.state.set_state(key, cursor)
+
+    def flush(self) -> None:
+        """Save commited checkpoints right now if state saves them in background."""
+        self.state.flush()
+
+    def rollback(self) -> None:
+        """Forget fetched but not commited progress, next scan starts from persisted state."""
+        self.local_state = {}
+
+    def page_params(self, key: str, extra_params: dict) -> dict:
+        """Get parameters of the next page query.
+
+        Args:
+            key: str name of the metric
+            extra_params: dict extra query parameters
+
+        Returns:
+            dict: cursor, page size and extra parameters
+        """
+        cursor = self.get_cursor(key)
+        return {
+            "last_modified": cursor["modified"],
+            "last_id": cursor["id"],
+            "page_size": self.page_size,
+            **extra_params,
+        }
+
+    def save_page(self, key: str, data_from_db: list) -> None:
+        """Move cursor to the last row of fetched page.
+
+        Args:
+            key: str name of the metric
+            data_from_db: list page rows ordered by (modified, id)
+        """
+        self.count_fetched(key, len(data_from_db))
+        last_id, last_modified = data_from_db[-1][0], data_from_db[-1][1]
+        self.local_state[key] = new_cursor(last_modified, last_id)
 
-    def save_current_ids(self, key: str) -> str:
-        """Save last processed time in persistance storage.
+    def count_fetched(self, query: str, fetched: int) -> None:
+        """Count rows fetched by schema query.
 
         Args:
-            key: str name of saved metric
+            query: str query label
+            fetched: int number of rows
+        """
+        registry.inc("etl_rows_fetched_total", {"schema": self.schema.tracked_id, "query": query}, fetched)
+
+    def related_done(self) -> dict:
+        """Reset related ids cursor once all related pages of tracked ids page are produced.
 
         Returns:
-            str: last processed time
+            dict: checkpoint of tracked ids page
         """
-        last_processed_time = self.get_last_id_time(key)
-        self.state.set_state(key, last_processed_time)
-        return last_processed_time
+        tracked_key = self.schema.tracked_id
+        related_key = self.schema.related_id
+        self.local_state[related_key] = dict(START_CURSOR)
+        return {tracked_key: self.local_state[tracked_key], related_key: dict(START_CURSOR)}
+
+    def lag(self) -> float:
+        """Get time passed since last commited change of tracked table.
+
+        Returns:
+            float: lag in seconds
+        """
+        last_tracked = datetime.fromisoformat(to_cursor(self.state.get_state(self.schema.tracked_id))["modified"])
+        if last_tracked.tzinfo is None:
+            return (datetime.now() - last_tracked).total_seconds()
+        return (datetime.now(timezone.utc) - last_tracked).total_seconds()
+
+    def get_cursor(self, key: str) -> dict[str, str]:
+        """Get (modified, id) of last processed data.
+
+        Args:
+            key: str name of the metric.
+
+        Returns:
+            dict[str, str]: last proccessed modified time and id
+        """
+        local_state = self.local_state.get(key)
+        return to_cursor(self.state.get_state(key) if local_state is None else local_state)
+
+    def template(self, sql: str) -> str:
+        """Get metrics label of schema query, schemas may share the same sql text.
+
+        Args:
+            sql: str sql query of schema
+
+        Returns:
+            str: schema tracked id and name of schema field holding the query
+        """
+        for schema_field in fields(self.schema):
+            if schema_field.name.startswith("sql_") and getattr(self.schema, schema_field.name) == sql:
+                return "{0}:{1}".format(self.schema.tracked_id, schema_field.name)
+        return "{0}:other".format(self.schema.tracked_id)
+
+    def owned(self, doc_ids: list[str]) -> list[str]:
+        """Get ids of documents belonging to producer shard.
+
+        Args:
+            doc_ids: list[str] documents ids
+
+        Returns:
+            list[str]: all ids if producer is not sharded
+        """
+        return doc_ids if self.shard is None else self.shard.filter(doc_ids)
+
+    def convert_ids(self, data_from_db: list[tuple]) -> list[str]:
+        """Convert list items to ids parameter.
+
+        Args:
+            data_from_db: list[tuple]
+
+        Returns:
+            list[str]: ids bound as uuid[] query parameter.
+        """
+        return [str(row[0]) for row in data_from_db]
+
+
+class BaseProducer(PagingProducer):  # noqa: WPS214 plain and consolidated scans of the same schema
+    """Buisness logic to get list of films with all required for ELS details."""
+
+    def __init__(  # noqa: WPS211 producer options
+        self,
+        connector: DBConnector,
+        state: State,
+        schema: Schema,
+        page_size: int = 100,
+        consolidated: bool = False,
+        json_documents: bool = False,
+        shard: Optional[Shard] = None,
+    ) -> None:
+        """Init of Base producer.
+
+        Args:
+            connector: DBConnector class to work with database
+            state: State class to handle and store state changes
+            schema: Dataclass with all required SQL templates
+            page_size: int number of tracked ids in one page
+            consolidated: bool load related films of tracked ids page with one query if schema supports it
+            json_documents: bool get documents built by database if schema supports it
+            shard: Optional[Shard] produce only documents of this shard, changes are still scanned in full
+        """
+        super().__init__(state, schema, page_size=page_size, json_documents=json_documents, shard=shard)
+        self.connector = connector
+        self.consolidated = consolidated
 
     def get_films(
         self,
-        func_name: Callable[[list], Union[str, tuple[str, list]]],
+        func_name: Callable[[list], list[str]],
         sql: str,
         key: str,
         **kwargs,
-    ) -> Generator[Union[str, tuple[str, list]], None, None]:
-        """Get films.
+    ) -> Generator[list[str], None, None]:
+        """Get films page by page ordered by (modified, id).
 
         Args:
             func_name: Callable function apply
             sql: sql query
             key: str name of metric
-            **kwargs: Arbitrary keyword arguments.
+            kwargs: Arbitrary keyword arguments.
 
         Yields:
-            Union[str, tuple[str, list]]: related ids or films list
+            list[str]: tracked or related ids
         """
         while True:
-            data_from_db = self.connector.load_data(sql.format(last_tracked=self.save_current_ids(key), **kwargs))
+            data_from_db = self.connector.load_data(sql, self.page_params(key, kwargs), self.template(sql))
             if not data_from_db:
                 break
-            self.local_state[key] = data_from_db[-1][1].strftime("%Y-%m-%d %H:%M:%S.%f")
+            self.save_page(key, data_from_db)
             yield func_name(data_from_db)
 
-    def load_films(self, film_ids: list) -> tuple[str, list]:
-        """Load films for output results.
+    def fetch_data(self, sql: str, query_params: dict) -> Iterable[Any]:
+        """Fetch documents data, streamed from server side cursor if streaming is enabled.
 
         Args:
-            film_ids: str
+            sql: str sql query to execute
+            query_params: dict query parameters
 
         Returns:
-            tupe[str, list]: films
+            Iterable[Any]: rows list or rows generator
         """
-        return (
-            self.schema.index_name,
-            self.connector.load_data(self.schema.sql_get_data.format(film_ids=self.convert_ids(film_ids))),
-        )
+        if self.connector.connector_config.stream_enabled:
+            return self.count_rows(self.connector.stream_data(sql, query_params, self.template(sql)))
+        rows = self.connector.load_data(sql, query_params, self.template(sql))
+        self.count_fetched("data", len(rows))
+        return rows
 
-    def get_results(self) -> Generator[Union[str, tuple[str, list]], None, None]:
+    def count_rows(self, rows: Iterable[Any]) -> Generator[Any, None, None]:
+        """Count streamed rows.
+
+        Args:
+            rows: Iterable[Any] streamed rows
+
+        Yields:
+            Any: the same rows
+        """
+        fetched = 0
+        try:  # noqa: WPS501 rows read before consumer stopped are counted too
+            for row in rows:
+                fetched += 1
+                yield row
+        finally:
+            self.count_fetched("data", fetched)
+
+    def get_results(self) -> Generator[Batch, None, None]:  # noqa: WPS463 batches are generated
         """Get films.
 
+        Tracked ids checkpoint of related schemas comes with extra empty batch after all related films batches.
+        Related scan interrupted in the middle continues from its saved checkpoint after rollback.
+
+        Yields:
+            Batch: films with checkpoint
+        """
+        if self.consolidated and self.schema.sql_get_changed_data:
+            yield from self.get_changed_results()
+            return
+        yield from (
+            Batch(self.schema.index_name, self.fetch_rows(doc_ids), checkpoint, self.transform)
+            for doc_ids, checkpoint in self.get_dirty_ids()
+        )
+
+    def fetch_rows(self, doc_ids: list[str]) -> Iterable[Any]:
+        """Fetch documents data of ids page.
+
+        Args:
+            doc_ids: list[str] documents ids, page of related ids may have no ids of producer shard
+
+        Returns:
+            Iterable[Any]: rows list or rows generator
+        """
+        return self.fetch_data(self.sql_get_data, {"film_ids": doc_ids}) if doc_ids else []
+
+    def get_dirty_ids(self) -> Generator[tuple, None, None]:
+        """Get ids of documents to reload without loading documents.
+
+        Tracked ids checkpoint of related schemas comes with empty ids list after all related ids pages.
+
         Yields:
-            Union[str, tuple[str, list]] films
+            tuple[list[str], dict]: documents ids and checkpoint to save after they are loaded
         """
-        for tracked_ids in self.get_films(self.convert_ids, self.schema.sql_get_tracked_ids, self.schema.tracked_id):
+        tracked_key = self.schema.tracked_id
+        related_key = self.schema.related_id
+        for tracked_ids in self.get_films(self.convert_ids, self.schema.sql_get_tracked_ids, tracked_key):
             if self.schema.sql_get_ids:
-                self.state.set_state(self.schema.related_id, '2000-01-01')
-                self.local_state[self.schema.related_id] = '2000-01-01'
-                yield from self.get_films(
-                    self.load_films,
+                related_pages = self.get_films(
+                    self.convert_ids,
                     self.schema.sql_get_ids,
-                    self.schema.related_id,
+                    related_key,
                     tracked_ids=tracked_ids,
                 )
-            else:
-                yield (
-                    self.schema.index_name,
-                    self.connector.load_data(self.schema.sql_get_data.format(film_ids=tracked_ids)),
+                yield from (
+                    (self.owned(film_ids), {related_key: self.local_state[related_key]}) for film_ids in related_pages
                 )
+                yield [], self.related_done()
+            else:
+                yield self.owned(tracked_ids), {tracked_key: self.local_state[tracked_key]}
 
-    def get_last_id_time(self, key: str) -> str:
-        """Get time of last processed data.
+    def get_changed_results(self) -> Generator[Batch, None, None]:
+        """Get films of changed tracked ids with one query per page of tracked ids.
 
-        Args:
-            key: str name of the metric.
+        Films recently loaded in the same scan are not loaded again unless tracked id changed after that,
+        only the last SEEN_FILMS_LIMIT of them are remembered, so page query size does not grow with backlog.
 
-        Returns:
-            str: last proccessed time
+        Yields:
+            Batch: films with checkpoint
         """
-        local_state = self.local_state.get(key)
-        last_tracked_id_time = self.state.get_state(key) if local_state is None else local_state
-        return last_tracked_id_time if last_tracked_id_time is not None else '2000-01-01'
+        tracked_key = self.schema.tracked_id
+        sql = self.schema.sql_get_changed_data
+        seen_films = OrderedDict()
+        while True:
+            data_from_db = self.connector.load_data(
+                sql,
+                self.page_params(tracked_key, {"seen_ids": list(seen_films), "seen_at": list(seen_films.values())}),
+                self.template(sql),
+            )
+            if not data_from_db:
+                break
+            self.count_fetched("changed", len(data_from_db))
+            page = data_from_db[0]
+            self.local_state[tracked_key] = new_cursor(page["last_modified"], page["last_id"])
+            yield Batch(
+                self.schema.index_name,
+                self.see_films(seen_films, data_from_db),
+                {tracked_key: self.local_state[tracked_key]},
+            )
+            if page["page_rows"] < self.page_size:
+                break
 
-    def convert_ids(self, data_from_db: list[tuple]) -> str:
-        """Convert list items to string.
+    def see_films(self, seen_films: OrderedDict, data_from_db: list) -> list:
+        """Remember films of consolidated page as recently loaded and get rows of producer shard.
 
         Args:
-            data_from_db: list[tuple]
+            seen_films: OrderedDict read time by film id, only the last SEEN_FILMS_LIMIT films are kept
+            data_from_db: list consolidated page rows, page without films has one row with empty film
 
         Returns:
-            str: joined with commas string.
+            list: film rows to load
         """
-        return ",".join(["'{0}'".format(row[0]) for row in data_from_db])
+        films = [row for row in data_from_db if row["fw_id"] is not None]
+        for film in films:
+            film_id = film["fw_id"]
+            seen_films[film_id] = film["read_at"]
+            seen_films.move_to_end(film_id)
+        while len(seen_films) > SEEN_FILMS_LIMIT:
+            seen_films.popitem(last=False)
+        if self.shard is None:
+            return films
+        return [row for row in films if self.shard.owns(row["fw_id"])]
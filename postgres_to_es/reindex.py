@@ -0,0 +1,288 @@
+"""Rebuild indexes from scratch into new versions and switch aliases to them without downtime.
+
+Run with incremental loader stopped: python reindex.py [movies] [genres] [persons].
+Checkpoints of incremental producers are moved to the moment rebuild started, so changes made
+during rebuild are loaded by incremental loader after it is started again. With etl_shards more than one
+checkpoints of every shard are moved too, state files of shard workers running on other hosts are not
+reachable, such workers have to keep state in postgres.
+"""
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Optional
+from uuid import UUID
+
+from db import DBConnector
+from elk import ELKLoader
+from producer import START_CURSOR, BaseProducer, Batch, schemas
+from settings import (
+    ConnectorSettings,
+    ElkSettings,
+    EtlSettings,
+    IndexsEnum,
+    PosgressSettings,
+)
+from shards import Shard
+from sql import SQL_GET_LAST_TRACKED, SQL_GET_SLICE_IDs
+from state import JsonFileStorage, PostgresStorage, State
+from transformator import transform_lists_to_dc
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+MAX_UUID = UUID("ffffffff-ffff-ffff-ffff-ffffffffffff").int
+
+# schema whose tracked table rows are documents of index
+document_schemas = {
+    IndexsEnum.movies.value: 'movie',
+    IndexsEnum.genres.value: 'genre_index',
+    IndexsEnum.persons.value: 'person_index',
+}
+
+
+def uuid_slices(slices: int) -> list[tuple[str, str]]:
+    """Split uuid space into equal ranges.
+
+    Args:
+        slices: int number of ranges
+
+    Returns:
+        list[tuple[str, str]]: exclusive start and inclusive end of every range
+    """
+    numbers = (MAX_UUID * number // slices for number in range(slices + 1))
+    bounds = [str(UUID(int=bound)) for bound in numbers]
+    return list(zip(bounds, bounds[1:]))
+
+
+class Reindexer:  # noqa: WPS214, WPS230 rebuild options and states of all checkpoints it moves
+    """Load all documents of index into its new version with several connections at once."""
+
+    def __init__(  # noqa: WPS211 every rebuild option is tunable
+        self,
+        connector: DBConnector,
+        elk_loader: ELKLoader,
+        state: State,
+        slices: int = 4,
+        page_size: int = 1000,
+        json_documents: bool = False,
+        shard_states: Optional[list[State]] = None,
+    ) -> None:
+        """Init reindexer.
+
+        Args:
+            connector: DBConnector with connections pool of at least slices size
+            elk_loader: ELKLoader to create indexes and load documents
+            state: State of incremental loader
+            slices: int number of uuid ranges extracted in parallel
+            page_size: int number of documents loaded at once
+            json_documents: bool get documents built by database if schema supports it
+            shard_states: Optional[list[State]] states of shard workers, their checkpoints are moved too
+        """
+        self.connector = connector
+        self.elk_loader = elk_loader
+        self.state = state
+        self.shard_states = shard_states or []
+        self.slices = slices
+        self.page_size = page_size
+        self.json_documents = json_documents
+
+    def reindex(self, index_name: str) -> int:
+        """Rebuild index and switch its alias to new version.
+
+        Args:
+            index_name: str index name used as alias
+
+        Returns:
+            int: number of loaded documents
+        """
+        snapshot = self.snapshot(index_name)
+        new_index, restore_settings = self.elk_loader.create_versioned_index(index_name)
+        loaded = self.load_slices(self.document_producer(index_name), new_index)
+        self.elk_loader.finish_index(new_index, restore_settings)
+        old_indexes = self.elk_loader.swap_alias(index_name, new_index)
+        self.elk_loader.delete_indexes([old_index for old_index in old_indexes if old_index != new_index])
+        self.move_checkpoints(snapshot)
+        return loaded
+
+    def snapshot(self, index_name: str) -> dict[str, dict]:
+        """Get cursors of last changes of all tables tracked for index.
+
+        Args:
+            index_name: str index name
+
+        Returns:
+            dict[str, dict]: cursor of every producer of index
+        """
+        snapshot = {}
+        for key, schema_class in schemas.items():
+            schema = schema_class(tracked_id=key, related_id="{0}_related".format(key))
+            if schema.index_name != index_name:
+                continue
+            last_tracked = self.connector.load_data(SQL_GET_LAST_TRACKED.format(table=schema.tracked_table))
+            snapshot[key] = {
+                "modified": last_tracked[0][1].isoformat(),
+                "id": str(last_tracked[0][0]),
+            } if last_tracked else dict(START_CURSOR)
+        return snapshot
+
+    def move_checkpoints(self, snapshot: dict[str, dict]) -> None:
+        """Save cursors taken before rebuild in incremental loader and shard states.
+
+        Args:
+            snapshot: dict[str, dict] cursor of every producer of index
+        """
+        for state in (self.state, *self.shard_states):
+            for tracked_key, cursor in snapshot.items():
+                state.set_state(tracked_key, cursor)
+                state.set_state("{0}_related".format(tracked_key), dict(START_CURSOR))
+            state.flush()
+
+    def document_producer(self, index_name: str) -> BaseProducer:
+        """Get producer which data query builds documents of index.
+
+        Args:
+            index_name: str index name
+
+        Returns:
+            BaseProducer: producer of index documents
+        """
+        key = document_schemas[index_name]
+        schema = schemas[key](tracked_id=key, related_id="{0}_related".format(key))
+        return BaseProducer(self.connector, self.state, schema, json_documents=self.json_documents)
+
+    def load_slices(self, producer: BaseProducer, new_index: str) -> int:
+        """Load all documents of producer, uuid ranges are loaded in parallel.
+
+        Args:
+            producer: BaseProducer producer of index documents
+            new_index: str index to load documents to
+
+        Returns:
+            int: number of loaded documents
+        """
+        with ThreadPoolExecutor(max_workers=self.slices, thread_name_prefix="slice") as executor:
+            return sum(executor.map(
+                lambda uuid_range: self.load_slice(producer, new_index, *uuid_range),
+                uuid_slices(self.slices),
+            ))
+
+    def load_slice(self, producer: BaseProducer, new_index: str, last_id: str, slice_end: str) -> int:
+        """Load documents with ids in range.
+
+        Args:
+            producer: BaseProducer producer of index documents
+            new_index: str index to load documents to
+            last_id: str range start, not included
+            slice_end: str range end, included
+
+        Returns:
+            int: number of loaded documents
+        """
+        loaded = 0
+        while True:
+            doc_ids = self.slice_page(producer, last_id, slice_end)
+            if not doc_ids:
+                return loaded
+            batch = Batch(producer.schema.index_name, producer.fetch_rows(doc_ids), transform=producer.transform)
+            self.elk_loader.load(transform_lists_to_dc(batch), index_name=new_index)
+            loaded += len(doc_ids)
+            last_id = doc_ids[-1]
+
+    def slice_page(self, producer: BaseProducer, last_id: str, slice_end: str) -> list[str]:
+        """Get page of ids in range.
+
+        Args:
+            producer: BaseProducer producer of index documents
+            last_id: str page start, not included
+            slice_end: str range end, included
+
+        Returns:
+            list[str]: documents ids
+        """
+        rows = self.connector.load_data(SQL_GET_SLICE_IDs.format(table=producer.schema.tracked_table), {
+            "last_id": last_id,
+            "slice_end": slice_end,
+            "page_size": self.page_size,
+        })
+        return producer.convert_ids(rows)
+
+    def close(self) -> None:
+        """Save and close all states, close loader."""
+        for state in (self.state, *self.shard_states):
+            state.close()
+        self.elk_loader.close()
+
+
+def build_shard_states(connector: DBConnector, etl_config: EtlSettings) -> list[State]:
+    """Open states of all shard workers.
+
+    Args:
+        connector: DBConnector class to work with database
+        etl_config: EtlSettings shards and state options
+
+    Returns:
+        list[State]: states of shards, empty if documents are not sharded
+    """
+    if etl_config.shards <= 1:
+        return []
+    states = []
+    for number in range(etl_config.shards):
+        shard = Shard(number, etl_config.shards)
+        if etl_config.state_backend == 'postgres':
+            storage = PostgresStorage(connector, piggyback=False, namespace=shard.name)
+        else:
+            storage = JsonFileStorage(shard.path(etl_config.state_file_path))
+        states.append(State(storage))
+    return states
+
+
+def build_reindexer(connector: DBConnector, etl_config: EtlSettings) -> Reindexer:
+    """Create reindexer with states of incremental loader and all its shards.
+
+    Args:
+        connector: DBConnector class to work with database
+        etl_config: EtlSettings rebuild and state options
+
+    Returns:
+        Reindexer: reindexer owning states and loader
+    """
+    if etl_config.state_backend == 'postgres':
+        storage = PostgresStorage(connector, piggyback=False)
+    else:
+        storage = JsonFileStorage(etl_config.state_file_path)
+    return Reindexer(
+        connector,
+        ELKLoader(ElkSettings(elk_fingerprint_path='')),
+        State(storage),
+        slices=etl_config.reindex_slices,
+        page_size=etl_config.reindex_page_size,
+        json_documents=etl_config.json_documents,
+        shard_states=build_shard_states(connector, etl_config),
+    )
+
+
+def main(index_names: Optional[list[str]] = None):
+    """Rebuild indexes one by one.
+
+    Args:
+        index_names: Optional[list[str]] indexes to rebuild, all indexes if empty
+    """
+    etl_config = EtlSettings()
+    connector = DBConnector(
+        PosgressSettings(),
+        ConnectorSettings(pool_enabled=True, pool_max_size=etl_config.reindex_slices + 1),
+    )
+    reindexer = build_reindexer(connector, etl_config)
+    with closing(connector):
+        with closing(reindexer):
+            for index_name in index_names or [index.value for index in IndexsEnum]:
+                loaded = reindexer.reindex(index_name)
+                logger.warning("Index {0} rebuilt with {1} documents".format(index_name, loaded))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,23 @@
+"""Send bulk actions from dead letter file to Elasticsearch again."""
+import logging
+from contextlib import closing
+
+from elk import ELKLoader
+from settings import ElkSettings
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+
+def main():
+    """Replay dead letter file once."""
+    with closing(ELKLoader(ElkSettings())) as elk_loader:
+        replayed, failed = elk_loader.replay_dead_letters()
+    logger.warning("{0} dead letters replayed, {1} failed again".format(replayed, failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""Changes of tracked tables read from logical replication slot instead of polling modified columns.
+
+Slot has to use wal2json output plugin, database has to run with wal_level=logical. Link tables need
+REPLICA IDENTITY FULL so deleted links carry film and person ids, it is set when slot is created
+by loader. Local check::
+
+    docker run -e POSTGRES_PASSWORD=... debezium/postgres -c wal_level=logical
+    etl_replication_enabled=true etl_replication_create_slot=true python load_data_to_es.py
+"""
+import json
+import logging
+import select
+import threading
+import time
+from contextlib import closing, suppress
+from datetime import datetime, timezone
+from typing import Generator, Iterable, Optional
+
+import psycopg2
+from psycopg2.errors import DuplicateObject
+from psycopg2.extras import LogicalReplicationConnection, ReplicationCursor
+
+from db import DBConnector
+from metrics import registry
+from producer import BaseProducer, Batch, Schema, schemas
+from settings import IndexsEnum
+from sql import (
+    SQL_SET_REPLICA_IDENTITY,
+    SQL_GENRE_GET_ALL_FILM_IDs,
+    SQL_PERSON_GET_ALL_FILM_IDs,
+)
+from state import State
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+ACTIONS = frozenset(('I', 'U', 'D'))
+
+TRACKED_TABLES = (
+    'film_work',
+    'person',
+    'genre',
+    'person_film_work',
+    'genre_film_work',
+    'subscription_film_work',
+)
+
+# producers which data queries build documents of every index
+document_schemas = {
+    IndexsEnum.movies.value: 'movie',
+    IndexsEnum.genres.value: 'genre_index',
+    IndexsEnum.persons.value: 'person_index',
+}
+
+
+class ChangeSet:  # noqa: WPS230 ids are collected per tracked table
+    """Ids of documents to reload and rows to delete collected from replication messages."""
+
+    def __init__(self) -> None:
+        """Init empty change set."""
+        self.films: set[str] = set()
+        self.persons: set[str] = set()
+        self.genres: set[str] = set()
+        self.person_films: set[str] = set()
+        self.genre_films: set[str] = set()
+        self.deleted: dict[str, set[str]] = {'film_work': set(), 'person': set(), 'genre': set()}
+        self.changes = 0
+
+    def __len__(self) -> int:
+        """Get number of applied changes.
+
+        Returns:
+            int: number of applied changes
+        """
+        return self.changes
+
+    def add(self, change: dict) -> None:
+        """Apply one wal2json format 2 change.
+
+        Args:
+            change: dict decoded message
+        """
+        action = change.get('action')
+        table = change.get('table')
+        if action not in ACTIONS or change.get('schema') != 'content' or table not in TRACKED_TABLES:
+            return
+        columns = change.get('identity' if action == 'D' else 'columns', [])
+        fields = {column['name']: column['value'] for column in columns}
+        self.changes += 1
+        if table in self.deleted:
+            self._add_object(table, fields.get('id'), deleted=action == 'D')
+            return
+        if fields.get('film_work_id'):
+            self.films.add(fields['film_work_id'])
+        if fields.get('person_id'):
+            self.persons.add(fields['person_id'])
+
+    def _add_object(self, table: str, object_id: Optional[str], deleted: bool) -> None:
+        if object_id is None:
+            return
+        reloaded = {'film_work': self.films, 'person': self.persons, 'genre': self.genres}[table]
+        if deleted:
+            reloaded.discard(object_id)
+            self.deleted[table].add(object_id)
+            return
+        self.deleted[table].discard(object_id)
+        reloaded.add(object_id)
+        if table == 'person':
+            self.person_films.add(object_id)
+        elif table == 'genre':
+            self.genre_films.add(object_id)
+
+
+class ReplicationProducer:  # noqa: WPS214, WPS230 producer interface plus stream and its keep alive thread
+    """Read changes from replication slot during a window and produce batches of all affected documents.
+
+    Replication producer is used by pipeline and scheduler the same way as BaseProducer. The last batch
+    of every window carries LSN of the last read message, it is acknowledged to the server only after
+    this batch is commited, so changes of failed or interrupted windows are streamed again. While
+    changes are loaded, status is sent from background thread, so server does not drop connection
+    after wal_sender_timeout.
+    """
+
+    def __init__(  # noqa: WPS211 every replication option is tunable
+        self,
+        connector: DBConnector,
+        state: State,
+        slot_name: str = 'etl_slot',
+        window: float = 1.0,
+        max_ids: int = 1000,
+        json_documents: bool = False,
+        create_slot: bool = False,
+        feedback_interval: float = 10.0,
+    ) -> None:
+        """Init replication producer.
+
+        Args:
+            connector: DBConnector class to work with database
+            state: State class to handle and store state changes
+            slot_name: str logical replication slot with wal2json plugin
+            window: float maximal time in seconds to collect changes before loading them
+            max_ids: int number of collected changes which triggers loading before window ends
+            json_documents: bool get movies documents built by database
+            create_slot: bool create slot if it does not exist and set replica identity of link tables
+            feedback_interval: float seconds between status messages sent while stream is not read
+        """
+        self.connector = connector
+        self.state = state
+        self.slot_name = slot_name
+        self.window = window
+        self.max_ids = max_ids
+        self.feedback_interval = feedback_interval
+        self.lock = threading.Lock()
+        self.conn: Optional[LogicalReplicationConnection] = None
+        self.cursor: Optional[ReplicationCursor] = None
+        self.keeper: Optional[threading.Thread] = None
+        self.schema = Schema(
+            tracked_id='replication_lsn',
+            related_id='',
+            index_name='replication',
+            sql_get_tracked_ids='',
+            sql_get_data='',
+            tracked_table=slot_name,
+            transform='tombstones',
+        )
+        self.producers = {
+            index_name: BaseProducer(
+                connector,
+                state,
+                schemas[key](tracked_id=key, related_id="{0}_related".format(key)),
+                json_documents=json_documents,
+            )
+            for index_name, key in document_schemas.items()
+        }
+        self.film_persons = BaseProducer(
+            connector,
+            state,
+            schemas['person_film'](tracked_id='person_film', related_id='person_film_related'),
+        )
+        if create_slot:
+            self.create_slot()
+
+    def create_slot(self) -> None:
+        """Create replication slot unless it exists and let deleted links carry all columns."""
+        self.connector.execute(SQL_SET_REPLICA_IDENTITY)
+        conn = self.connector.get_replication_connection()
+        with closing(conn):
+            with conn.cursor() as cursor:
+                with suppress(DuplicateObject):
+                    cursor.create_replication_slot(self.slot_name, output_plugin='wal2json')
+
+    def start(self) -> ReplicationCursor:
+        """Open replication stream if it is not opened yet, streaming starts after last acknowledged LSN.
+
+        Returns:
+            ReplicationCursor: cursor reading messages
+        """
+        if self.conn is None or self.conn.closed:
+            self.conn = self.connector.get_replication_connection()
+            self.cursor = self.conn.cursor()
+            self.cursor.start_replication(
+                slot_name=self.slot_name,
+                decode=True,
+                options={
+                    'format-version': '2',
+                    'add-tables': ','.join('content.{0}'.format(table) for table in TRACKED_TABLES),
+                },
+            )
+        if self.keeper is None:
+            self.keeper = threading.Thread(target=self.keep_alive, name="replication_feedback", daemon=True)
+            self.keeper.start()
+        return self.cursor
+
+    def keep_alive(self) -> None:
+        """Send status to server periodically, window may take longer to load than wal_sender_timeout.
+
+        Feedback does not move acknowledged LSN, it only repeats the last one sent by commit.
+        """
+        while True:
+            time.sleep(self.feedback_interval)
+            with self.lock:
+                if self.cursor is None or self.conn.closed:
+                    continue
+                try:
+                    self.cursor.send_feedback(force=True)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+                    logger.exception(error)
+
+    def get_results(self) -> Generator[Batch, None, None]:  # noqa: WPS463 generator of batches like BaseProducer
+        """Get documents changed during window.
+
+        Yields:
+            Batch: movies, genres, persons, films of persons and deletions, checkpoint comes with the last one
+        """
+        try:
+            changes, last_lsn = self.read_changes()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+            logger.exception(error)
+            self.close()
+            return
+        if last_lsn is None:
+            return
+        registry.inc("etl_rows_fetched_total", {"schema": self.schema.tracked_id, "query": "changes"}, len(changes))
+        for producer, doc_ids in self._reloads(changes):
+            if doc_ids:
+                yield self._batch(producer, list(doc_ids))
+        yield self._deletions(changes, last_lsn)
+
+    def read_changes(self) -> tuple[ChangeSet, Optional[int]]:
+        """Read messages until window ends or enough changes are collected.
+
+        Returns:
+            tuple[ChangeSet, Optional[int]]: collected changes and LSN of the last message or None
+        """
+        cursor = self.start()
+        changes = ChangeSet()
+        last_lsn = None
+        deadline = time.monotonic() + self.window
+        with self.lock:
+            cursor.send_feedback()
+        while len(changes) < self.max_ids:
+            with self.lock:
+                message = cursor.read_message()
+            if message is None:
+                if not self._wait(cursor, deadline):
+                    break
+                continue
+            last_lsn = message.data_start
+            changes.add(json.loads(message.payload))
+        return changes, last_lsn
+
+    def commit(self, batch: Batch) -> None:
+        """Acknowledge LSN of loaded window to replication slot and save it in state.
+
+        Args:
+            batch: Batch loaded batch
+        """
+        checkpoint = batch.checkpoint.get(self.schema.tracked_id)
+        if checkpoint is None:
+            return
+        with self.lock:
+            if self.cursor is not None and not self.conn.closed:
+                self.cursor.send_feedback(flush_lsn=checkpoint["lsn"])
+        self.state.set_state(self.schema.tracked_id, checkpoint)
+
+    def flush(self) -> None:
+        """Save commited checkpoints right now if state saves them in background."""
+        self.state.flush()
+
+    def rollback(self) -> None:
+        """Drop stream, so not acknowledged changes are streamed again."""
+        self.close()
+
+    def lag(self) -> float:
+        """Get time passed since last acknowledged window was read.
+
+        Returns:
+            float: lag in seconds, 0 if nothing was acknowledged yet
+        """
+        checkpoint = self.state.get_state(self.schema.tracked_id)
+        if not checkpoint:
+            return 0
+        return (datetime.now(timezone.utc) - datetime.fromisoformat(checkpoint["read_at"])).total_seconds()
+
+    def close(self) -> None:
+        """Close replication connection."""
+        with self.lock:
+            if self.conn is not None and not self.conn.closed:
+                self.conn.close()
+            self.conn = None
+            self.cursor = None
+
+    def _reloads(self, changes: ChangeSet) -> list[tuple]:
+        linked_ids = changes.films - changes.deleted['film_work']
+        film_ids = set(linked_ids)
+        film_ids |= self._film_ids(SQL_PERSON_GET_ALL_FILM_IDs, changes.person_films)
+        film_ids |= self._film_ids(SQL_GENRE_GET_ALL_FILM_IDs, changes.genre_films)
+        film_ids -= changes.deleted['film_work']
+        return [
+            (self.producers[IndexsEnum.movies.value], film_ids),
+            (self.producers[IndexsEnum.genres.value], changes.genres),
+            (self.producers[IndexsEnum.persons.value], changes.persons),
+            (self.film_persons, linked_ids),
+        ]
+
+    def _deletions(self, changes: ChangeSet, last_lsn: int) -> Batch:
+        checkpoint = {"lsn": last_lsn, "read_at": datetime.now(timezone.utc).isoformat()}
+        return Batch(
+            self.schema.index_name,
+            [
+                {'table_name': table, 'object_id': object_id, 'restored': False}
+                for table, object_ids in changes.deleted.items()
+                for object_id in object_ids
+            ],
+            {self.schema.tracked_id: checkpoint},
+            self.schema.transform,
+        )
+
+    def _wait(self, cursor: ReplicationCursor, deadline: float) -> bool:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return False
+        select.select([cursor], [], [], timeout)
+        return True
+
+    def _batch(self, producer: BaseProducer, doc_ids: list[str]) -> Batch:
+        return Batch(
+            producer.schema.index_name,
+            producer.fetch_data(producer.sql_get_data, {"film_ids": doc_ids}),
+            transform=producer.transform,
+        )
+
+    def _film_ids(self, sql: str, tracked_ids: Iterable[str]) -> set[str]:
+        tracked_ids = list(tracked_ids)
+        if not tracked_ids:
+            return set()
+        return {str(row[0]) for row in self.connector.load_data(sql, {"tracked_ids": tracked_ids})}
@@ -0,0 +1,139 @@
+"""Run producers concurrently on a shared pool of workers."""
+import logging
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+from decorators import expo
+from metrics import registry
+from pipeline import Pipeline
+from producer import BaseProducer
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+
+class Scheduler:  # noqa: WPS214, WPS230 steps of a pass share scheduling options and report of the last pass
+    """Share workers between producers.
+
+    Every producer runs at most one pipeline at a time and gives its worker back after quantum
+    of batches, so producer with large backlog can not hold all workers. Number of producers
+    working on the same index at the same time is limited by index_limits, one if index is not listed,
+    producer writing several indexes takes a slot of every one of them.
+    """
+
+    def __init__(  # noqa: WPS211 every scheduling option is tunable
+        self,
+        pipeline: Pipeline,
+        producers: list[BaseProducer],
+        workers: int = 3,
+        quantum: int = 10,
+        index_limits: Optional[dict[str, int]] = None,
+    ) -> None:
+        """Init scheduler.
+
+        Args:
+            pipeline: Pipeline to process producer batches
+            producers: list[BaseProducer] producers to run
+            workers: int number of producers running at the same time
+            quantum: int number of batches producer processes before giving worker to the next producer
+            index_limits: Optional[dict[str, int]] maximal number of running producers per index, one by default
+        """
+        self.pipeline = pipeline
+        self.producers = producers
+        self.workers = workers
+        self.quantum = quantum
+        self.index_limits = index_limits or {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="producer")
+        self.last_report = {}
+
+    def run_pass(self) -> dict[str, dict]:
+        """Run all producers until they have no more changes and save their checkpoints.
+
+        Returns:
+            dict[str, dict]: loaded batches and lag of every producer
+        """
+        ready = deque(self.producers)
+        running: dict[Future, BaseProducer] = {}
+        loaded = Counter()
+        while ready or running:
+            self._start(ready, running)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._finish(future, running.pop(future), ready, loaded)
+        return self._report(loaded)
+
+    def run_forever(  # noqa: WPS211 idle backoff is tunable like backoff decorator
+        self,
+        wait_changes: Callable[[float], Any],
+        start_sleep_time: float = 0.5,
+        factor: int = 2,
+        border_sleep_time: int = 10,
+        keep_running: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """Run passes right one after another while there are changes, wait longer and longer when idle.
+
+        Args:
+            wait_changes: Callable waiting given seconds, may return earlier when changes arrive
+            start_sleep_time: float first idle wait
+            factor: int exponential factor
+            border_sleep_time: int maximal idle wait
+            keep_running: Optional[Callable[[], bool]] checked before every pass, run stops once it returns False
+        """
+        delays = expo(start_sleep_time, factor, border_sleep_time)
+        while keep_running is None or keep_running():
+            report = self.run_pass()
+            if any(producer_report["batches"] for producer_report in report.values()):
+                delays = expo(start_sleep_time, factor, border_sleep_time)
+                continue
+            if wait_changes(next(delays)):
+                delays = expo(start_sleep_time, factor, border_sleep_time)
+
+    def close(self) -> None:
+        """Stop workers."""
+        self.executor.shutdown(wait=True)
+
+    def _start(self, ready: deque, running: dict[Future, BaseProducer]) -> None:
+        running_per_index = Counter(
+            index_name for running_producer in running.values() for index_name in running_producer.schema.indexes
+        )
+        # indexes of producers left waiting are not given to producers behind them in the queue,
+        # so producer writing several indexes is not starved by producers of one of them
+        waiting = set()
+        candidates = list(ready)
+        ready.clear()
+        for producer in candidates:
+            if len(running) < self.workers and self._has_capacity(producer, running_per_index, waiting):
+                running[self.executor.submit(self.pipeline.run, producer, self.quantum)] = producer
+                running_per_index.update(producer.schema.indexes)
+            else:
+                waiting.update(producer.schema.indexes)
+                ready.append(producer)
+
+    def _has_capacity(self, producer: BaseProducer, running_per_index: Counter, waiting: set) -> bool:
+        return waiting.isdisjoint(producer.schema.indexes) and all(
+            running_per_index[index_name] < max(self.index_limits.get(index_name, 1), 1)
+            for index_name in producer.schema.indexes
+        )
+
+    def _finish(self, future: Future, producer: BaseProducer, ready: deque, loaded: Counter) -> None:
+        try:
+            batches = future.result()
+        except Exception as error:
+            logger.exception(error)
+            return
+        loaded[producer.schema.tracked_id] += batches
+        if batches >= self.quantum:
+            ready.append(producer)
+
+    def _report(self, loaded: Counter) -> dict[str, dict]:
+        self.last_report = {}
+        for producer in self.producers:
+            producer.flush()
+            tracked_id = producer.schema.tracked_id
+            self.last_report[tracked_id] = {"batches": loaded[tracked_id], "lag": producer.lag()}
+            registry.set("etl_lag_seconds", {"producer": tracked_id}, self.last_report[tracked_id]["lag"])
+        return self.last_report
@@ -1,6 +1,18 @@
-from pydantic import BaseSettings, Field
 from enum import Enum
 
+from pydantic import BaseSettings, Field, root_validator
+
+ENGINES = ('threads', 'asyncio')
+# options implemented by threads engine only
+ASYNC_UNSUPPORTED = (
+    'coalesce_movies',
+    'consolidated_fanout',
+    'adaptive_bulk',
+    'tombstones_enabled',
+    'replication_enabled',
+    'notify_enabled',
+)
+
 
 class PosgressSettings(BaseSettings):
     dbname: str = Field(..., env='pg_dbname')
@@ -10,10 +22,129 @@ class PosgressSettings(BaseSettings):
     port: int = Field(..., env='pg_port')
 
 
+class ConnectorSettings(BaseSettings):
+    """Connection pool, prepared statements and server side cursors of DBConnector."""
+
+    pool_enabled: bool = Field(False, env='pg_pool_enabled')
+    pool_min_size: int = Field(1, env='pg_pool_min_size')
+    pool_max_size: int = Field(5, env='pg_pool_max_size')
+    pool_health_check: bool = Field(True, env='pg_pool_health_check')
+    prepared_enabled: bool = Field(False, env='pg_prepared_enabled')
+    stream_enabled: bool = Field(False, env='pg_stream_enabled')
+    stream_itersize: int = Field(2000, env='pg_stream_itersize')
+
+
 class ElkSettings(BaseSettings):
     elk_host: str = Field(..., env='elk_host')
     elk_port: str = Field(..., env='elk_port')
     elk_index: str = Field(..., env='elk_index')
+    elk_bulk_threads: int = Field(1, env='elk_bulk_threads')
+    elk_bulk_chunk_size: int = Field(500, env='elk_bulk_chunk_size')
+    elk_bulk_max_chunk_bytes: int = Field(100 * 1024 * 1024, env='elk_bulk_max_chunk_bytes')
+    elk_fingerprint_path: str = Field('', env='elk_fingerprint_path')
+    elk_fingerprint_memory_size: int = Field(100000, env='elk_fingerprint_memory_size')
+    elk_replicas: int = Field(1, env='elk_replicas')
+    elk_bulk_max_retries: int = Field(10, env='elk_bulk_max_retries')
+    elk_retry_on_conflict: int = Field(3, env='elk_retry_on_conflict')
+    elk_dead_letter_path: str = Field('/var/log/elk_service/dead_letter.jsonl', env='elk_dead_letter_path')
+
+
+class EtlSettings(BaseSettings):
+    """Pipeline, scheduler and producers options of loader."""
+
+    queue_size: int = Field(4, env='etl_queue_size')
+    page_size: int = Field(100, env='etl_page_size')
+    consolidated_fanout: bool = Field(False, env='etl_consolidated_fanout')
+    json_documents: bool = Field(False, env='etl_json_documents')
+    coalesce_movies: bool = Field(False, env='etl_coalesce_movies')
+    coalesce_window: float = Field(1.0, env='etl_coalesce_window')
+    coalesce_max_ids: int = Field(1000, env='etl_coalesce_max_ids')
+    adaptive_bulk: bool = Field(False, env='etl_adaptive_bulk')
+    bulk_target_bytes: int = Field(5 * 1024 * 1024, env='etl_bulk_target_bytes')
+    bulk_target_latency: float = Field(1.0, env='etl_bulk_target_latency')
+    bulk_min_docs: int = Field(50, env='etl_bulk_min_docs')
+    bulk_max_docs: int = Field(5000, env='etl_bulk_max_docs')
+    bulk_start_docs: int = Field(500, env='etl_bulk_start_docs')
+    bulk_increment: int = Field(50, env='etl_bulk_increment')
+    bulk_max_wait: float = Field(1.0, env='etl_bulk_max_wait')
+    metrics_enabled: bool = Field(False, env='etl_metrics_enabled')
+    metrics_host: str = Field('127.0.0.1', env='etl_metrics_host')
+    metrics_port: int = Field(9108, env='etl_metrics_port')
+    reindex_slices: int = Field(4, env='etl_reindex_slices')
+    reindex_page_size: int = Field(1000, env='etl_reindex_page_size')
+    workers: int = Field(3, env='etl_workers')
+    quantum: int = Field(10, env='etl_quantum')
+    # producers of the same index run one at a time unless index is listed here, documents are written
+    # without versions, so with a higher limit a stale page finishing last overwrites a fresher document
+    index_limits: dict[str, int] = Field({}, env='etl_index_limits')
+    idle_sleep_start: float = Field(0.5, env='etl_idle_sleep_start')
+    idle_sleep_factor: int = Field(2, env='etl_idle_sleep_factor')
+    idle_sleep_border: int = Field(10, env='etl_idle_sleep_border')
+    notify_enabled: bool = Field(False, env='etl_notify_enabled')
+    notify_channel: str = Field('etl_changes', env='etl_notify_channel')
+    notify_install_triggers: bool = Field(False, env='etl_notify_install_triggers')
+    tombstones_enabled: bool = Field(False, env='etl_tombstones_enabled')
+    replication_enabled: bool = Field(False, env='etl_replication_enabled')
+    replication_slot: str = Field('etl_slot', env='etl_replication_slot')
+    replication_create_slot: bool = Field(False, env='etl_replication_create_slot')
+    replication_window: float = Field(1.0, env='etl_replication_window')
+    replication_max_ids: int = Field(1000, env='etl_replication_max_ids')
+    # status is sent to server this often while changes are loaded, has to be shorter than wal_sender_timeout
+    replication_feedback_interval: float = Field(10.0, env='etl_replication_feedback_interval')
+    tombstones_install_triggers: bool = Field(False, env='etl_tombstones_install_triggers')
+    # 'threads' or 'asyncio', asyncio engine runs plain producers of all schemas, options listed in
+    # ASYNC_UNSUPPORTED are rejected with it
+    engine: str = Field('threads', env='etl_engine')
+    # documents are split to shards by uuid, every worker process owns one shard through advisory lock
+    # and keeps its own state, fingerprints and dead letters; changes are read by polling, replication
+    # can not be sharded; state of workers on different hosts has to be kept in postgres
+    shards: int = Field(1, env='etl_shards')
+    shard_lock_id: int = Field(5431, env='etl_shard_lock_id')
+    state_backend: str = Field('file', env='etl_state_backend')
+    state_file_path: str = Field('/var/log/elk_service/state.json', env='etl_state_file_path')
+    state_flush_interval: float = Field(0, env='etl_state_flush_interval')
+    state_piggyback: bool = Field(True, env='etl_state_piggyback')
+
+    @root_validator
+    @classmethod
+    def check_shards(cls, parsed: dict) -> dict:
+        """Reject sharding of replication.
+
+        Args:
+            parsed: dict parsed settings
+
+        Returns:
+            dict: the same settings
+
+        Raises:
+            ValueError: if replication is enabled with more than one shard
+        """
+        if parsed.get('shards', 1) > 1 and parsed.get('replication_enabled'):
+            raise ValueError('replication slot is read by one worker, etl_shards has to be 1 with replication')
+        return parsed
+
+    @root_validator
+    @classmethod
+    def check_engine(cls, parsed: dict) -> dict:
+        """Reject options asyncio engine does not implement, so changes are never silently dropped.
+
+        Args:
+            parsed: dict parsed settings
+
+        Returns:
+            dict: the same settings
+
+        Raises:
+            ValueError: if engine is unknown or asyncio engine is used with unsupported option
+        """
+        engine = parsed.get('engine', 'threads')
+        if engine not in ENGINES:
+            raise ValueError('etl_engine has to be one of {0}'.format(', '.join(ENGINES)))
+        if engine == 'asyncio':
+            enabled = [option for option in ASYNC_UNSUPPORTED if parsed.get(option)]
+            if enabled:
+                raise ValueError('asyncio engine does not support {0}'.format(', '.join(enabled)))
+        return parsed
 
 
 class IndexsEnum(Enum):
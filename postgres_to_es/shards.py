@@ -0,0 +1,176 @@
+"""Split documents between worker processes by uuid and own shards through postgress advisory locks."""
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from db import DBConnector
+from decorators import expo
+from sql import SQL_SHARD_LOCK_HELD, SQL_TRY_SHARD_LOCK
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Part of documents owned by one worker, document belongs to shard number uuid % count."""
+
+    number: int
+    count: int
+
+    @property
+    def name(self) -> str:
+        """Get shard name used in file names, state namespace and logs.
+
+        Returns:
+            str: shard number and count
+        """
+        return "shard-{0}-of-{1}".format(self.number, self.count)
+
+    def owns(self, doc_id: str) -> bool:
+        """Check document belongs to shard, uuid value is used because str hash differs between processes.
+
+        Args:
+            doc_id: str document uuid
+
+        Returns:
+            bool: True if document belongs to shard
+        """
+        return uuid.UUID(str(doc_id)).int % self.count == self.number
+
+    def filter(self, doc_ids: Iterable[str]) -> list[str]:
+        """Get ids of documents belonging to shard.
+
+        Args:
+            doc_ids: Iterable[str] documents uuids
+
+        Returns:
+            list[str]: owned ids in the same order
+        """
+        return [doc_id for doc_id in doc_ids if self.owns(doc_id)]
+
+    def path(self, path: str) -> str:
+        """Get file path of shard, so workers on one host do not share files.
+
+        Args:
+            path: str file path of not sharded worker
+
+        Returns:
+            str: path with shard name before extension, empty if path is empty
+        """
+        if not path:
+            return path
+        root, extension = os.path.splitext(path)
+        return "{0}.{1}{2}".format(root, self.name, extension)
+
+
+class ShardLease:
+    """Own one shard while dedicated session holds advisory lock of it.
+
+    Lock is released by postgress when worker dies or its connection is lost, so shard of stopped
+    worker is taken over by waiting one. Worker has to check is_held between passes and stop
+    loading once it returns False.
+    """
+
+    def __init__(self, connector: DBConnector, count: int, lock_id: int) -> None:
+        """Init lease.
+
+        Args:
+            connector: DBConnector class to work with database
+            count: int number of shards
+            lock_id: int first key of advisory locks, second key is shard number
+        """
+        self.connector = connector
+        self.count = count
+        self.lock_id = lock_id
+        self.conn: Optional[_connection] = None
+        self.shard: Optional[Shard] = None
+
+    def acquire(self) -> Optional[Shard]:
+        """Try to lock any free shard.
+
+        Returns:
+            Optional[Shard]: owned shard, None if all shards are owned by other workers
+        """
+        self.release()
+        conn = self.connector.get_connection()
+        conn.autocommit = True
+        try:
+            number = self._lock_free(conn)
+        except psycopg2.Error as error:
+            logger.exception(error)
+            number = None
+        if number is None:
+            conn.close()
+            return None
+        self.conn = conn
+        self.shard = Shard(number, self.count)
+        logger.info("{0} is owned".format(self.shard.name))
+        return self.shard
+
+    def wait(
+        self,
+        wait: Callable[[float], object],
+        start_sleep_time: float = 0.5,
+        factor: int = 2,
+        border_sleep_time: int = 10,
+    ) -> Shard:
+        """Wait until any shard is free and lock it.
+
+        Args:
+            wait: Callable waiting given seconds
+            start_sleep_time: float first wait
+            factor: int exponential factor
+            border_sleep_time: int maximal wait
+
+        Returns:
+            Shard: owned shard
+        """
+        delays = expo(start_sleep_time, factor, border_sleep_time)
+        while True:
+            shard = self.acquire()
+            if shard is not None:
+                return shard
+            wait(next(delays))
+
+    def is_held(self) -> bool:
+        """Check lock is still held by lease session.
+
+        Returns:
+            bool: False if lease was released or its session is lost
+        """
+        if self.conn is None or self.conn.closed:
+            return False
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(SQL_SHARD_LOCK_HELD, {"lock_id": self.lock_id, "shard": self.shard.number})
+                held = cursor.fetchone()[0]
+        except psycopg2.Error as error:
+            logger.exception(error)
+            held = False
+        if not held:
+            logger.warning("{0} lease is lost".format(self.shard.name))
+        return held
+
+    def release(self) -> None:
+        """Give shard back by closing lease session."""
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+        self.shard = None
+
+    def _lock_free(self, conn: _connection) -> Optional[int]:
+        with conn.cursor() as cursor:
+            for number in range(self.count):
+                cursor.execute(SQL_TRY_SHARD_LOCK, {"lock_id": self.lock_id, "shard": number})
+                if cursor.fetchone()[0]:
+                    return number
+        return None
@@ -2,43 +2,45 @@
 SQL_PERSON_GET_TRACKED_IDs = """
 SELECT id, modified
 FROM content.person
-WHERE modified > '{last_tracked}'
-ORDER BY modified
-LIMIT 100;
+WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY modified, id
+LIMIT %(page_size)s;
 """
 
 SQL_GENRE_GET_TRACKED_IDs = """
 SELECT id, modified
 FROM content.genre
-WHERE modified > '{last_tracked}'
-ORDER BY modified
-LIMIT 100;
+WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY modified, id
+LIMIT %(page_size)s;
 """
 
 SQL_MOVIE_GET_TRACKED_IDs = """
 SELECT id, modified
 FROM content.film_work
-WHERE modified > '{last_tracked}'
-ORDER BY modified
-LIMIT 100;
+WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY modified, id
+LIMIT %(page_size)s;
 """
 
 SQL_PERSON_GET_FILM_IDs = """
 SELECT distinct fw.id, fw.modified
 FROM content.film_work fw
-LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-WHERE pfw.person_id IN ({tracked_ids}) and modified > '{last_tracked}'
-ORDER BY fw.modified
-LIMIT 100;
+JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+WHERE pfw.person_id = ANY(%(tracked_ids)s::uuid[])
+    AND (fw.modified, fw.id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY fw.modified, fw.id
+LIMIT %(page_size)s;
 """
 
 SQL_GENRE_GET_FILM_IDs = """
 SELECT distinct fw.id, fw.modified
-FROM content.genre fw
-LEFT JOIN content.genre_film_work pfw ON pfw.genre_id = fw.id
-WHERE pfw.genre_id IN ({tracked_ids}) and modified > '{last_tracked}'
-ORDER BY fw.modified
-LIMIT 100;
+FROM content.film_work fw
+JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+WHERE gfw.genre_id = ANY(%(tracked_ids)s::uuid[])
+    AND (fw.modified, fw.id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY fw.modified, fw.id
+LIMIT %(page_size)s;
 """
 
 SQL_GET_FILMs = """
@@ -64,38 +66,371 @@ LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
 LEFT JOIN content.genre g ON g.id = gfw.genre_id
 LEFT JOIN content.subscription_film_work sfw ON sfw.film_work_id = fw.id
 LEFT JOIN content.subscription s ON s.id = sfw.subscription_id
-WHERE fw.id IN ({film_ids})
+WHERE fw.id = ANY(%(film_ids)s::uuid[])
 ORDER BY fw.id;
 """
 
+# SQL to build movies documents in database, one row per film with nested lists already aggregated
+SQL_GET_FILMs_JSON = """
+SELECT
+    fw.id as fw_id,
+    fw.title,
+    fw.description,
+    fw.rating,
+    COALESCE(persons.directors, '[]') as directors,
+    COALESCE(persons.actors, '[]') as actors,
+    COALESCE(persons.writers, '[]') as writers,
+    COALESCE(genres.genre, '[]') as genre,
+    COALESCE(subscriptions.subscription, '[]') as subscription
+FROM content.film_work fw
+LEFT JOIN LATERAL (
+    SELECT
+        jsonb_agg(DISTINCT jsonb_build_object('uuid', p.id, 'name', p.full_name))
+            FILTER (WHERE pfw.role = 'director') as directors,
+        jsonb_agg(DISTINCT jsonb_build_object('uuid', p.id, 'name', p.full_name))
+            FILTER (WHERE pfw.role = 'actor') as actors,
+        jsonb_agg(DISTINCT jsonb_build_object('uuid', p.id, 'name', p.full_name))
+            FILTER (WHERE pfw.role = 'writer') as writers
+    FROM content.person_film_work pfw
+    JOIN content.person p ON p.id = pfw.person_id
+    WHERE pfw.film_work_id = fw.id
+) persons ON true
+LEFT JOIN LATERAL (
+    SELECT jsonb_agg(DISTINCT jsonb_build_object('uuid', g.id, 'name', g.name)) as genre
+    FROM content.genre_film_work gfw
+    JOIN content.genre g ON g.id = gfw.genre_id
+    WHERE gfw.film_work_id = fw.id
+) genres ON true
+LEFT JOIN LATERAL (
+    SELECT jsonb_agg(DISTINCT jsonb_build_object('uuid', s.id, 'name', s.name)) as subscription
+    FROM content.subscription_film_work sfw
+    JOIN content.subscription s ON s.id = sfw.subscription_id
+    WHERE sfw.film_work_id = fw.id
+) subscriptions ON true
+WHERE fw.id = ANY(%(film_ids)s::uuid[])
+ORDER BY fw.id;
+"""
+
+# SQL to resolve page of changed persons to their films and load films in one round trip,
+# films already loaded in this pass after the person change are skipped
+SQL_PERSON_GET_CHANGED_FILMs = """
+WITH changed AS (
+    SELECT id, modified
+    FROM content.person
+    WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+    ORDER BY modified, id
+    LIMIT %(page_size)s
+),
+last_changed AS (
+    SELECT id AS last_id, modified AS last_modified, (SELECT count(*) FROM changed) AS page_rows
+    FROM changed
+    ORDER BY modified DESC, id DESC
+    LIMIT 1
+),
+seen AS (
+    SELECT * FROM unnest(%(seen_ids)s::uuid[], %(seen_at)s::timestamptz[]) AS seen(id, read_at)
+),
+films AS (
+    SELECT link.film_work_id AS id
+    FROM content.person_film_work link
+    JOIN changed c ON c.id = link.person_id
+    GROUP BY link.film_work_id
+    HAVING NOT EXISTS (
+        SELECT 1 FROM seen WHERE seen.id = link.film_work_id AND seen.read_at >= max(c.modified)
+    )
+)
+SELECT lc.last_id, lc.last_modified, lc.page_rows, now() AS read_at, f.*
+FROM last_changed lc
+LEFT JOIN (
+    SELECT distinct
+        fw.id as fw_id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        fw.type,
+        fw.created,
+        fw.modified,
+        pfw.role,
+        p.id,
+        p.full_name,
+        g.name as genre_name,
+        g.id as genre_id,
+        s.name as subscription_name,
+        s.id as subscription_id
+    FROM films
+    JOIN content.film_work fw ON fw.id = films.id
+    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+    LEFT JOIN content.person p ON p.id = pfw.person_id
+    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+    LEFT JOIN content.genre g ON g.id = gfw.genre_id
+    LEFT JOIN content.subscription_film_work sfw ON sfw.film_work_id = fw.id
+    LEFT JOIN content.subscription s ON s.id = sfw.subscription_id
+) f ON true
+ORDER BY f.fw_id;
+"""
+
+# SQL to resolve page of changed genres to their films and load films in one round trip,
+# films already loaded in this pass after the genre change are skipped
+SQL_GENRE_GET_CHANGED_FILMs = """
+WITH changed AS (
+    SELECT id, modified
+    FROM content.genre
+    WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+    ORDER BY modified, id
+    LIMIT %(page_size)s
+),
+last_changed AS (
+    SELECT id AS last_id, modified AS last_modified, (SELECT count(*) FROM changed) AS page_rows
+    FROM changed
+    ORDER BY modified DESC, id DESC
+    LIMIT 1
+),
+seen AS (
+    SELECT * FROM unnest(%(seen_ids)s::uuid[], %(seen_at)s::timestamptz[]) AS seen(id, read_at)
+),
+films AS (
+    SELECT link.film_work_id AS id
+    FROM content.genre_film_work link
+    JOIN changed c ON c.id = link.genre_id
+    GROUP BY link.film_work_id
+    HAVING NOT EXISTS (
+        SELECT 1 FROM seen WHERE seen.id = link.film_work_id AND seen.read_at >= max(c.modified)
+    )
+)
+SELECT lc.last_id, lc.last_modified, lc.page_rows, now() AS read_at, f.*
+FROM last_changed lc
+LEFT JOIN (
+    SELECT distinct
+        fw.id as fw_id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        fw.type,
+        fw.created,
+        fw.modified,
+        pfw.role,
+        p.id,
+        p.full_name,
+        g.name as genre_name,
+        g.id as genre_id,
+        s.name as subscription_name,
+        s.id as subscription_id
+    FROM films
+    JOIN content.film_work fw ON fw.id = films.id
+    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+    LEFT JOIN content.person p ON p.id = pfw.person_id
+    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+    LEFT JOIN content.genre g ON g.id = gfw.genre_id
+    LEFT JOIN content.subscription_film_work sfw ON sfw.film_work_id = fw.id
+    LEFT JOIN content.subscription s ON s.id = sfw.subscription_id
+) f ON true
+ORDER BY f.fw_id;
+"""
+
 # SQL to track and update changes in separate GENREs index
 SQL_STANDALONE_GENRE_GET_TRACKED_IDs = """
 SELECT id, modified
 FROM content.genre
-WHERE modified > '{last_tracked}'
-ORDER BY modified
-LIMIT 100;
+WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY modified, id
+LIMIT %(page_size)s;
 """
 
 SQL_GET_GENREs = """
 SELECT id, name, description
 FROM content.genre 
-WHERE id in ({film_ids});
+WHERE id = ANY(%(film_ids)s::uuid[]);
 """
 
 # SQL to track and update changes in separate PERSONs index
 SQL_STANDALONE_PERSON_GET_TRACKED_IDs = """
 SELECT id, modified
 FROM content.person
-WHERE modified > '{last_tracked}'
-ORDER BY modified
-LIMIT 100;
+WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)
+ORDER BY modified, id
+LIMIT %(page_size)s;
 """
 
 SQL_GET_PERSONs = """
 SELECT p.id, p.full_name, pfw.role, pfw.film_work_id
 FROM content.person p 
 LEFT JOIN content.person_film_work pfw on pfw.person_id = p.id
-WHERE p.id IN ({film_ids})
+WHERE p.id = ANY(%(film_ids)s::uuid[])
 ORDER BY p.id;
 """
+
+# SQL to propagate changed films to persons index, one row per film and linked person
+SQL_GET_FILM_PERSONs = """
+SELECT fw.id AS film_work_id, p.id, p.full_name, array_remove(array_agg(DISTINCT pfw.role), NULL) AS roles
+FROM content.film_work fw
+LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+LEFT JOIN content.person p ON p.id = pfw.person_id
+WHERE fw.id = ANY(%(film_ids)s::uuid[])
+GROUP BY fw.id, p.id, p.full_name
+ORDER BY fw.id;
+"""
+
+# SQL to wake up loader on changes of tracked tables
+SQL_LISTEN = """
+LISTEN {channel};
+"""
+
+SQL_CREATE_NOTIFY_TRIGGERS = """
+CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{channel}', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS etl_notify ON content.film_work;
+CREATE TRIGGER etl_notify AFTER INSERT OR UPDATE ON content.film_work
+    FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_changes();
+
+DROP TRIGGER IF EXISTS etl_notify ON content.person;
+CREATE TRIGGER etl_notify AFTER INSERT OR UPDATE ON content.person
+    FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_changes();
+
+DROP TRIGGER IF EXISTS etl_notify ON content.genre;
+CREATE TRIGGER etl_notify AFTER INSERT OR UPDATE ON content.genre
+    FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_changes();
+"""
+
+# SQL to capture deleted rows of tracked tables, deleted links mark their films as changed
+SQL_CREATE_TOMBSTONE_TRIGGERS = """
+CREATE TABLE IF NOT EXISTS content.deleted_objects (
+    id bigserial PRIMARY KEY,
+    table_name text NOT NULL,
+    object_id uuid NOT NULL,
+    deleted_at timestamp with time zone NOT NULL DEFAULT now()
+);
+ALTER TABLE content.deleted_objects ADD COLUMN IF NOT EXISTS txid bigint NOT NULL DEFAULT txid_current();
+CREATE INDEX IF NOT EXISTS deleted_objects_txid_id_idx ON content.deleted_objects (txid, id);
+
+CREATE OR REPLACE FUNCTION content.log_deleted_object() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.deleted_objects (table_name, object_id) VALUES (TG_TABLE_NAME, OLD.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION content.touch_linked_film() RETURNS trigger AS $$
+BEGIN
+    UPDATE content.film_work SET modified = now() WHERE id = OLD.film_work_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS etl_tombstone ON content.film_work;
+CREATE TRIGGER etl_tombstone AFTER DELETE ON content.film_work
+    FOR EACH ROW EXECUTE FUNCTION content.log_deleted_object();
+
+DROP TRIGGER IF EXISTS etl_tombstone ON content.person;
+CREATE TRIGGER etl_tombstone AFTER DELETE ON content.person
+    FOR EACH ROW EXECUTE FUNCTION content.log_deleted_object();
+
+DROP TRIGGER IF EXISTS etl_tombstone ON content.genre;
+CREATE TRIGGER etl_tombstone AFTER DELETE ON content.genre
+    FOR EACH ROW EXECUTE FUNCTION content.log_deleted_object();
+
+DROP TRIGGER IF EXISTS etl_tombstone ON content.person_film_work;
+CREATE TRIGGER etl_tombstone AFTER DELETE ON content.person_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.touch_linked_film();
+
+DROP TRIGGER IF EXISTS etl_tombstone ON content.genre_film_work;
+CREATE TRIGGER etl_tombstone AFTER DELETE ON content.genre_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.touch_linked_film();
+"""
+
+# rows created again with the same id after deletion are reported as restored and kept in index,
+# log is paged by (txid, id) of rows written by transactions finished before the oldest running one,
+# so row of long transaction commited after later ids were read is never left behind the cursor
+SQL_GET_TOMBSTONEs = """
+SELECT
+    d.id,
+    d.txid,
+    d.deleted_at,
+    d.table_name,
+    d.object_id,
+    CASE d.table_name
+        WHEN 'film_work' THEN EXISTS (SELECT 1 FROM content.film_work t WHERE t.id = d.object_id)
+        WHEN 'person' THEN EXISTS (SELECT 1 FROM content.person t WHERE t.id = d.object_id)
+        WHEN 'genre' THEN EXISTS (SELECT 1 FROM content.genre t WHERE t.id = d.object_id)
+        ELSE false
+    END AS restored
+FROM content.deleted_objects d
+WHERE (d.txid, d.id) > (%(last_txid)s, %(last_id)s)
+    AND d.txid < txid_snapshot_xmin(txid_current_snapshot())
+ORDER BY d.txid, d.id
+LIMIT %(page_size)s;
+"""
+
+# SQL to resolve changes streamed from replication slot to films
+SQL_PERSON_GET_ALL_FILM_IDs = """
+SELECT DISTINCT film_work_id
+FROM content.person_film_work
+WHERE person_id = ANY(%(tracked_ids)s::uuid[]);
+"""
+
+SQL_GENRE_GET_ALL_FILM_IDs = """
+SELECT DISTINCT film_work_id
+FROM content.genre_film_work
+WHERE genre_id = ANY(%(tracked_ids)s::uuid[]);
+"""
+
+# deleted links have to carry film and person ids in replication stream
+SQL_SET_REPLICA_IDENTITY = """
+ALTER TABLE content.person_film_work REPLICA IDENTITY FULL;
+ALTER TABLE content.genre_film_work REPLICA IDENTITY FULL;
+ALTER TABLE content.subscription_film_work REPLICA IDENTITY FULL;
+"""
+
+# SQL to store loader state in database
+SQL_CREATE_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS content.etl_state (
+    key text PRIMARY KEY,
+    value jsonb NOT NULL,
+    modified timestamp with time zone NOT NULL DEFAULT now()
+);
+"""
+
+SQL_GET_STATE = """
+SELECT key, value
+FROM content.etl_state;
+"""
+
+SQL_SAVE_STATE = """
+INSERT INTO content.etl_state (key, value)
+SELECT key, value FROM jsonb_each(%(etl_state)s::jsonb)
+ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, modified = now()
+WHERE content.etl_state.value IS DISTINCT FROM EXCLUDED.value;
+"""
+
+# SQL to rebuild index from scratch by ranges of ids
+SQL_GET_LAST_TRACKED = """
+SELECT id, modified
+FROM content.{table}
+ORDER BY modified DESC, id DESC
+LIMIT 1;
+"""
+
+SQL_GET_SLICE_IDs = """
+SELECT id
+FROM content.{table}
+WHERE id > %(last_id)s::uuid AND id <= %(slice_end)s::uuid
+ORDER BY id
+LIMIT %(page_size)s;
+"""
+
+# SQL to own shard of documents for the life of session, lock is released when connection closes
+SQL_TRY_SHARD_LOCK = """
+SELECT pg_try_advisory_lock(%(lock_id)s, %(shard)s);
+"""
+
+SQL_SHARD_LOCK_HELD = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_locks
+    WHERE locktype = 'advisory' AND pid = pg_backend_pid() AND granted
+        AND classid = %(lock_id)s AND objid = %(shard)s AND objsubid = 2
+);
+"""
@@ -1,7 +1,21 @@
 """Manage state of program."""
 import json
+import logging
+import os
+import tempfile
+import threading
 from abc import ABC, abstractmethod
-from typing import Any
+from contextlib import suppress
+from typing import IO, Any, Optional
+
+from db import DBConnector
+from sql import SQL_CREATE_STATE_TABLE, SQL_GET_STATE, SQL_SAVE_STATE
+
+logger = logging.getLogger(__name__)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")  # noqa: WPS323 logging format
+fh = logging.FileHandler(filename="/var/log/elk_service/exceptions.log")
+fh.setFormatter(formatter)
+logger.addHandler(fh)
 
 
 class BaseStorage(ABC):
@@ -14,6 +28,9 @@ class BaseStorage(ABC):
     def retrieve_state(self) -> dict:
         pass
 
+    def close(self) -> None:
+        """Release storage resources, nothing to release by default."""
+
 
 class JsonFileStorage(BaseStorage):
 
@@ -21,8 +38,15 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: dict) -> None:
-        with open(self.file_path, 'w') as f:
-            json.dump(state, f)
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        temp_file = tempfile.NamedTemporaryFile('w', dir=directory, prefix='.state', delete=False)
+        try:
+            self._replace(temp_file, state)
+        except BaseException:  # noqa: WPS424 unfinished copy is removed whatever interrupted the write
+            # previous state file is left as is, only unfinished copy is removed
+            with suppress(FileNotFoundError):
+                os.remove(temp_file.name)
+            raise
 
     def retrieve_state(self) -> dict:
         try:
@@ -32,16 +56,112 @@ class JsonFileStorage(BaseStorage):
             state = {}
         return state
 
+    def _replace(self, temp_file: IO[str], state: dict) -> None:
+        with temp_file:
+            json.dump(state, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_file.name, self.file_path)
+
+
+class PostgresStorage(BaseStorage):
+    """State kept in database, so workers on different hosts and restarted containers share it."""
+
+    def __init__(self, connector: DBConnector, piggyback: bool = True, namespace: str = '') -> None:
+        """Store state in content.etl_state table.
+
+        Args:
+            connector: DBConnector connection to database
+            piggyback: bool send state update together with the next data query instead of separate statement
+            namespace: str keep keys apart from other workers, stored as '<namespace>/<key>'
+        """
+        self.connector = connector
+        self.piggyback = piggyback
+        self.prefix = '{0}/'.format(namespace) if namespace else ''
+        self.connector.execute(SQL_CREATE_STATE_TABLE)
+
+    def save_state(self, state: dict) -> None:
+        """Upsert state keys.
+
+        Args:
+            state: dict state to save
+        """
+        etl_state = json.dumps({self.prefix + key: saved for key, saved in state.items()})
+        if self.piggyback:
+            self.connector.defer('etl_state', SQL_SAVE_STATE, {'etl_state': etl_state})
+        else:
+            self.connector.execute(SQL_SAVE_STATE, {'etl_state': etl_state})
+
+    def retrieve_state(self) -> dict:
+        """Read keys of namespace.
+
+        Returns:
+            dict: saved state without namespace prefix
+        """
+        state = {}
+        for row in self.connector.load_data(SQL_GET_STATE):
+            key = row['key'][len(self.prefix):]
+            if row['key'].startswith(self.prefix) and '/' not in key:
+                state[key] = row['value']
+        return state
+
+    def close(self) -> None:
+        """Send state update still waiting for data query."""
+        self.connector.flush_deferred()
+
 
-class State:
+class State:  # noqa: WPS230 background flush needs its own thread, event and dirty flag
 
-    def __init__(self, storage: BaseStorage) -> None:
+    def __init__(self, storage: BaseStorage, flush_interval: Optional[float] = None) -> None:
+        """Init state.
+
+        Args:
+            storage: BaseStorage persistance storage
+            flush_interval: Optional[float] save changes in background once in this number of seconds, on change if None
+        """
         self.storage = storage
         self.data = self.storage.retrieve_state()
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.flush_interval = flush_interval
+        self.closed = threading.Event()
+        self.flusher = None
+        if flush_interval:
+            self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self.flusher.start()
 
     def set_state(self, key: str, value: Any) -> None:
-        self.data[key] = value
-        self.storage.save_state(self.data)
+        with self.lock:
+            self.data[key] = value
+            self.dirty = True
+            if not self.flush_interval:
+                self._save()
 
     def get_state(self, key: str) -> Any:
         return self.data.get(key)
+
+    def flush(self) -> None:
+        """Save pending changes."""
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def close(self) -> None:
+        """Stop background saving and save pending changes."""
+        self.closed.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
+        self.storage.close()
+
+    def _save(self) -> None:
+        self.storage.save_state(dict(self.data))
+        self.dirty = False
+
+    def _flush_periodically(self) -> None:
+        while not self.closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as error:
+                # changes stay dirty and are saved by the next flush
+                logger.exception(error)
@@ -0,0 +1,27 @@
+"""Make flat modules of loader importable by tests."""
+import os
+import sys
+
+import pytest
+
+loader_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loader_dir)
+# modules log exceptions to file from import time
+os.makedirs("/var/log/elk_service", exist_ok=True)
+
+from metrics import registry  # noqa: E402
+
+
+@pytest.fixture
+def metrics():
+    """Collect metrics in fresh registry during test.
+
+    Yields:
+        Registry: enabled registry
+    """
+    registry.enabled = True
+    yield registry
+    registry.enabled = False
+    registry.counters.clear()
+    registry.gauges.clear()
+    registry.histograms.clear()
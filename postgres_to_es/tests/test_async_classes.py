@@ -0,0 +1,32 @@
+import inspect
+
+import pytest
+
+from async_elk import AsyncELKLoader
+from async_producer import AsyncProducer
+from elk import BaseLoader, ELKLoader
+from producer import BaseProducer, PagingProducer
+
+
+def is_async(method):
+    """Check if method is coroutine or async generator function.
+
+    Args:
+        method: function to check
+
+    Returns:
+        bool: True if calling it does not run its body
+    """
+    return inspect.iscoroutinefunction(method) or inspect.isasyncgenfunction(method)
+
+
+@pytest.mark.parametrize(("async_class", "base_class", "sync_class"), [
+    (AsyncELKLoader, BaseLoader, ELKLoader),
+    (AsyncProducer, PagingProducer, BaseProducer),
+])
+def test_async_classes_share_only_io_free_base(async_class, base_class, sync_class):
+    """Async class does not inherit sync methods sending requests, so none of them can call a coroutine."""
+    assert not issubclass(async_class, sync_class)
+    assert issubclass(async_class, base_class)
+    for name, _ in inspect.getmembers(base_class, callable):
+        assert not is_async(getattr(async_class, name)), name
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import async_db
+
+
+def test_named_parameters_are_numbered_in_order_of_first_use():
+    """Repeated parameter keeps its first position."""
+    query, names = async_db.to_positional("SELECT %(b)s, %(a)s, %(b)s;")
+    assert query == "SELECT $1, $2, $1;"
+    assert names == ("b", "a")
+
+
+def test_timestamps_are_bound_as_text():
+    """Timestamps are passed as iso strings and cast by postgres, arrays too."""
+    query, names = async_db.to_positional(" ".join((
+        "WHERE (modified, id) > (%(last_modified)s::timestamptz, %(last_id)s::uuid)",
+        "AND read_at = ANY(%(seen_at)s::timestamptz[])",
+    )))
+    assert query == " ".join((
+        "WHERE (modified, id) > ($1::text::timestamptz, $2::uuid)",
+        "AND read_at = ANY($3::text[]::timestamptz[])",
+    ))
+    assert names == ("last_modified", "last_id", "seen_at")
+
+
+def test_escaped_percent_is_unescaped():
+    """Literal percent escaped for psycopg2 is passed to asyncpg as is."""
+    query, names = async_db.to_positional("SELECT title FROM t WHERE title LIKE 'a%%' AND id = %(id)s")
+    assert query == "SELECT title FROM t WHERE title LIKE 'a%' AND id = $1"
+    assert names == ("id",)
+
+
+def test_query_without_parameters():
+    """Query without parameters is unchanged."""
+    assert async_db.to_positional("SELECT 1;") == ("SELECT 1;", ())
+
+
+def test_arguments_match_text_casts():
+    """Datetimes, also inside lists, become iso strings, other values are unchanged."""
+    moment = datetime(2021, 6, 1, 12, 30)
+    assert async_db.to_argument(moment) == "2021-06-01T12:30:00"
+    assert async_db.to_argument([moment, moment]) == ["2021-06-01T12:30:00", "2021-06-01T12:30:00"]
+    assert async_db.to_argument("id") == "id"
@@ -0,0 +1,75 @@
+from unittest.mock import Mock
+
+from batcher import AdaptiveBatcher, BulkSizer
+from producer import Batch
+from transformator import GenreDoc
+
+
+def make_docs(start, count):
+    """Make genre documents.
+
+    Args:
+        start: int number of the first document
+        count: int number of documents
+
+    Returns:
+        dict: documents by key
+    """
+    return {
+        "genres:{0}".format(number): GenreDoc(uuid=str(number), name="genre", description="")
+        for number in range(start, start + count)
+    }
+
+
+def test_sizer_grows_on_fast_and_halves_on_slow_requests():
+    """Fast full requests grow size by increment, slow ones halve it down to minimum."""
+    sizer = BulkSizer(target_latency=1.0, min_docs=10, max_docs=120, start_docs=100, increment=10)
+    sizer.observe_bulk(100, 0.1)
+    assert sizer.size() == 110
+    sizer.observe_bulk(110, 0.1)
+    sizer.observe_bulk(120, 0.1)
+    assert sizer.size() == 120
+    sizer.observe_bulk(50, 0.1)
+    assert sizer.size() == 120
+    sizer.observe_bulk(120, 2.0)
+    assert sizer.size() == 60
+    for _ in range(5):
+        sizer.observe_bulk(60, 2.0)
+    assert sizer.size() == 10
+
+
+def test_sizer_fits_target_bytes():
+    """Size is limited by number of average documents fitting target payload."""
+    sizer = BulkSizer(target_bytes=1000, min_docs=5, start_docs=500)
+    sizer.observe_doc(100)
+    assert sizer.size() == 10
+    sizer.observe_doc(1000)
+    assert sizer.size() == 5
+
+
+def test_batches_are_commited_after_all_their_documents_are_loaded():
+    """Documents are regrouped by size, checkpoint follows the last loaded document of batch."""
+    loader = Mock()
+    commits = []
+    sizer = BulkSizer(min_docs=1, start_docs=4, increment=0)
+    batcher = AdaptiveBatcher(loader, sizer, lambda batch: commits.append(batch.checkpoint), max_wait=60)
+    batcher.add(Batch("genres", [], {"genre": 1}), make_docs(0, 3))
+    assert loader.load.call_count == 0
+    batcher.add(Batch("genres", [], {"genre": 2}), make_docs(3, 3))
+    assert [len(call.args[0]) for call in loader.load.call_args_list] == [4]
+    assert commits == [{"genre": 1}]
+    batcher.flush()
+    assert [len(call.args[0]) for call in loader.load.call_args_list] == [4, 2]
+    assert commits == [{"genre": 1}, {"genre": 2}]
+
+
+def test_tick_loads_documents_waiting_too_long():
+    """Documents of not full request are loaded after max_wait."""
+    loader = Mock()
+    commits = []
+    batcher = AdaptiveBatcher(loader, BulkSizer(start_docs=100), lambda batch: commits.append(batch), max_wait=0)
+    batcher.add(Batch("genres", [], {"genre": 1}), make_docs(0, 2))
+    assert not commits
+    batcher.tick()
+    assert loader.load.call_count == 1
+    assert len(commits) == 1
@@ -0,0 +1,64 @@
+from replication import ChangeSet
+
+
+def change(action, table, fields, schema="content"):
+    """Make wal2json format 2 change.
+
+    Args:
+        action: str I, U or D
+        table: str table name
+        fields: dict column values
+        schema: str schema name
+
+    Returns:
+        dict: decoded message
+    """
+    columns = [{"name": name, "value": column_value} for name, column_value in fields.items()]
+    return {"action": action, "schema": schema, "table": table, "identity" if action == "D" else "columns": columns}
+
+
+def test_object_changes_are_collected_by_table():
+    """Inserted and updated objects are reloaded, people and genres also reload their films."""
+    changes = ChangeSet()
+    changes.add(change("I", "film_work", {"id": "f1", "title": "t"}))
+    changes.add(change("U", "person", {"id": "p1"}))
+    changes.add(change("U", "genre", {"id": "g1"}))
+    assert changes.films == {"f1"}
+    assert changes.persons == {"p1"}
+    assert changes.genres == {"g1"}
+    assert changes.person_films == {"p1"}
+    assert changes.genre_films == {"g1"}
+    assert len(changes) == 3
+
+
+def test_link_changes_reload_film_and_person():
+    """Deleted link carries its ids in identity."""
+    changes = ChangeSet()
+    changes.add(change("D", "person_film_work", {"film_work_id": "f1", "person_id": "p1", "role": "actor"}))
+    changes.add(change("I", "genre_film_work", {"film_work_id": "f2", "genre_id": "g1"}))
+    assert changes.films == {"f1", "f2"}
+    assert changes.persons == {"p1"}
+    assert changes.genres == set()
+
+
+def test_delete_and_restore_of_the_same_object():
+    """The last change of object decides whether it is deleted or reloaded."""
+    changes = ChangeSet()
+    changes.add(change("U", "film_work", {"id": "f1"}))
+    changes.add(change("D", "film_work", {"id": "f1"}))
+    assert changes.films == set()
+    assert changes.deleted["film_work"] == {"f1"}
+    changes.add(change("I", "film_work", {"id": "f1"}))
+    assert changes.films == {"f1"}
+    assert changes.deleted["film_work"] == set()
+
+
+def test_other_messages_are_ignored():
+    """Transaction markers, truncates, other schemas and untracked tables are skipped."""
+    changes = ChangeSet()
+    changes.add({"action": "B"})
+    changes.add(change("T", "film_work", {}))
+    changes.add(change("I", "film_work", {"id": "f1"}, schema="public"))
+    changes.add(change("I", "users", {"id": "u1"}))
+    assert not changes
+    assert changes.films == set()
@@ -0,0 +1,85 @@
+from unittest.mock import Mock
+
+from coalescer import Coalescer
+from producer import Batch, Schema
+
+
+def film_rows(sql, query_params):
+    """Make rows of requested films.
+
+    Args:
+        sql: str data query
+        query_params: dict query parameters with film ids
+
+    Returns:
+        list[dict]: row of every film
+    """
+    return [{"fw_id": doc_id} for doc_id in query_params["film_ids"]]
+
+
+def make_producer(tracked_id, pages):
+    """Make producer mock yielding dirty ids pages.
+
+    Args:
+        tracked_id: str schema tracked id
+        pages: list of (ids, checkpoint) pages
+
+    Returns:
+        Mock: producer
+    """
+    producer = Mock()
+    producer.schema = Schema(
+        tracked_id=tracked_id,
+        related_id="",
+        index_name="movies",
+        sql_get_tracked_ids="",
+        sql_get_data="films",
+    )
+    producer.sql_get_data = "films"
+    producer.transform = "movies"
+    producer.get_dirty_ids.side_effect = lambda: iter(pages)
+    producer.fetch_data.side_effect = film_rows
+    return producer
+
+
+def test_films_of_all_producers_are_loaded_once():
+    """Ids dirty in several producers are fetched once with checkpoints of all of them."""
+    pages = [(["f1", "f2"], {"person": 1}), (["f3"], {"person": 2})]
+    person = make_producer("person", pages)
+    genre = make_producer("genre", [(["f2", "f4"], {"genre": 1})])
+    batches = list(Coalescer("movies", [person, genre], window=10, max_ids=100).get_results())
+    assert len(batches) == 1
+    assert [row["fw_id"] for row in batches[0].rows] == ["f1", "f2", "f4", "f3"]
+    assert batches[0].checkpoint == {"person": 2, "genre": 1}
+    assert batches[0].transform == "movies"
+    genre.fetch_data.assert_not_called()
+
+
+def test_max_ids_closes_window():
+    """Window is loaded as soon as enough ids are collected."""
+    pages = [(["f1", "f2"], {"person": 1}), (["f3", "f4"], {"person": 2})]
+    person = make_producer("person", pages)
+    batches = list(Coalescer("movies", [person], window=10, max_ids=2).get_results())
+    assert [batch.checkpoint for batch in batches] == [{"person": 1}, {"person": 2}]
+
+
+def test_checkpoint_without_ids_is_kept():
+    """Page without owned ids still moves checkpoint, nothing is fetched for it."""
+    person = make_producer("person", [([], {"person": 1})])
+    batches = list(Coalescer("movies", [person], window=10).get_results())
+    assert not batches[0].rows
+    assert batches[0].checkpoint == {"person": 1}
+    person.fetch_data.assert_not_called()
+
+
+def test_commit_and_rollback_reach_producers():
+    """Checkpoints are saved through the first producer, rollback goes to every producer."""
+    person = make_producer("person", [])
+    genre = make_producer("genre", [])
+    coalescer = Coalescer("movies", [person, genre])
+    batch = Batch("movies", [], {"person": 1, "genre": 2})
+    coalescer.commit(batch)
+    person.commit.assert_called_once_with(batch)
+    coalescer.rollback()
+    person.rollback.assert_called_once_with()
+    genre.rollback.assert_called_once_with()
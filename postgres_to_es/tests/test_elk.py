@@ -0,0 +1,207 @@
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ApiError, Elasticsearch
+
+import elk as elk_module
+from elk import ELKLoader
+from settings import ElkSettings
+
+
+def bulk_keys(operations: list) -> list[tuple[str, str]]:
+    """Get operation and _id of every document of request.
+
+    Args:
+        operations: list[bytes] serialized bulk lines
+
+    Returns:
+        list[tuple[str, str]]: operation and _id
+    """
+    keys = []
+    lines = iter(operations)
+    for line in lines:
+        op_type, header = next(iter(json.loads(line).items()))
+        keys.append((op_type, header["_id"]))
+        if op_type != "delete":
+            next(lines)
+    return keys
+
+
+class FakeBulk:
+    """Bulk endpoint answering every document with status chosen by test.
+
+    Statuses are given per operation and _id as list, one status per attempt, the last one is repeated.
+    Status "chunk" rejects the whole request with 429 and Retry-After header.
+    """
+
+    def __init__(self, statuses: dict) -> None:
+        """Init endpoint.
+
+        Args:
+            statuses: dict statuses by operation and _id
+        """
+        self.statuses = statuses
+        self.sent = Counter()
+
+    def __call__(self, *args, operations=None, **kwargs):
+        """Answer bulk request.
+
+        Args:
+            args: unused positional arguments
+            operations: list[bytes] serialized bulk lines
+            kwargs: unused keyword arguments
+
+        Returns:
+            SimpleNamespace: response with items
+
+        Raises:
+            ApiError: if any document of request rejects the whole request
+        """
+        keys = bulk_keys(operations)
+        statuses = []
+        for key in keys:
+            attempts = self.statuses.get(key, [201])
+            statuses.append(attempts[min(self.sent[key], len(attempts) - 1)])
+            self.sent[key] += 1
+        if "chunk" in statuses:
+            meta = ApiResponseMeta(
+                status=429,
+                http_version="1.1",
+                headers=HttpHeaders({"retry-after": "3"}),
+                duration=0,
+                node=NodeConfig("http", "localhost", 9200),
+            )
+            raise ApiError("rejected", meta=meta, body={})
+        answers = []
+        for (op_type, doc_id), status in zip(keys, statuses):
+            answer = {"_id": doc_id, "status": status}
+            if status >= 300:
+                answer["error"] = {"type": "error_{0}".format(status)}
+            answers.append({op_type: answer})
+        return SimpleNamespace(body={"items": answers})
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Record delays between retries instead of sleeping.
+
+    Args:
+        monkeypatch: pytest fixture
+
+    Returns:
+        list: seconds loader waited
+    """
+    waited = []
+    monkeypatch.setattr(elk_module, "sleep", waited.append)
+    return waited
+
+
+@pytest.fixture
+def make_loader(tmp_path, monkeypatch):
+    """Make loader factory sending bulks to FakeBulk, no index is created.
+
+    Args:
+        tmp_path: pytest fixture
+        monkeypatch: pytest fixture
+
+    Returns:
+        Callable: factory taking statuses of FakeBulk and returning loader and endpoint
+    """
+    (tmp_path / "indexs").mkdir()
+
+    def factory(statuses):
+        bulk = FakeBulk(statuses)
+        monkeypatch.setattr(Elasticsearch, "bulk", bulk)
+        config = ElkSettings(
+            elk_host="localhost",
+            elk_port="9200",
+            elk_index=str(tmp_path / "indexs"),
+            elk_bulk_max_retries=2,
+            elk_dead_letter_path=str(tmp_path / "dead_letter.jsonl"),
+        )
+        return ELKLoader(config), bulk
+
+    return factory
+
+
+def read_dead_letters(loader):
+    """Read dead letter file of loader.
+
+    Args:
+        loader: ELKLoader loader
+
+    Returns:
+        list[dict]: records
+    """
+    with open(loader.config.elk_dead_letter_path) as dead_letters:
+        return [json.loads(line) for line in dead_letters]
+
+
+def index(doc_id):
+    """Make index action.
+
+    Args:
+        doc_id: str document _id
+
+    Returns:
+        dict: bulk action
+    """
+    return {"_index": "movies", "_id": doc_id, "_source": {"uuid": doc_id}}
+
+
+def test_only_rejected_documents_are_sent_again(make_loader, delays):
+    """Acknowledged documents are sent once, rejected one is retried and failed one goes to dead letters."""
+    loader, bulk = make_loader({
+        ("index", "retried"): [429, 201],
+        ("update", "invalid"): [400],
+        ("delete", "missing"): [404],
+    })
+    actions = [
+        index("ok"),
+        index("retried"),
+        {"_op_type": "update", "_index": "persons", "_id": "invalid", "_source": {"doc": {}}},
+        {"_op_type": "delete", "_index": "movies", "_id": "missing"},
+    ]
+    assert loader.send(actions) == {("update", "invalid")}
+    assert bulk.sent == Counter({
+        ("index", "ok"): 1,
+        ("index", "retried"): 2,
+        ("update", "invalid"): 1,
+        ("delete", "missing"): 1,
+    })
+    assert len(delays) == 1
+    records = read_dead_letters(loader)
+    assert [(record["action"], record["status"], record["error"]) for record in records] == [
+        (actions[2], 400, {"type": "error_400"}),
+    ]
+    assert set(records[0]) == {"action", "status", "error", "failed_at"}
+
+
+def test_exhausted_retries_keep_last_status(make_loader, delays):
+    """Document rejected on every attempt is written to dead letters with the last seen status and error."""
+    loader, bulk = make_loader({("index", "busy"): [503, 429]})
+    assert loader.send([index("busy")]) == {("index", "busy")}
+    assert bulk.sent[("index", "busy")] == loader.config.elk_bulk_max_retries + 1
+    assert len(delays) == loader.config.elk_bulk_max_retries
+    records = read_dead_letters(loader)
+    failures = [(record["action"]["_id"], record["status"], record["error"]) for record in records]
+    assert failures == [("busy", 429, {"type": "error_429"})]
+
+
+def test_rejected_request_waits_for_retry_after(make_loader, delays):
+    """Documents of request rejected as a whole are retried after its Retry-After, others are not resent."""
+    loader, bulk = make_loader({("index", "rejected"): ["chunk", 201]})
+    assert loader.send([index("ok"), index("rejected")], chunk_size=1) == set()
+    assert bulk.sent == Counter({("index", "ok"): 1, ("index", "rejected"): 2})
+    assert delays == [3.0]
+
+
+def test_replayed_dead_letters_are_removed(make_loader, delays):
+    """Replayed actions acknowledged by Elasticsearch are not kept in dead letter file."""
+    loader, bulk = make_loader({("index", "flaky"): [400, 201]})
+    assert loader.send([index("flaky")]) == {("index", "flaky")}
+    assert loader.replay_dead_letters() == (1, 0)
+    assert not loader.dead_letters.take()
@@ -0,0 +1,19 @@
+import pytest
+
+from fingerprint import FingerprintCache, digest
+
+
+def test_skip_and_hit_rates_are_exposed(tmp_path, metrics):
+    """Skipped documents and memory hits are counted and exposed as rates after report."""
+    cache = FingerprintCache(str(tmp_path / "fingerprints.db"), memory_size=10)
+    source_digest = digest({"uuid": "f1"})
+    assert not cache.is_unchanged("movies", "f1", source_digest)
+    cache.update([("movies", "f1", source_digest)])
+    assert cache.is_unchanged("movies", "f1", source_digest)
+    cache.report()
+    cache.close()
+    assert metrics.counters["etl_fingerprint_checked_total"][()] == 2
+    assert metrics.counters["etl_fingerprint_skipped_total"][()] == 1
+    assert metrics.gauges["etl_fingerprint_skip_rate"][()] == pytest.approx(0.5)
+    assert metrics.gauges["etl_fingerprint_memory_hit_rate"][()] == pytest.approx(0.5)
+    assert "etl_fingerprint_skip_rate 0.5" in metrics.render()
@@ -0,0 +1,123 @@
+from unittest.mock import Mock
+
+import pytest
+
+import pipeline as pipeline_module
+from pipeline import Pipeline
+from producer import Batch
+from state import BaseStorage, State
+
+
+class MemoryStorage(BaseStorage):
+    """Storage keeping saved state in memory."""
+
+    def __init__(self) -> None:
+        """Init empty storage."""
+        self.saved = {}
+
+    def save_state(self, state: dict) -> None:
+        """Keep copy of state.
+
+        Args:
+            state: dict state to save
+        """
+        self.saved = dict(state)
+
+    def retrieve_state(self) -> dict:
+        """Get saved state.
+
+        Returns:
+            dict: copy of saved state
+        """
+        return dict(self.saved)
+
+
+class ListProducer:
+    """Producer of prepared batches committing their checkpoints to state."""
+
+    def __init__(self, pages: int) -> None:
+        """Init producer.
+
+        Args:
+            pages: int number of batches, checkpoint of batch is its number
+        """
+        self.state = State(MemoryStorage())
+        numbers = range(1, pages + 1)
+        self.batches = [Batch("movies", [page], {"movie": page}, "movies") for page in numbers]
+        self.rolled_back = False
+
+    def get_results(self):
+        """Get batches.
+
+        Yields:
+            Batch: next batch
+        """
+        yield from self.batches
+
+    def commit(self, batch):
+        """Save batch checkpoint.
+
+        Args:
+            batch: Batch loaded batch
+        """
+        self.state.set_state("movie", batch.checkpoint["movie"])
+
+    def rollback(self):
+        """Remember that progress was dropped."""
+        self.rolled_back = True
+
+
+@pytest.fixture
+def transform(monkeypatch):
+    """Replace transformer with one making a document of every row.
+
+    Args:
+        monkeypatch: pytest fixture
+
+    Returns:
+        Mock: transformer, side effect may be changed by test
+    """
+    transformer = Mock(side_effect=lambda batch: {str(row): row for row in batch.rows})
+    monkeypatch.setattr(pipeline_module, "transform_lists_to_dc", transformer)
+    return transformer
+
+
+def test_batches_are_commited_in_order(transform):
+    """Every batch is commited after it is loaded, in producer order."""
+    producer = ListProducer(pages=5)
+    loader = Mock()
+    commits = []
+    loader.load.side_effect = lambda docs: commits.append(producer.state.get_state("movie"))
+    assert Pipeline(loader, queue_size=1).run(producer) == 5
+    assert commits == [None, 1, 2, 3, 4]
+    assert producer.state.storage.saved == {"movie": 5}
+    assert not producer.rolled_back
+
+
+def test_failed_transform_does_not_advance_state(transform):
+    """Batch failed in transform and all batches after it are not commited, fetched progress is dropped."""
+    transform.side_effect = [{"1": 1}, ValueError("broken row")]
+    producer = ListProducer(pages=4)
+    with pytest.raises(ValueError, match="broken row"):
+        Pipeline(Mock(), queue_size=1).run(producer)
+    assert producer.state.storage.saved.get("movie") in {None, 1}
+    assert producer.rolled_back
+
+
+def test_failed_load_does_not_advance_state(transform):
+    """Batch not acknowledged by Elasticsearch is not commited."""
+    loader = Mock()
+    loader.load.side_effect = [None, ConnectionError("elasticsearch is gone")]
+    producer = ListProducer(pages=3)
+    with pytest.raises(ConnectionError):
+        Pipeline(loader, queue_size=1).run(producer)
+    assert producer.state.storage.saved == {"movie": 1}
+    assert producer.rolled_back
+
+
+def test_quantum_commits_processed_batches_and_drops_fetched_ones(transform):
+    """Run stops after max_batches, their checkpoints are kept and batches fetched ahead are fetched again."""
+    producer = ListProducer(pages=10)
+    assert Pipeline(Mock(), queue_size=2).run(producer, max_batches=3) == 3
+    assert producer.state.storage.saved == {"movie": 3}
+    assert producer.rolled_back
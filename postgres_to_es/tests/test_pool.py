@@ -0,0 +1,36 @@
+import threading
+from unittest.mock import MagicMock
+
+import psycopg2
+
+from pool import ConnectionPool
+
+
+def make_connection():
+    """Make healthy connection mock.
+
+    Returns:
+        MagicMock: connection
+    """
+    conn = MagicMock()
+    conn.closed = False
+    return conn
+
+
+def test_pool_usage_is_counted(metrics):
+    """Checkouts, waits, reconnects and opened connections are exposed in metrics registry."""
+    pool = ConnectionPool(make_connection, min_size=1, max_size=1)
+    first = pool.getconn()
+    waiting = threading.Thread(target=lambda: pool.putconn(pool.getconn()))
+    waiting.start()
+    for _ in range(500):
+        if metrics.counters.get("etl_pool_waits_total"):
+            break
+        waiting.join(0.01)
+    first.cursor.side_effect = psycopg2.OperationalError
+    pool.putconn(first)
+    waiting.join()
+    assert metrics.counters["etl_pool_checkouts_total"][()] == 2
+    assert metrics.counters["etl_pool_waits_total"][()] == 1
+    assert metrics.counters["etl_pool_reconnects_total"][()] == 1
+    assert metrics.counters["etl_pool_connections_created_total"][()] == 2
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from db import DBConnector
+from settings import ConnectorSettings, PosgressSettings
+
+
+@pytest.fixture
+def connector():
+    """Make connector without pool, no connection is opened.
+
+    Returns:
+        DBConnector: connector
+    """
+    config = PosgressSettings(dbname="movies", user="etl", password="etl", host="localhost", port=5432)
+    return DBConnector(config, ConnectorSettings(pool_enabled=False))
+
+
+def executed(cursor):
+    """Get statements executed by mock cursor.
+
+    Args:
+        cursor: Mock cursor
+
+    Returns:
+        list: executed sql
+    """
+    return [call.args[0] for call in cursor.execute.call_args_list]
+
+
+def test_named_parameters_become_positional_once(connector):
+    """Repeated parameter gets one position, EXECUTE keeps named parameters for psycopg2."""
+    conn, cursor = SimpleNamespace(prepared=set()), Mock()
+    sql = "SELECT id FROM t WHERE (modified, id) > (%(last_modified)s, %(last_id)s) AND id <> %(last_id)s;"
+    execute = connector.prepare(conn, cursor, sql)
+    name = next(iter(conn.prepared))
+    assert executed(cursor) == [
+        "PREPARE {0} AS SELECT id FROM t WHERE (modified, id) > ($1, $2) AND id <> $2;".format(name),
+    ]
+    assert execute == "EXECUTE {0} (%(last_modified)s, %(last_id)s);".format(name)
+
+
+def test_statement_is_prepared_once_per_connection(connector):
+    """The same query is not prepared again in the same session, but is in a new one."""
+    conn, cursor = SimpleNamespace(prepared=set()), Mock()
+    sql = "SELECT 1 FROM t WHERE id = ANY(%(film_ids)s::uuid[]);"
+    first = connector.prepare(conn, cursor, sql)
+    assert connector.prepare(conn, cursor, sql) == first
+    assert len(executed(cursor)) == 1
+    assert "$1::uuid[]" in executed(cursor)[0]
+    assert first == "EXECUTE {0} (%(film_ids)s::uuid[]);".format(next(iter(conn.prepared)))
+    other_cursor = Mock()
+    assert connector.prepare(SimpleNamespace(prepared=set()), other_cursor, sql) == first
+    assert executed(other_cursor) == executed(cursor)
+
+
+def test_execute_keeps_casts(connector):
+    """EXECUTE arguments are cast like in query, repeated parameter takes its first cast."""
+    conn, cursor = SimpleNamespace(prepared=set()), Mock()
+    sql = " ".join((
+        "SELECT id FROM t WHERE id = ANY(%(seen_ids)s::uuid[]) AND modified > %(last_modified)s::timestamptz",
+        "AND id <> %(last_id)s AND id > %(last_id)s::uuid LIMIT %(page_size)s;",
+    ))
+    execute = connector.prepare(conn, cursor, sql)
+    name = next(iter(conn.prepared))
+    assert executed(cursor) == [" ".join((
+        "PREPARE {0} AS SELECT id FROM t WHERE id = ANY($1::uuid[]) AND modified > $2::timestamptz".format(name),
+        "AND id <> $3 AND id > $3::uuid LIMIT $4;",
+    ))]
+    assert execute == "EXECUTE {0} ({1});".format(
+        name,
+        "%(seen_ids)s::uuid[], %(last_modified)s::timestamptz, %(last_id)s::uuid, %(page_size)s",
+    )
+
+
+def test_query_without_parameters(connector):
+    """Query without parameters is executed without argument list."""
+    conn, cursor = SimpleNamespace(prepared=set()), Mock()
+    execute = connector.prepare(conn, cursor, "SELECT 1;")
+    assert execute == "EXECUTE {0};".format(next(iter(conn.prepared)))
@@ -0,0 +1,20 @@
+import time
+from unittest.mock import Mock
+
+from replication import ReplicationProducer
+
+
+def test_feedback_is_sent_while_window_is_loaded():
+    """Status is sent without reading stream, so slot connection outlives long loads."""
+    connector = Mock()
+    connector.get_replication_connection.return_value.closed = False
+    producer = ReplicationProducer(connector, Mock(), feedback_interval=0.01)
+    cursor = producer.start()
+    for _ in range(500):
+        if cursor.send_feedback.call_count >= 2:
+            break
+        time.sleep(0.01)
+    assert cursor.send_feedback.call_count >= 2
+    cursor.send_feedback.assert_called_with(force=True)
+    cursor.read_message.assert_not_called()
+    producer.close()
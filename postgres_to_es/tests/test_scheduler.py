@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+from unittest.mock import Mock
+
+from producer import Schema
+from scheduler import Scheduler
+
+
+class TrackingPipeline:
+    """Pipeline stub recording how many producers of every index ran at the same time."""
+
+    def __init__(self) -> None:
+        """Init stub with no running producers."""
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.peak = Counter()
+
+    def run(self, producer, max_batches=None):
+        """Hold worker for a while as if batches were loaded.
+
+        Args:
+            producer: Mock producer
+            max_batches: int quantum
+
+        Returns:
+            int: no batches, producer is not rescheduled
+        """
+        with self.lock:
+            self.running[producer.schema.index_name] += 1
+            index_name = producer.schema.index_name
+            self.peak[index_name] = max(self.peak[index_name], self.running[index_name])
+        time.sleep(0.05)
+        with self.lock:
+            self.running[producer.schema.index_name] -= 1
+        return 0
+
+
+def make_producer(tracked_id, index_name):
+    """Make producer mock of index.
+
+    Args:
+        tracked_id: str schema tracked id
+        index_name: str index producer writes to
+
+    Returns:
+        Mock: producer
+    """
+    producer = Mock()
+    producer.schema = Schema(
+        tracked_id=tracked_id,
+        related_id="",
+        index_name=index_name,
+        sql_get_tracked_ids="",
+        sql_get_data="",
+    )
+    producer.lag.return_value = 0
+    return producer
+
+
+def run_pass(index_limits=None):
+    """Run one pass of three movies producers and one persons producer.
+
+    Args:
+        index_limits: Optional[dict[str, int]] scheduler limits
+
+    Returns:
+        Counter: peak number of producers running per index
+    """
+    pipeline = TrackingPipeline()
+    producers = [make_producer(name, "movies") for name in ("film_work", "person", "genre")]
+    producers.append(make_producer("persons", "persons"))
+    with closing(Scheduler(pipeline, producers, workers=4, quantum=1, index_limits=index_limits)) as scheduler:
+        scheduler.run_pass()
+    return pipeline.peak
+
+
+def test_one_producer_per_index_by_default():
+    """Producers of the same index do not overlap unless index is listed in limits."""
+    assert run_pass() == Counter(movies=1, persons=1)
+
+
+def test_index_limit_allows_overlap():
+    """Listed index runs as many producers as its limit."""
+    assert run_pass({"movies": 2})["movies"] == 2
+
+
+def test_producer_of_several_indexes_runs_alone():
+    """Producer writing several indexes does not overlap with producers of any of them."""
+    pipeline = TrackingPipeline()
+    tombstones = make_producer("deleted_objects", "deleted_objects")
+    tombstones.schema = Schema(
+        tracked_id="deleted_objects",
+        related_id="",
+        index_name="deleted_objects",
+        sql_get_tracked_ids="",
+        sql_get_data="",
+        written_indexes=("movies", "persons"),
+    )
+    producers = [make_producer("film_work", "movies"), tombstones, make_producer("persons", "persons")]
+    overlapped = []
+    run = pipeline.run
+
+    def checked_run(producer, max_batches=None):
+        with pipeline.lock:
+            busy = any(pipeline.running.values())
+            overlapped.append(bool(pipeline.running["deleted_objects"]) or producer is tombstones and busy)
+        return run(producer, max_batches)
+
+    pipeline.run = checked_run
+    with closing(Scheduler(pipeline, producers, workers=3, quantum=1)) as scheduler:
+        scheduler.run_pass()
+    assert overlapped == [False, False, False]
@@ -0,0 +1,27 @@
+import pytest
+from pydantic import ValidationError
+
+from settings import EtlSettings
+
+
+def test_asyncio_engine_rejects_threads_only_options():
+    """Deletions and replication are not silently dropped by asyncio engine."""
+    with pytest.raises(ValidationError, match="tombstones_enabled, replication_enabled"):
+        EtlSettings(engine="asyncio", tombstones_enabled=True, replication_enabled=True)
+
+
+def test_asyncio_engine_runs_plain_producers():
+    """Asyncio engine is accepted without threads only options."""
+    assert EtlSettings(engine="asyncio", json_documents=True, shards=2).engine == "asyncio"
+
+
+def test_unknown_engine_is_rejected():
+    """Misspelled engine does not fall back to threads engine."""
+    with pytest.raises(ValidationError, match="etl_engine"):
+        EtlSettings(engine="async")
+
+
+def test_replication_is_not_sharded():
+    """Replication slot can not be shared by shard workers."""
+    with pytest.raises(ValidationError, match="etl_shards"):
+        EtlSettings(shards=2, replication_enabled=True)
@@ -0,0 +1,49 @@
+import uuid
+
+import pytest
+
+from shards import Shard
+
+# 200 uuids spread over the whole space by prime step
+DOC_NUMBERS = range(13, 200 * 7919, 7919)
+DOC_IDS = tuple(str(uuid.UUID(int=number)) for number in DOC_NUMBERS)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 8])
+def test_every_document_belongs_to_one_shard(count):
+    """Every uuid is owned by exactly one shard."""
+    for doc_id in DOC_IDS:
+        owners = [number for number in range(count) if Shard(number, count).owns(doc_id)]
+        assert owners == [uuid.UUID(doc_id).int % count]
+
+
+def test_owns_accepts_uuid_objects_and_strings():
+    """Ids from asyncpg come as UUID objects, from psycopg2 as strings."""
+    shard = Shard(1, 4)
+    doc_id = uuid.UUID(int=5)
+    assert shard.owns(doc_id)
+    assert shard.owns(str(doc_id))
+    assert not Shard(0, 4).owns(doc_id)
+
+
+def test_filter_keeps_order_of_owned_ids():
+    """Filter drops ids of other shards and keeps order of the rest."""
+    shard = Shard(2, 3)
+    owned = shard.filter(DOC_IDS)
+    assert owned == [doc_id for doc_id in DOC_IDS if uuid.UUID(doc_id).int % 3 == 2]
+    assert not shard.filter([])
+
+
+def test_filters_of_all_shards_split_documents():
+    """Shards together cover all documents without overlap."""
+    shards = [Shard(number, 4) for number in range(4)]
+    parts = [shard.filter(DOC_IDS) for shard in shards]
+    assert sorted(doc_id for part in parts for doc_id in part) == sorted(DOC_IDS)
+
+
+def test_path_and_name():
+    """Shard files get shard name before extension."""
+    shard = Shard(1, 4)
+    assert shard.name == "shard-1-of-4"
+    assert shard.path("/var/log/elk_service/state.json") == "/var/log/elk_service/state.shard-1-of-4.json"
+    assert shard.path("") == ""
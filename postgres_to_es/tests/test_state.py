@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+
+import pytest
+
+import state as state_module
+from state import JsonFileStorage, State
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """Make file storage with saved state.
+
+    Args:
+        tmp_path: pytest fixture
+
+    Returns:
+        JsonFileStorage: storage of state.json holding movie checkpoint 1
+    """
+    json_storage = JsonFileStorage(str(tmp_path / "state.json"))
+    json_storage.save_state({"movie": 1})
+    return json_storage
+
+
+def test_crash_while_writing_keeps_previous_state(storage, tmp_path, monkeypatch):
+    """Failed write leaves previous state file intact and no unfinished copy next to it."""
+
+    def crash(fd):
+        raise OSError("disk is gone")
+
+    monkeypatch.setattr(state_module.os, "fsync", crash)
+    with pytest.raises(OSError, match="disk is gone"):
+        storage.save_state({"movie": 2})
+    assert storage.retrieve_state() == {"movie": 1}
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_crash_while_replacing_keeps_previous_state(storage, tmp_path, monkeypatch):
+    """Written copy which did not replace state file is removed, previous state file is intact."""
+
+    def crash(source, target):
+        raise OSError("rename failed")
+
+    monkeypatch.setattr(state_module.os, "replace", crash)
+    with pytest.raises(OSError, match="rename failed"):
+        storage.save_state({"movie": 2})
+    assert storage.retrieve_state() == {"movie": 1}
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_flush_interval_saves_in_background(storage):
+    """Changes are kept in memory until flush, close saves the rest."""
+    state = State(storage, flush_interval=3600)
+    state.set_state("movie", 2)
+    assert storage.retrieve_state() == {"movie": 1}
+    state.flush()
+    assert storage.retrieve_state() == {"movie": 2}
+    state.set_state("movie", 3)
+    state.close()
+    with open(storage.file_path) as state_file:
+        assert json.load(state_file) == {"movie": 3}
+
+
+def test_failed_background_flush_is_retried(storage, monkeypatch):
+    """Background saving survives storage error, changes stay pending and are saved by the next flush."""
+    attempts = []
+    saved = threading.Event()
+    save_state = storage.save_state
+
+    def flaky_save(snapshot):
+        attempts.append(snapshot)
+        if len(attempts) == 1:
+            raise OSError("disk is gone")
+        save_state(snapshot)
+        saved.set()
+
+    monkeypatch.setattr(storage, "save_state", flaky_save)
+    monkeypatch.setattr(state_module.logger, "exception", lambda error: None)
+    state = State(storage, flush_interval=0.01)
+    state.set_state("movie", 2)
+    assert saved.wait(5)
+    state.close()
+    assert len(attempts) >= 2
+    assert storage.retrieve_state() == {"movie": 2}
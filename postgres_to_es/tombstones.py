@@ -0,0 +1,124 @@
+"""Propagate deleted rows of tracked tables to Elasticsearch."""
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Generator, Optional
+
+from db import DBConnector
+from metrics import registry
+from producer import Batch, Schema
+from shards import Shard
+from sql import SQL_CREATE_TOMBSTONE_TRIGGERS, SQL_GET_TOMBSTONEs
+from state import State
+from transformator import tombstone_indexes
+
+START_TOMBSTONE = MappingProxyType({"txid": 0, "id": 0, "deleted_at": None})
+
+
+class TombstoneProducer:
+    """Page through content.deleted_objects log filled by triggers and produce deletions of documents.
+
+    Tombstone producer is used by pipeline and scheduler the same way as BaseProducer,
+    its checkpoint is transaction id and log id of the last processed row kept in the same state.
+    Scheduler does not run it together with producers of indexes it deletes from, so a page read
+    before deletion can not be loaded after it and bring deleted document back.
+    """
+
+    def __init__(  # noqa: WPS211 producer options
+        self,
+        connector: DBConnector,
+        state: State,
+        page_size: int = 100,
+        install_triggers: bool = False,
+        shard: Optional[Shard] = None,
+    ) -> None:
+        """Init tombstone producer.
+
+        Args:
+            connector: DBConnector class to work with database
+            state: State class to handle and store state changes
+            page_size: int number of log rows in one batch
+            install_triggers: bool create deleted objects log and its triggers
+            shard: Optional[Shard] produce only deletions of documents of this shard
+        """
+        self.connector = connector
+        self.state = state
+        self.page_size = page_size
+        self.local_state = {}
+        self.shard = shard
+        self.schema = Schema(
+            tracked_id="deleted_objects",
+            related_id="",
+            index_name="deleted_objects",
+            sql_get_tracked_ids=SQL_GET_TOMBSTONEs,
+            sql_get_data="",
+            tracked_table="deleted_objects",
+            transform="tombstones",
+            written_indexes=tuple(sorted(set(tombstone_indexes.values()))),
+        )
+        if install_triggers:
+            self.connector.execute(SQL_CREATE_TOMBSTONE_TRIGGERS)
+
+    def get_results(self) -> Generator[Batch, None, None]:  # noqa: WPS463 batches are generated
+        """Get pages of deleted objects log.
+
+        Yields:
+            Batch: log rows with checkpoint
+        """
+        key = self.schema.tracked_id
+        while True:
+            cursor = self.get_cursor()
+            rows = self.connector.load_data(self.schema.sql_get_tracked_ids, {
+                "last_txid": cursor.get("txid", 0),
+                "last_id": cursor["id"],
+                "page_size": self.page_size,
+            })
+            if not rows:
+                return
+            registry.inc("etl_rows_fetched_total", {"schema": key, "query": key}, len(rows))
+            self.local_state[key] = {
+                "txid": rows[-1]["txid"],
+                "id": rows[-1]["id"],
+                "deleted_at": rows[-1]["deleted_at"].isoformat(),
+            }
+            if self.shard is not None:
+                rows = [row for row in rows if self.shard.owns(row["object_id"])]
+            yield Batch(self.schema.index_name, rows, {key: self.local_state[key]}, self.schema.transform)
+
+    def get_cursor(self) -> dict:
+        """Get last processed log row.
+
+        Returns:
+            dict: transaction id, log id and deletion time, checkpoint saved before txid was logged starts from 0
+        """
+        local_state = self.local_state.get(self.schema.tracked_id)
+        if local_state is not None:
+            return local_state
+        return self.state.get_state(self.schema.tracked_id) or dict(START_TOMBSTONE)
+
+    def commit(self, batch: Batch) -> None:
+        """Save batch checkpoint in persistance storage, call only after batch is loaded.
+
+        Args:
+            batch: Batch loaded batch
+        """
+        for key, cursor in batch.checkpoint.items():
+            self.state.set_state(key, cursor)
+
+    def flush(self) -> None:
+        """Save commited checkpoints right now if state saves them in background."""
+        self.state.flush()
+
+    def rollback(self) -> None:
+        """Forget fetched but not commited progress, next scan starts from persisted state."""
+        self.local_state = {}
+
+    def lag(self) -> float:
+        """Get time passed since last commited deletion.
+
+        Returns:
+            float: lag in seconds, 0 if nothing was deleted yet
+        """
+        deleted_at = (self.state.get_state(self.schema.tracked_id) or START_TOMBSTONE)["deleted_at"]
+        if deleted_at is None:
+            return 0
+        return (datetime.now(timezone.utc) - datetime.fromisoformat(deleted_at)).total_seconds()
@@ -1,59 +1,290 @@
-from dataclasses import dataclass, field
-from typing import ClassVar
+import hashlib
+from typing import ClassVar, Iterable, Optional
 
+from painless import PAINLESS_SET_PERSON_FILMS, PAINLESS_UNLINK_PERSON_FILMS
 from settings import IndexsEnum
 
 
-@dataclass
 class BaseDoc:
+    """Base of elasticsearch documents, fields are kept in slots and serialized without copying."""
+
+    __slots__ = ('uuid',)
     index_name: ClassVar[str] = IndexsEnum.movies.value
-    uuid: str
+    op_type: ClassVar[str] = 'index'
+
+    def __init__(self, uuid: str) -> None:
+        """Init document.
+
+        Args:
+            uuid: str document _id
+        """
+        self.uuid = uuid
+
+    def to_source(self) -> dict:
+        """Get document _source, nested lists are shared with document, not copied.
+
+        Returns:
+            dict: document fields
+        """
+        return {'uuid': self.uuid}
+
+    def __eq__(self, other: object) -> bool:
+        """Compare documents of the same class by their _source.
+
+        Args:
+            other: object document to compare with
 
+        Returns:
+            bool: True if documents are equal
+        """
+        return type(self) is type(other) and self.to_source() == other.to_source()  # noqa: WPS516 exact class
 
-@dataclass
-class Doc(BaseDoc):
+    def __repr__(self) -> str:
+        """Get document class and _source.
+
+        Returns:
+            str: representation of document
+        """
+        return '{0}({1!r})'.format(type(self).__name__, self.to_source())
+
+
+class Doc(BaseDoc):  # noqa: WPS230 one attribute per document field
     """Class of elasticsearch movies index document."""
 
+    __slots__ = ('imdb_rating', 'title', 'description', 'directors', 'genre', 'subscription', 'actors', 'writers')
     index_name: ClassVar[str] = IndexsEnum.movies.value
-    imdb_rating: float
-    title: str
-    description: str
-    directors: list[dict] = field(default_factory=list)
-    genre: list[dict] = field(default_factory=list)
-    subscription: list[dict] = field(default_factory=list)
-    actors: list[dict] = field(default_factory=list)
-    writers: list[dict] = field(default_factory=list)
+
+    def __init__(  # noqa: WPS211 one argument per document field
+        self,
+        uuid: str,
+        imdb_rating: float,
+        title: str,
+        description: str,
+        directors: Optional[list[dict]] = None,
+        genre: Optional[list[dict]] = None,
+        subscription: Optional[list[dict]] = None,
+        actors: Optional[list[dict]] = None,
+        writers: Optional[list[dict]] = None,
+    ) -> None:
+        """Init movie document, missing nested lists start empty.
+
+        Args:
+            uuid: str film id
+            imdb_rating: float film rating
+            title: str film title
+            description: str film description
+            directors: Optional[list[dict]] directors names
+            genre: Optional[list[dict]] genres
+            subscription: Optional[list[dict]] subscriptions film is available in
+            actors: Optional[list[dict]] actors
+            writers: Optional[list[dict]] writers
+        """
+        super().__init__(uuid)
+        self.imdb_rating = imdb_rating
+        self.title = title
+        self.description = description
+        self.directors = [] if directors is None else directors
+        self.genre = [] if genre is None else genre
+        self.subscription = [] if subscription is None else subscription
+        self.actors = [] if actors is None else actors
+        self.writers = [] if writers is None else writers
+
+    def to_source(self) -> dict:
+        """Get document _source, nested lists are shared with document, not copied.
+
+        Returns:
+            dict: document fields
+        """
+        return {
+            'uuid': self.uuid,
+            'imdb_rating': self.imdb_rating,
+            'title': self.title,
+            'description': self.description,
+            'directors': self.directors,
+            'genre': self.genre,
+            'subscription': self.subscription,
+            'actors': self.actors,
+            'writers': self.writers,
+        }
 
 
-@dataclass
 class GenreDoc(BaseDoc):
     """Class of elasticsearch genre index documet."""
 
+    __slots__ = ('name', 'description')
     index_name: ClassVar[str] = IndexsEnum.genres.value
-    name: str
-    description: str
+
+    def __init__(self, uuid: str, name: str, description: str) -> None:
+        """Init genre document.
+
+        Args:
+            uuid: str genre id
+            name: str genre name
+            description: str genre description
+        """
+        super().__init__(uuid)
+        self.name = name
+        self.description = description
+
+    def to_source(self) -> dict:
+        """Get document _source.
+
+        Returns:
+            dict: document fields
+        """
+        return {'uuid': self.uuid, 'name': self.name, 'description': self.description}
 
 
-@dataclass
 class PersonDoc(BaseDoc):
     """Class of elasticsearch person index documet."""
 
+    __slots__ = ('full_name', 'role', 'film_ids', 'films')
+    index_name: ClassVar[str] = IndexsEnum.persons.value
+
+    def __init__(  # noqa: WPS211 one argument per document field
+        self,
+        uuid: str,
+        full_name: str,
+        role: str,
+        film_ids: Optional[list[str]] = None,
+        films: Optional[list[dict]] = None,
+    ) -> None:
+        """Init person document, missing film lists start empty.
+
+        Args:
+            uuid: str person id
+            full_name: str person name
+            role: str role of person in the first film
+            film_ids: Optional[list[str]] ids of person films
+            films: Optional[list[dict]] person films with roles
+        """
+        super().__init__(uuid)
+        self.full_name = full_name
+        self.role = role
+        self.film_ids = [] if film_ids is None else film_ids
+        self.films = [] if films is None else films
+
+    def to_source(self) -> dict:
+        """Get document _source, film lists are shared with document, not copied.
+
+        Returns:
+            dict: document fields
+        """
+        return {
+            'uuid': self.uuid,
+            'full_name': self.full_name,
+            'role': self.role,
+            'film_ids': self.film_ids,
+            'films': self.films,
+        }
+
+
+class PersonFilmsUpdate(BaseDoc):
+    """Partial update of person document with roles in changed films, person is created if it is missing."""
+
+    __slots__ = ('full_name', 'films')
+    index_name: ClassVar[str] = IndexsEnum.persons.value
+    op_type: ClassVar[str] = 'update'
+
+    def __init__(self, uuid: str, full_name: str, films: list[dict]) -> None:
+        """Init person update.
+
+        Args:
+            uuid: str person id
+            full_name: str person name used if person is created
+            films: list[dict] changed films with person roles
+        """
+        super().__init__(uuid)
+        self.full_name = full_name
+        self.films = films
+
+    def to_source(self) -> dict:
+        """Get update request body.
+
+        Returns:
+            dict: script and upsert document
+        """
+        return {
+            'script': {'source': PAINLESS_SET_PERSON_FILMS, 'lang': 'painless', 'params': {'films': self.films}},
+            'upsert': PersonDoc(
+                uuid=self.uuid,
+                full_name=self.full_name,
+                role=self.films[0]['roles'][0] if self.films[0]['roles'] else None,
+                film_ids=[film['film_id'] for film in self.films],
+                films=self.films,
+            ).to_source(),
+        }
+
+
+class FilmPersonsUnlink(BaseDoc):
+    """Update by query removing changed films from persons not linked to them any more."""
+
+    __slots__ = ('links',)
     index_name: ClassVar[str] = IndexsEnum.persons.value
-    full_name: str
-    role: str
-    film_ids: list[str] = field(default_factory=list)
+    op_type: ClassVar[str] = 'update_by_query'
+
+    def __init__(self, uuid: str, links: dict[str, list[str]]) -> None:
+        """Init unlink.
+
+        Args:
+            uuid: str key of update in batch
+            links: dict[str, list[str]] ids of persons still linked by changed film id
+        """
+        super().__init__(uuid)
+        self.links = links
+
+    def to_source(self) -> dict:
+        """Get update by query request body.
+
+        Returns:
+            dict: query and script
+        """
+        return {
+            'query': {'terms': {'film_ids': list(self.links)}},
+            'script': {'source': PAINLESS_UNLINK_PERSON_FILMS, 'lang': 'painless', 'params': {'links': self.links}},
+        }
+
+
+class DeleteDoc(BaseDoc):
+    """Deletion of document from index."""
+
+    __slots__ = ('index',)
+    op_type: ClassVar[str] = 'delete'
 
+    def __init__(self, uuid: str, index: str) -> None:
+        """Init deletion.
 
-def transform_movies(bacth: list) -> dict[str, BaseDoc]:
+        Args:
+            uuid: str id of deleted document
+            index: str index of deleted document
+        """
+        super().__init__(uuid)
+        self.index = index
+
+    @property
+    def index_name(self) -> str:
+        """Get index of deleted document, it depends on deleted table.
+
+        Returns:
+            str: index name
+        """
+        return self.index
+
+
+def transform_movies(bacth: Iterable) -> dict[str, BaseDoc]:
     """Transform list for rows to dictionary of elasticsearch prepared documents for index movies.
 
+    Rows are consumed one by one, so streamed result is never kept in memory as a whole.
+    Nested items already added to document are tracked in per document set of (field, uuid).
+
     Args:
-        bacth: list rows
+        bacth: Iterable rows list or rows generator
 
     Returns:
         dict: prepared documents.
     """
     all_objects = {}
+    seen = {}
     for row in bacth:
         doc_id = row['fw_id']
         if doc_id not in all_objects:
@@ -63,18 +294,56 @@ def transform_movies(bacth: list) -> dict[str, BaseDoc]:
                 title=row['title'],
                 description=row['description'],
             )
+            seen[doc_id] = set()
         doc = all_objects[doc_id]
-        genre_item ={'uuid': row['genre_id'], 'name': row['genre_name']} 
-        subscription_item ={'uuid': row['subscription_id'], 'name': row['subscription_name']} 
-        if genre_item not in doc.genre and genre_item['uuid']:
-            doc.genre.append(genre_item)
-        if subscription_item not in doc.subscription and subscription_item['uuid']:
-            doc.subscription.append(subscription_item)
-        add_roles(doc, row['role'], row['id'], row['full_name'])
+        add_nested(doc, 'genre', row['genre_id'], row['genre_name'], seen[doc_id])
+        add_nested(doc, 'subscription', row['subscription_id'], row['subscription_name'], seen[doc_id])
+        add_roles(doc, row['role'], row['id'], row['full_name'], seen[doc_id])
     return all_objects
 
 
-def add_roles(doc: Doc, role: str, role_id: str, full_name: str) -> None:
+def transform_movies_json(bacth: Iterable) -> dict[str, BaseDoc]:
+    """Transform rows with documents aggregated by database to elasticsearch prepared documents for index movies.
+
+    Args:
+        bacth: Iterable rows list or rows generator, one row per film
+
+    Returns:
+        dict: prepared documents.
+    """
+    all_objects = {}
+    for row in bacth:
+        all_objects[row['fw_id']] = Doc(
+            uuid=row['fw_id'],
+            imdb_rating=row['rating'],
+            title=row['title'],
+            description=row['description'],
+            directors=row['directors'],
+            genre=row['genre'],
+            subscription=row['subscription'],
+            actors=row['actors'],
+            writers=row['writers'],
+        )
+    return all_objects
+
+
+def add_nested(doc: Doc, field_name: str, item_id: Optional[str], name: str, doc_seen: set) -> None:
+    """Add nested item to list field of document once.
+
+    Args:
+        doc: Doc document to add item to
+        field_name: str list field of document
+        item_id: Optional[str] item UUID, nothing is added if it is missing
+        name: str item name
+        doc_seen: set (field, uuid) of nested items already added to document
+    """
+    nested_field = getattr(doc, field_name, None)
+    if nested_field is not None and item_id and (field_name, item_id) not in doc_seen:
+        doc_seen.add((field_name, item_id))
+        nested_field.append({'uuid': item_id, 'name': name})
+
+
+def add_roles(doc: Doc, role: str, role_id: str, full_name: str, doc_seen: set) -> None:
     """Add roles details to documet.
 
     Args:
@@ -82,21 +351,17 @@ def add_roles(doc: Doc, role: str, role_id: str, full_name: str) -> None:
         role: str role
         role_id: str role id UUID
         full_name: str full name
+        doc_seen: set (field, uuid) of nested items already added to document
     """
-    if not role:
-        return
-    nested_field = getattr(doc, "{0}s".format(role), None)
-    if nested_field is not None:
-        new_value = {"uuid": role_id, "name": full_name}
-        if new_value not in nested_field:
-            nested_field.append(new_value)
+    if role:
+        add_nested(doc, "{0}s".format(role), role_id, full_name, doc_seen)
 
 
-def transform_genre(batch: list) -> dict[str, BaseDoc]:
+def transform_genre(batch: Iterable) -> dict[str, BaseDoc]:
     """Transform list for rows to dictionary of elasticsearch prepared documents for index genre.
 
     Args:
-        batch: list rows
+        batch: Iterable rows list or rows generator
 
     Returns:
         dict: prepared documents.
@@ -107,17 +372,19 @@ def transform_genre(batch: list) -> dict[str, BaseDoc]:
     return all_objects
 
 
-# TODO подумать как быть с тем, что один и тот же персон может быть в разных ролях, тогда индекс надо делать состовной для документа
-def transform_person(batch: list) -> dict[str, BaseDoc]:
-    """Transform list for rows to dictionary of elasticsearch prepared documents for index genre.
+def transform_person(batch: Iterable) -> dict[str, BaseDoc]:
+    """Transform list for rows to dictionary of elasticsearch prepared documents for index persons.
+
+    Every film of person comes with all roles person has in it.
 
     Args:
-        batch: list rows
+        batch: Iterable rows list or rows generator
 
     Returns:
         dict: prepared documents.
     """
     all_objects = {}
+    films = {}
     for row in batch:
         doc_id = row["id"]
         if doc_id not in all_objects:
@@ -126,9 +393,130 @@ def transform_person(batch: list) -> dict[str, BaseDoc]:
                 full_name=row["full_name"],
                 role=row["role"],
             )
-        doc = all_objects[doc_id]
-        if row['film_work_id'] not in doc.film_ids:
-            doc.film_ids.append(row['film_work_id'])
+            films[doc_id] = {}
+        if row['film_work_id'] is not None:
+            add_person_role(all_objects[doc_id], films[doc_id], row['film_work_id'], row['role'])
+    return all_objects
+
+
+def add_person_role(doc: PersonDoc, doc_films: dict[str, dict], film_id: str, role: str) -> None:
+    """Add film to person document once and role to the film once.
+
+    Args:
+        doc: PersonDoc document to add film to
+        doc_films: dict[str, dict] films already added to document by film id
+        film_id: str film UUID
+        role: str role of person in the film
+    """
+    film = doc_films.get(film_id)
+    if film is None:
+        film = {'film_id': film_id, 'roles': []}
+        doc_films[film_id] = film
+        doc.film_ids.append(film_id)
+        doc.films.append(film)
+    if role not in film['roles']:
+        film['roles'].append(role)
+
+
+def transform_person_films(batch: Iterable) -> dict[str, BaseDoc]:
+    """Transform persons of changed films to partial updates of persons index.
+
+    Persons linked to films get their roles in these films, films are removed from all other persons.
+
+    Args:
+        batch: Iterable rows list or rows generator, one row per film and person
+
+    Returns:
+        dict: updates by key unique for person and set of films.
+    """
+    links, persons = collect_person_films(batch)
+    if not links:
+        return {}
+    films_key = hash_films(links)
+    all_objects = {'{0}:{1}'.format(doc.uuid, films_key): doc for doc in persons.values()}
+    all_objects.update(unlink_films(links))
+    return all_objects
+
+
+def collect_person_films(batch: Iterable) -> tuple[dict, dict]:
+    """Group persons of changed films by film and films with roles by person.
+
+    Args:
+        batch: Iterable rows list or rows generator, one row per film and person
+
+    Returns:
+        tuple[dict, dict]: person ids by film id and PersonFilmsUpdate by person id
+    """
+    links = {}
+    persons = {}
+    for row in batch:
+        person_ids = links.setdefault(row['film_work_id'], [])
+        person_id = row['id']
+        if person_id is None:
+            continue
+        person_ids.append(person_id)
+        if person_id not in persons:
+            persons[person_id] = PersonFilmsUpdate(uuid=person_id, full_name=row['full_name'], films=[])
+        persons[person_id].films.append({'film_id': row['film_work_id'], 'roles': list(row['roles'])})
+    return links, persons
+
+
+def hash_films(film_ids: Iterable[str]) -> str:
+    """Get key of set of films, the same for any order of films.
+
+    Args:
+        film_ids: Iterable[str] film ids
+
+    Returns:
+        str: md5 of sorted film ids
+    """
+    return hashlib.md5(','.join(sorted(film_ids)).encode()).hexdigest()
+
+
+def unlink_films(links: dict[str, list[str]]) -> dict[str, BaseDoc]:
+    """Make update removing films from persons not linked to them any more.
+
+    Args:
+        links: dict[str, list[str]] ids of persons still linked by film id
+
+    Returns:
+        dict: update by query by its key.
+    """
+    unlink_key = 'unlink:{0}'.format(hash_films(links))
+    return {unlink_key: FilmPersonsUnlink(uuid=unlink_key, links=links)}
+
+
+# indexes of documents built from rows of tracked tables
+tombstone_indexes = {
+    'film_work': IndexsEnum.movies.value,
+    'person': IndexsEnum.persons.value,
+    'genre': IndexsEnum.genres.value,
+}
+
+
+def transform_tombstones(batch: Iterable) -> dict[str, BaseDoc]:
+    """Transform deleted rows to deletions of their documents.
+
+    Deleted films are also removed from persons they were linked to.
+
+    Args:
+        batch: Iterable rows of deleted objects log
+
+    Returns:
+        dict: deletions by index and document id.
+    """
+    all_objects = {}
+    links = {}
+    for row in batch:
+        index = tombstone_indexes.get(row['table_name'])
+        if index is None or row['restored']:
+            continue
+        object_id = str(row['object_id'])
+        all_objects['{0}:{1}'.format(index, object_id)] = DeleteDoc(uuid=object_id, index=index)
+        if row['table_name'] == 'film_work':
+            links[object_id] = []
+    if links:
+        all_objects.update(unlink_films(links))
     return all_objects
 
 
@@ -136,17 +524,19 @@ handlers = {
     IndexsEnum.movies.value: transform_movies,
     IndexsEnum.genres.value: transform_genre,
     IndexsEnum.persons.value: transform_person,
+    "{0}_films".format(IndexsEnum.persons.value): transform_person_films,
+    "tombstones": transform_tombstones,
+    "{0}_json".format(IndexsEnum.movies.value): transform_movies_json,
 }
 
 
-def transform_lists_to_dc(bacth: tuple[str, list]) -> dict[str, BaseDoc]:
+def transform_lists_to_dc(bacth) -> dict[str, BaseDoc]:
     """Transform data from database output to elistic prepared format.
 
     Args:
-        bacth: tuple[str, list] input from database producer.
+        bacth: Batch input from database producer.
 
     Returns:
         dict[str, BaseDoc] return elasticsearch preapred dict of documents,
     """
-    index, index_data = bacth
-    return handlers[index](index_data)
+    return handlers[bacth.transform or bacth.index_name](bacth.rows)